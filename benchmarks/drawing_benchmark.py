@@ -0,0 +1,244 @@
+'''
+    File name: drawing_benchmark.py
+    End-to-end drawing throughput: Drawing_processor.extract_ploylines + draw
+    against the simulated arm of src/dexarm_sim.py (POSIX only).
+
+    Run from the repository root:
+        python -m benchmarks.drawing_benchmark --sizes 10000 100000 --output bench.json
+
+    Each case is written as one JSON object per line, see run_case for the fields.
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.dexarm_sim import Dexarm_simulator
+from src.gcode_optimizer import Gcode_optimizer
+from src.josn_interface import Drawing_processor
+from src.pydexarm import Dexarm
+
+
+##########################################################################################
+###### Instrumented arm
+##########################################################################################
+class Timed_dexarm(Dexarm):
+   """
+   Dexarm that accounts the time the host spends blocked on "ok" replies
+   """
+   def __init__(self, port, optimizer=None):
+      super().__init__(port, verbose=False, optimizer=optimizer)
+      self.ok_wait_time = 0.
+      self.round_trips = 0
+      self.commands = 0
+
+   def _submit_line(self, data):
+      # a full window blocks until the oldest command is acknowledged
+      blocked = len(self._tickets) >= self.stream_window
+      start = time.perf_counter()
+      ticket = super()._submit_line(data)
+      if blocked:
+         self.ok_wait_time += time.perf_counter() - start
+         self.round_trips += 1
+      self.commands += 1
+      return ticket
+
+   def _wait(self, ticket):
+      if ticket.done():
+         return ticket.result()
+      start = time.perf_counter()
+      result = super()._wait(ticket)
+      self.ok_wait_time += time.perf_counter() - start
+      self.round_trips += 1
+      return result
+
+
+##########################################################################################
+###### Drawings
+##########################################################################################
+def synthetic_canvas(n_points, points_per_stroke=50, seed=0):
+   """
+   Freehand-like strokes, as the canvas records them, spread over the drawable area
+
+   Args:
+      n_points (int): total number of targets
+      points_per_stroke (int): targets in each stroke
+      seed (int): seed of the random generator
+   returns:
+      drawing_dic (dict): a drawing in the JSON schema
+   """
+   rng = np.random.default_rng(seed)
+   n_strokes = max(1, n_points//points_per_stroke)
+   strokes = []
+   for _ in range(n_strokes):
+      start = rng.uniform([0, 250], [160, 390])
+      steps = rng.normal(0, 1.5, size=(points_per_stroke, 2)).cumsum(axis=0)
+      xy = np.clip(start + steps, [0, 250], [160, 390])
+      strokes.append([{"x": float(x), "y": float(y), "a": 0, "p": 0.0} for x, y in xy])
+   return {"drawing": {"strokes": strokes}}
+
+
+def default_cases(sizes):
+   """
+   The standard set: every drawing in ./data, synthetic canvases of the given sizes,
+   and slider-mode runs of the first data file and the smallest canvas.
+   Synthetic drawings are only generated when their case is reached.
+
+   yields:
+      (name, path or drawing_dic, slider)
+   """
+   data_files = sorted(glob.glob("./data/*.json"))
+   for path in data_files:
+      yield os.path.basename(path), path, False
+   for size in sizes:
+      yield "canvas_{}".format(size), synthetic_canvas(size), False
+   if data_files:
+      yield os.path.basename(data_files[0]) + "_slider", data_files[0], True
+   if sizes:
+      yield "canvas_{}_slider".format(min(sizes)), synthetic_canvas(min(sizes)), True
+
+
+##########################################################################################
+###### Running
+##########################################################################################
+def run_case(name, path, slider, stream_window, sim_options, precision=None, continuous=False, prepare=False):
+   """
+   Parse and draw one JSON drawing file on a fresh simulator,
+   through a Gcode_optimizer if a coordinate precision is given, in continuous-path mode if asked,
+   and with the preprocessing stages of Drawing_processor.prepare if prepare is True
+
+   returns:
+      dict with:
+         parse_time, draw_time, wall_time: seconds spent in extract_ploylines and prepare, draw, and both
+         strokes, points: size of the drawing
+         commands, commands_per_s: command lines sent, and their rate over draw_time
+         bytes_out, bytes_in: bytes sent to and received from the arm
+         round_trips: times the host blocked on an "ok"
+         ok_wait_time: seconds the host blocked on "ok" replies
+         motion_time: estimated seconds of motion and dwell on the arm
+         io_overhead: draw_time not covered by (scaled) motion time
+   """
+   dp = Drawing_processor(base_z=-50, safe_z_val=-25, slider=slider, stream_window=stream_window,
+                          continuous=continuous)
+   dp.optimize_order = prepare
+   dp.simplify_tolerance = 0.25 if prepare else None
+   dp.merge_tolerance = 0.5 if prepare else None
+
+   # Dexarm and draw() report every step on stdout
+   with Dexarm_simulator(**sim_options) as sim, open(os.devnull, "w") as devnull:
+      with contextlib.redirect_stdout(devnull):
+         optimizer = Gcode_optimizer(precision) if precision is not None else None
+         arm = Timed_dexarm(sim.port, optimizer=optimizer)
+         sim.reset_stats()
+         start = time.perf_counter()
+         polyLines = dp.prepare(dp.extract_ploylines(json_path=path))
+         parsed = time.perf_counter()
+         dp.draw(arm, polyLines)
+         arm.flush()
+         done = time.perf_counter()
+         arm.close()
+      stats = dict(sim.stats)
+
+   draw_time = done - parsed
+   scaled_motion = stats["motion_time"]*sim_options.get("time_scale", 0.)
+   return {"case": name,
+           "slider": slider,
+           "stream_window": stream_window,
+           "precision": precision,
+           "continuous": continuous,
+           "prepare": prepare,
+           "reports": dp.reports,
+           "strokes": len(polyLines),
+           "points": int(sum(len(pl) for pl in polyLines)),
+           "parse_time": parsed - start,
+           "draw_time": draw_time,
+           "wall_time": done - start,
+           "commands": arm.commands,
+           "commands_per_s": arm.commands/draw_time if draw_time > 0 else None,
+           "bytes_out": stats["bytes_in"],
+           "bytes_in": stats["bytes_out"],
+           "round_trips": arm.round_trips,
+           "ok_wait_time": arm.ok_wait_time,
+           "motion_time": stats["motion_time"],
+           "io_overhead": max(0., draw_time - scaled_motion),
+           }
+
+
+def environment():
+   """
+   Where the numbers come from, to compare runs across releases
+   """
+   try:
+      revision = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                         stderr=subprocess.DEVNULL).decode().strip()
+   except (OSError, subprocess.CalledProcessError):
+      revision = None
+   return {"revision": revision,
+           "python": platform.python_version(),
+           "numpy": np.__version__,
+           "machine": platform.machine(),
+           "timestamp": time.time()}
+
+
+##########################################################################################
+###### Main
+##########################################################################################
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(prog='drawing_benchmark',
+                                    description="End-to-end drawing throughput against a simulated DexArm")
+   parser.add_argument('--sizes', nargs='*', type=int, default=[10000, 100000, 1000000],
+                        help="points of the synthetic canvases (int)")
+   parser.add_argument('--windows', nargs='*', type=int, default=[1, Dexarm.planner_buffer_size],
+                        help="stream windows to compare (int)")
+   parser.add_argument('--precision', nargs='*', type=int, default=[],
+                        help="also run through Gcode_optimizer with these coordinate precisions (int)")
+   parser.add_argument('--continuous', action='store_true',
+                        help="also run every case in continuous-path mode")
+   parser.add_argument('--prepare', action='store_true',
+                        help="run the preprocessing stages (merging, simplification, stroke ordering) before drawing")
+   parser.add_argument('--queue-depth', default=4, type=int,
+                        help="planner blocks of the simulated arm (int)")
+   parser.add_argument('--latency', default=0.0005, type=float,
+                        help="seconds the simulated arm spends on each line (float)")
+   parser.add_argument('--time-scale', default=0., type=float,
+                        help="multiplier of real motion time, 0 for instant (float)")
+   parser.add_argument('--output', default=None, type=str,
+                        help="file to append the JSON lines to, stdout by default (str)")
+   args = parser.parse_args()
+
+   sim_options = {"queue_depth": args.queue_depth,
+                  "line_latency": args.latency,
+                  "time_scale": args.time_scale}
+   env = environment()
+   out = open(args.output, "a") if args.output else sys.stdout
+
+   with tempfile.TemporaryDirectory() as work_dir:
+      for name, drawing, slider in default_cases(args.sizes):
+         if isinstance(drawing, dict):
+            path = os.path.join(work_dir, name + ".json")
+            with open(path, "w") as outfile:
+               json.dump(drawing, outfile)
+         else:
+            path = drawing
+         for window in args.windows:
+            for precision in [None] + args.precision:
+               for continuous in [False, True] if args.continuous else [False]:
+                  result = run_case(name, path, slider, window, sim_options, precision, continuous, args.prepare)
+                  result.update(env)
+                  result["simulator"] = sim_options
+                  out.write(json.dumps(result) + "\n")
+                  out.flush()
+
+   if out is not sys.stdout:
+      out.close()
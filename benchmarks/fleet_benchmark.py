@@ -0,0 +1,128 @@
+'''
+    File name: fleet_benchmark.py
+    One drawing on fleets of 1, 2, 4... simulated arms (src/dexarm_sim.py, POSIX only),
+    running in scaled real time, to see the drawing time shrink with the number of arms.
+
+    Run from the repository root:
+        python -m benchmarks.fleet_benchmark --arms 1 2 4 --output fleet.json
+
+    Each fleet size is written as one JSON object per line, see run_fleet for the fields.
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from benchmarks.drawing_benchmark import environment, synthetic_canvas
+from src.dexarm_sim import Dexarm_simulator
+from src.fleet import Fleet
+from src.gcode_optimizer import Gcode_optimizer
+from src.josn_interface import Drawing, Drawing_processor
+from src.pydexarm import Dexarm
+
+
+##########################################################################################
+###### Running
+##########################################################################################
+def sheet_drawing(n_points, width):
+   """
+   returns:
+      drawing (Drawing): synthetic canvases side by side across a sheet width mm wide
+   """
+   # a synthetic canvas is 160 mm wide
+   tiles = max(1, int(round(width/160.)))
+   drawings = []
+   for i in range(tiles):
+      strokes = synthetic_canvas(n_points//tiles, seed=i)["drawing"]["strokes"]
+      tile = Drawing.from_polylines([[[p["x"], p["y"], p["a"], p["p"]] for p in stroke] for stroke in strokes])
+      drawings.append(tile.translate(i*width/tiles, 0))
+   return Drawing.concat(drawings)
+
+
+def run_fleet(drawing, n_arms, width, keep_out, sim_options, window):
+   """
+   Draw drawing on n_arms simulated arms, standing evenly across the sheet
+
+   returns:
+      dict with:
+         wall_time, band_wall_time, seam_wall_time: seconds to draw, all of it and by phase
+         estimated_time, single_arm_time: the estimate of Fleet.plan, for the fleet and for one arm
+         motion_time: simulated seconds of motion and dwell of every arm
+         min_gap: least distance in mm between the bands of neighbouring arms, None for one arm
+         arms: the report of every arm, see Fleet.plan
+   """
+   dp = Drawing_processor(base_z=-50, safe_z_val=-25, continuous=True)
+   with contextlib.ExitStack() as stack, open(os.devnull, "w") as devnull:
+      sims = [stack.enter_context(Dexarm_simulator(**sim_options)) for _ in range(n_arms)]
+      with contextlib.redirect_stdout(devnull):
+         fleet = Fleet(dp, keep_out=keep_out, window=window)
+         for i, sim in enumerate(sims):
+            fleet.add(Dexarm(sim.port, verbose=False, optimizer=Gcode_optimizer(1)),
+                      offset=((i + 0.5)*width/n_arms, 0))
+         start = time.perf_counter()
+         report = fleet.draw(drawing)
+         wall_time = time.perf_counter() - start
+         for member in fleet.members:
+            member.arm.close()
+      motion_time = [sim.stats["motion_time"] for sim in sims]
+
+   extents = [arm["extent"] for arm in report["arms"] if arm["extent"] is not None]
+   gaps = [right[0] - left[1] for left, right in zip(extents[:-1], extents[1:])]
+   return {"arms_count": n_arms,
+           "keep_out": keep_out,
+           "wall_time": wall_time,
+           "band_wall_time": report["band_wall_time"],
+           "seam_wall_time": report["seam_wall_time"],
+           "estimated_time": report["estimated_time"],
+           "single_arm_time": report["single_arm_time"],
+           "motion_time": motion_time,
+           "min_gap": min(gaps) if gaps else None,
+           "cuts": report["cuts"],
+           "arms": report["arms"]}
+
+
+##########################################################################################
+###### Main
+##########################################################################################
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(prog='fleet_benchmark',
+                                    description="Drawing time against the number of simulated DexArms")
+   parser.add_argument('--arms', nargs='*', type=int, default=[1, 2, 4],
+                        help="fleet sizes to compare (int)")
+   parser.add_argument('--points', default=10000, type=int,
+                        help="targets of the synthetic drawing (int)")
+   parser.add_argument('--width', default=640., type=float,
+                        help="width of the sheet in mm (float)")
+   parser.add_argument('--keep-out', default=40., type=float,
+                        help="least distance between two pens in mm (float)")
+   parser.add_argument('--window', default=Dexarm.planner_buffer_size, type=int,
+                        help="commands in flight on every arm (int)")
+   parser.add_argument('--time-scale', default=0.01, type=float,
+                        help="multiplier of real motion time (float)")
+   parser.add_argument('--output', default=None, type=str,
+                        help="file to append the JSON lines to, stdout by default (str)")
+   args = parser.parse_args()
+
+   sim_options = {"queue_depth": 4, "line_latency": 0.0005, "time_scale": args.time_scale}
+   drawing = sheet_drawing(args.points, args.width)
+   env = environment()
+   out = open(args.output, "a") if args.output else sys.stdout
+
+   baseline = None
+   for n_arms in args.arms:
+      result = run_fleet(drawing, n_arms, args.width, args.keep_out, sim_options, args.window)
+      # against the first fleet size
+      baseline = baseline or result["wall_time"]
+      result["speedup"] = baseline/result["wall_time"]
+      result["simulator"] = sim_options
+      result.update(env)
+      out.write(json.dumps(result) + "\n")
+      out.flush()
+
+   if out is not sys.stdout:
+      out.close()
@@ -0,0 +1,149 @@
+'''
+    File name: stop_benchmark.py
+    Emergency stop latency: a drawing job streams to the simulated arm of src/dexarm_sim.py
+    in real time (POSIX only), and Dexarm.emergency_stop() is called at a random moment.
+
+    Run from the repository root:
+        python -m benchmarks.stop_benchmark --trials 20 --output stop.json
+
+    Each trial is written as one JSON object per line, see run_trial for the fields,
+    followed by a summary line per firmware mode.
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.drawing_benchmark import environment, synthetic_canvas
+from src.dexarm_sim import Dexarm_simulator
+from src.drawing_compiler import Drawing_compiler
+from src.gcode_optimizer import Gcode_optimizer
+from src.job_runner import Job_runner, FINISHED
+from src.josn_interface import Drawing_processor
+from src.pydexarm import Dexarm
+
+
+##########################################################################################
+###### Running
+##########################################################################################
+def compile_program(n_points=5000):
+   """
+   returns:
+      program (bytes): a compiled synthetic drawing, long enough to still be running when stopped
+   """
+   dp = Drawing_processor(base_z=-50, safe_z_val=-25, continuous=True)
+   compiler = Drawing_compiler(cache_dir=None)
+   with tempfile.TemporaryDirectory() as work_dir, open(os.devnull, "w") as devnull:
+      path = os.path.join(work_dir, "canvas.json")
+      with open(path, "w") as outfile:
+         json.dump(synthetic_canvas(n_points), outfile)
+      with contextlib.redirect_stdout(devnull):
+         return compiler.compile_file(dp, path)
+
+
+def run_trial(program, stop_after, window, emergency_parser, queue_depth=4, line_latency=0.0005):
+   """
+   Start drawing program, stop it after stop_after seconds
+
+   returns:
+      dict with, in milliseconds from the emergency_stop() call:
+         halt_latency: until the planner of the arm was emptied and the current move ended
+         abort_latency: until the drawing job ended, the commands in flight acknowledged
+         ack_latency: until M410 was acknowledged
+      and:
+         blocks_after_stop: blocks the arm started after the quick stop, 0 if nothing moved again
+         dropped: planned or arriving blocks dropped by the quick stop
+   """
+   with Dexarm_simulator(queue_depth=queue_depth, line_latency=line_latency, time_scale=1.,
+                         emergency_parser=emergency_parser) as sim, open(os.devnull, "w") as devnull:
+      with contextlib.redirect_stdout(devnull):
+         arm = Dexarm(sim.port, verbose=False, optimizer=Gcode_optimizer(1))
+         runner = Job_runner()
+         job_id = runner.submit(arm, program, window=window)
+         time.sleep(stop_after)
+
+         start = time.perf_counter()
+         ticket = arm.emergency_stop()
+         while runner.status(job_id)["state"] not in FINISHED:
+            time.sleep(0.0005)
+         aborted = time.perf_counter()
+         ticket.result(timeout=30)
+         acknowledged = time.perf_counter()
+         # anything the arm would still run shows up by now
+         time.sleep(sim.stop_hold + 0.2)
+
+         halted = sim.last_quick_stop
+         result = {"window": window,
+                   "emergency_parser": emergency_parser,
+                   "stop_after": stop_after,
+                   "state": runner.status(job_id)["state"],
+                   "commands_sent": runner.status(job_id)["commands_done"],
+                   "halt_latency": (halted - start)*1000. if halted is not None else None,
+                   "abort_latency": (aborted - start)*1000.,
+                   "ack_latency": (acknowledged - start)*1000.,
+                   "blocks_after_stop": sim.stats["blocks_run"] - sim.blocks_at_quick_stop,
+                   "dropped": sim.stats["dropped"]}
+         arm.close()
+   return result
+
+
+def summary(results):
+   """
+   Median and worst case of the latencies of a set of trials
+   """
+   row = {"trials": len(results)}
+   for key in ("halt_latency", "abort_latency", "ack_latency", "blocks_after_stop"):
+      values = [r[key] for r in results if r[key] is not None]
+      row[key + "_median"] = float(np.median(values)) if values else None
+      row[key + "_max"] = float(np.max(values)) if values else None
+   return row
+
+
+##########################################################################################
+###### Main
+##########################################################################################
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(prog='stop_benchmark',
+                                    description="Emergency stop latency against a simulated DexArm")
+   parser.add_argument('--trials', default=10, type=int,
+                        help="stops per firmware mode (int)")
+   parser.add_argument('--window', default=Dexarm.planner_buffer_size, type=int,
+                        help="commands in flight while drawing (int)")
+   parser.add_argument('--queue-depth', default=4, type=int,
+                        help="planner blocks of the simulated arm (int)")
+   parser.add_argument('--seed', default=0, type=int,
+                        help="seed of the stop times (int)")
+   parser.add_argument('--output', default=None, type=str,
+                        help="file to append the JSON lines to, stdout by default (str)")
+   args = parser.parse_args()
+
+   rng = np.random.default_rng(args.seed)
+   program = compile_program()
+   env = environment()
+   out = open(args.output, "a") if args.output else sys.stdout
+
+   # with and without Marlin's emergency parser, M410 in order is what a stock firmware does
+   for emergency_parser in (True, False):
+      results = []
+      for trial in range(args.trials):
+         result = run_trial(program, float(rng.uniform(0.3, 1.5)), args.window, emergency_parser, args.queue_depth)
+         result["trial"] = trial
+         results.append(result)
+         out.write(json.dumps(result) + "\n")
+         out.flush()
+      row = summary(results)
+      row.update({"summary": True, "emergency_parser": emergency_parser, "window": args.window})
+      row.update(env)
+      out.write(json.dumps(row) + "\n")
+      out.flush()
+
+   if out is not sys.stdout:
+      out.close()
@@ -15,7 +15,7 @@ import dash_html_components as html
 import plotly.express as px
 from dash_html_components.P import P
 from dash.dependencies import Input, Output, State
-#import plotly.graph_objs as go
+import plotly.graph_objs as go
 import dash_bootstrap_components as dbc
 from dash_bootstrap_components._components.CardBody import CardBody
 
@@ -30,9 +30,19 @@ import io
 import os
 import json
 import argparse
+import flask
 
 from src.pydexarm import Dexarm
+from src.discovery import discover
+from src.arm_session import save_session, resume_session, forget_session
+from src.arm_metrics import Command_metrics
+from src.tracing import tracer
+from src.gcode_optimizer import Gcode_optimizer
+from src.drawing_compiler import Drawing_compiler
 from src.josn_interface import Drawing_processor
+from src.canvas_log import Canvas_log
+from src.preview import preview_traces
+from src.job_runner import Job_runner, FINISHED
 
 ######################################################################
 ### Arguments
@@ -44,18 +54,26 @@ parser.add_argument('-mode',
                         default= "debug",
                         nargs='?',
                         type=str)
+parser.add_argument('-trace',
+                        help="Write a trace of every drawing to ./data/trace.json, see src/tracing.py",
+                        action='store_true')
 
 args = parser.parse_args()
 mode_selection = args.mode
+if args.trace:
+    tracer.enable()
 
 ##########################################################################################
 ###### Global Variables
 ##########################################################################################
-port = "COM3"
+# None finds the robot when connecting, see src/discovery.py
+port = None
 mac_port = "/dev/tty.usbmodem3063335534381"
 
 arm = None
 json_drawing_data = None
+# the drawing shown on the Loading tab, kept to redraw the preview when it is zoomed
+preview_drawing = None
 
 #######################
 ## Default variables
@@ -73,8 +91,45 @@ z_clear_height = -25
 pressure_factor = 5
 
 default_JSON_file_Path = "./data/path_data.json"
+# Chrome trace of the last drawing, with -trace
+trace_file_Path = "./data/trace.json"
 
-dp = Drawing_processor(base_z = z_val, safe_z_val = z_clear_height, slider = False)
+# the area shown by the JSON preview before zooming, in mm
+preview_x_range = (0, 1000)
+preview_y_range = (0, 500)
+# characters of an uploaded file shown under the preview
+preview_text_length = 5000
+
+# decimals sent for coordinates, unchanged words and no-op moves are not sent
+coordinate_precision = 1
+
+# number of commands streamed to the arm ahead of its "ok" replies while drawing
+stream_window = Dexarm.planner_buffer_size
+
+# draw each polyline without stopping at every target
+continuous_path = True
+
+dp = Drawing_processor(base_z = z_val, safe_z_val = z_clear_height, slider = False, stream_window = stream_window,
+                        continuous = continuous_path)
+# draw the strokes in the order that minimizes the pen-up travel
+dp.optimize_order = True
+# freehand canvas strokes are simplified within this distance, in mm
+dp.simplify_tolerance = 0.25
+# strokes that start where another one ends, within this distance in mm, are drawn without lifting the pen
+dp.merge_tolerance = 0.5
+
+# strokes drawn on the canvas, written to the default JSON file as they change
+canvas = Canvas_log(default_JSON_file_Path, scale = scale, offset = (x_offset, y_offset))
+
+# latencies, bytes and queue depth of the serial link, kept across reconnections, served on /metrics
+arm_metrics = Command_metrics()
+
+# drawings run on a worker thread, the app polls their progress
+runner = Job_runner()
+current_job = None
+
+# compiled drawings are kept here, drawing the same job again skips all the preprocessing
+compiler = Drawing_compiler(cache_dir = "./data/program_cache", precision = coordinate_precision)
 
 ##########################################################################################
 ###### The app!
@@ -88,12 +143,26 @@ app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 def init_canvas():
     """
     Making the initial canvas
+    A blank layout with the coordinates of a 140*scale x 160*scale image (y pointing down),
+    so shapes drawn on it are in image pixels, without building or sending the image
     """
-    img = np.ones(shape=(140*scale,160*scale,3))*220.
-    fig = px.imshow(img, binary_string=True)
-    fig.update_layout(coloraxis_showscale=False)
-    fig.update_xaxes(showticklabels=False)
-    fig.update_yaxes(showticklabels=False)
+    width = 160*scale
+    height = 140*scale
+    fig = go.Figure()
+    fig.update_layout(plot_bgcolor="rgb(220, 220, 220)",
+                    margin=dict(t=60))
+    fig.update_xaxes(range=[-0.5, width - 0.5],
+                    showticklabels=False,
+                    showgrid=False,
+                    zeroline=False,
+                    constrain="domain")
+    fig.update_yaxes(range=[height - 0.5, -0.5],
+                    showticklabels=False,
+                    showgrid=False,
+                    zeroline=False,
+                    scaleanchor="x",
+                    scaleratio=1,
+                    constrain="domain")
     fig.update_layout(dragmode="drawopenpath",
                     newshape_line_color='black',
                     newshape_line_width = 3,
@@ -106,6 +175,8 @@ config = {"modeBarButtonsToAdd": [
                                 ]}
 
 fig = init_canvas()
+# serialized once, Clear Canvas sends it again as it is
+blank_canvas = fig.to_dict()
 
 ##########################################################################################
 ###### Cards
@@ -244,6 +315,7 @@ controls_card = dbc.Card([
                                                                     dbc.DropdownMenuItem(id='COM1', children="COM1"),
                                                                     dbc.DropdownMenuItem(id='COM3', children="COM3"),
                                                                     dbc.DropdownMenuItem(id='MAC', children="MAC"),
+                                                                    dbc.DropdownMenuItem(id='FIND', children="Find the robot"),
                                                                     ],
                                                             color="dark", 
                                                             className="mr-1"),
@@ -283,6 +355,17 @@ calibration_card = dbc.Card([
                                                                 step = .1),
                                                     html.P(id="pressure_factor_status", children= "Pressure: -5"),
 
+                                                    html.Hr(),
+                                                    dbc.Checklist(
+                                                                options=[
+                                                                    {"label": "Continuous path", "value": 1},
+                                                                ],
+                                                                value=[1] if continuous_path else [],
+                                                                id="continuous_toggle",
+                                                                switch=True,
+                                                            ),
+                                                    html.P("", id="continuous_toggle_status"),
+
                                                     html.Hr(),
                                                     dbc.Button(id='stop', 
                                                                 children= "STOP", 
@@ -305,6 +388,20 @@ control_cards_deck =  dbc.Card([
                                                             # dbc.Col([]),
                                                             ]),
                                                 html.P("", id='draw_now_status'),
+                                                dbc.Progress(id="job_progress", value=0, striped=True),
+                                                html.Br(),
+                                                dbc.Row([
+                                                    dbc.Col([dbc.Button(id='job_pause', 
+                                                                        children= "Pause", 
+                                                                        color="dark",
+                                                                        block=True, 
+                                                                        className="mr-1")]),
+                                                    dbc.Col([dbc.Button(id='job_cancel', 
+                                                                        children= "Cancel", 
+                                                                        block=True, 
+                                                                        className="mr-1")]),
+                                                    ]),
+                                                dcc.Interval(id="job_poll", interval=500, disabled=True),
                                             ]),
                                 ])
                                 
@@ -319,6 +416,33 @@ app.layout = dbc.Container([
                             html.Br(),
                             drawing_tabs,
                             ])
+
+##########################################################################################
+###### Metrics
+##########################################################################################
+@app.server.route("/metrics")
+def metrics_prometheus():
+    """
+    The serial link metrics for Prometheus, see Command_metrics.prometheus
+    """
+    return flask.Response(arm_metrics.prometheus({"port": port or ""}),
+                          mimetype="text/plain; version=0.0.4")
+
+@app.server.route("/metrics.json")
+def metrics_json():
+    """
+    The serial link metrics as JSON, see Command_metrics.snapshot
+    """
+    snapshot = arm_metrics.snapshot()
+    snapshot["port"] = port
+    return flask.jsonify(snapshot)
+
+@app.server.route("/trace.json")
+def trace_json():
+    """
+    The spans traced since the last drawing ended, with -trace, see src/tracing.py
+    """
+    return flask.jsonify(tracer.to_chrome())
                             
 ##########################################################################################
 ###### Callbacks
@@ -327,9 +451,20 @@ app.layout = dbc.Container([
                 Output('stop_status', 'children'),
                 Input('stop', 'n_clicks'),
                 prevent_initial_call=True)
-def clear_drawing_canvas(value):
-    arm._send_cmd("G4")
-    return "EMERGENCY STOP"
+def emergency_stop(value):
+    """
+    Stops the robot right away, see Dexarm.emergency_stop, the running drawing ends
+    """
+    if arm is None:
+        return "No robot is available"
+    ticket = arm.emergency_stop()
+    # the next connection homes the robot
+    forget_session()
+    try:
+        ticket.result(timeout = 5)
+    except Exception:
+        return "EMERGENCY STOP sent, the robot did not confirm it"
+    return "EMERGENCY STOP, home the robot before drawing again"
 
 @app.callback(
                 Output('graph_pic', 'figure'),
@@ -341,43 +476,63 @@ def clear_drawing_canvas(value):
     """
     global default_JSON_file_Path
     dp.reset_JSON_file(json_path = default_JSON_file_Path)
-    tmp_fig = init_canvas()
-    return tmp_fig
+    canvas.clear()
+    return blank_canvas
 
 
 @app.callback([
                 Output('json_upload_detail', 'children'),
                 Output('graph_json', 'style'),
                 Output('graph_json', 'figure')],
-                Input('json_upload', 'contents'),
+                [Input('json_upload', 'contents'),
+                Input('graph_json', 'relayoutData')],
                 State('json_upload', 'filename'),
                 State('json_upload', 'last_modified'),
                 prevent_initial_call=True)
-def json_file_upload(contents, file_names, dates):
+def json_file_upload(contents, relayout_data, file_names, dates):
     """
     Reads a JSON file from disk and saves it in the default path
     The goal is to keep that file over there for the Draw JSON 
     Function to read and draw it.
+    When the preview is zoomed, it is redrawn with the detail visible at that zoom.
     
     Args:
-    ontents, file_names, dates: inputs from the Dash UI
+    ontents, relayout_data, file_names, dates: inputs from the Dash UI
     """
     global arm, dp
     global default_JSON_file_Path
+
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if "graph_json.relayoutData" in triggered:
+        if preview_drawing is None or relayout_data is None:
+            return (dash.no_update, dash.no_update, dash.no_update)
+        x_range, y_range = view_ranges(relayout_data)
+        if x_range is None and y_range is None and not relayout_data.get("xaxis.autorange"):
+            # not a zoom, i.e., a shape was drawn
+            return (dash.no_update, dash.no_update, dash.no_update)
+        fig = quick_draw_graph(x_range=x_range, y_range=y_range, revision=dates)
+        return (dash.no_update, dash.no_update, fig)
+
     if contents is not None:
         msg = "{} is loaded".format(file_names)
         print (msg)
         try:
-            _, content_string = contents.split(',')
-            decoded = base64.b64decode(content_string)
-            data =decoded.decode('utf-8')
-            data = str(data)
+            with tracer.span("upload decode", file=file_names, characters=len(contents)):
+                _, content_string = contents.split(',')
+                decoded = base64.b64decode(content_string)
+                data =decoded.decode('utf-8')
+                data = str(data)
         except:
             print ("Couldn\'t read the JSON file")
 
-        dp.write_dic_to_json_file(data, default_JSON_file_Path)
+        with tracer.span("upload write"):
+            dp.write_dic_to_json_file(data, default_JSON_file_Path)
+        canvas.detach()
 
-        fig = quick_draw_graph(default_JSON_file_Path)
+        fig = quick_draw_graph(default_JSON_file_Path, revision=dates)
+        # only the start of a large file is shown
+        if len(data) > preview_text_length:
+            data = data[:preview_text_length] + "\n... ({} characters)".format(len(data))
         return (html.Div([html.Pre(data)]), {'visibility': 'visible'}, fig)
 
     return "No file is loaded yet"
@@ -386,9 +541,10 @@ def json_file_upload(contents, file_names, dates):
     Output("port_status", "children"),
     [Input("COM1", "n_clicks"),
     Input("COM3", "n_clicks"),
-    Input("MAC", "n_clicks")]
+    Input("MAC", "n_clicks"),
+    Input("FIND", "n_clicks")]
 )
-def set_com_port(c1, c3, c5):
+def set_com_port(c1, c3, c5, c6):
     """
     Sets the active port to connect to the robot
     For Ubuntu (Raspberry Pi, find the exact name of port i.e.: '/dev/ttyACM0')
@@ -397,12 +553,21 @@ def set_com_port(c1, c3, c5):
 
     ctx = dash.callback_context
     if not ctx.triggered:
-        return "Active port: {}".format(port)
+        return "Active port: {}".format(port or "found when connecting")
     else:
-        port = ctx.triggered[0]["prop_id"].split(".")[0] 
-        print (port)
-        if port == "MAC":
-            port = mac_port
+        choice = ctx.triggered[0]["prop_id"].split(".")[0] 
+        print (choice)
+        if choice == "FIND":
+            if arm is not None:
+                # the port of a connected robot is busy, it would not answer the probe
+                return "Disconnect the robot first"
+            port = None
+            arms = discover()
+            if len(arms) == 0:
+                return "No robot found"
+            port = arms[0]["port"]
+            return "Active port: {}, {} module, {} robot(s) found".format(port, arms[0]["module_type"], len(arms))
+        port = mac_port if choice == "MAC" else choice
         return "Active port: {}".format(port)
 
 ################################
@@ -423,18 +588,36 @@ def connect_robot(value):
     if value == 0:
         return "Nothing is clicked"
 
+    elif runner.busy():
+        return "The robot is busy with a drawing"
+
     else:
         print ("Contacting the robot for the {}th time!".format(value))
 
-        arm = Dexarm(port=port)
-        arm.go_home()
-        arm.set_module_type(0)
-        arm.move_to(x_default, y_default, z_clear_height+ 10)
-        arm.go_home()
-        x, y, z, e, a, b, c = arm.get_current_position()
+        if port is None:
+            arms = discover()
+            if len(arms) == 0:
+                return "No robot found, check the cable or pick a port"
+            port = arms[0]["port"]
+
+        arm = Dexarm(port=port, optimizer=Gcode_optimizer(precision=coordinate_precision), metrics=arm_metrics)
+        # a robot that is where the last session left it is not homed again
+        position, reason = resume_session(arm)
+        if reason is None:
+            status = "Robot connected on {}, session resumed".format(port)
+        else:
+            print ("Homing the robot: {}".format(reason))
+            arm.go_home()
+            arm.set_module_type(0)
+            arm.move_to(x_default, y_default, z_clear_height+ 10)
+            arm.go_home()
+            position = arm.get_current_position()
+            status = "Robot connected on {}".format(port)
+        save_session(arm)
+        x, y, z, e, a, b, c = position
         message = "x: {}, y: {}, z: {}, e: {}\na: {}, b: {}, c: {}".format(x, y, z, e, a, b, c)
 
-        data = html.Div([html.P("Robot connected on {}".format(port)),
+        data = html.Div([html.P(status),
                         html.Br(),
                         html.P(message)])
         return data
@@ -453,10 +636,14 @@ def disconnect_arm(value):
 
     if value == 0:
         return ""
+    elif runner.busy():
+        return "The robot is busy with a drawing, cancel it first"
     else:
         if arm is not None:
             if arm.ser.is_open:
-                arm.go_home()
+                # the session is saved instead of homing, the next connection checks it
+                arm.move_to(z = z_clear_height)
+                save_session(arm)
             arm.close()
             arm = None
             return "Disconnected"
@@ -485,6 +672,8 @@ def init_slider(slider_toggle_val):
         return "Slider not in use"
 
     if 2 in slider_toggle_val:
+        if runner.busy():
+            return "The robot is busy with a drawing"
         if arm is not None:
             print ("arm is not None")
             if arm.ser.is_open:
@@ -517,6 +706,9 @@ def adjust_z_val(value):
     global z_val, z_val_adjusted 
     global arm, dp
 
+    if runner.busy():
+        return "The robot is busy with a drawing"
+
     z_val_adjusted = z_val + value
 
     if dp.slider:
@@ -540,6 +732,9 @@ def adjust_pressure_factor(value):
     global pressure_factor 
     global arm, dp
 
+    if runner.busy():
+        return "The robot is busy with a drawing"
+
     pressure_factor = -value
     dp.pressure_factor = pressure_factor
     if dp.slider:
@@ -558,6 +753,22 @@ def adjust_pressure_factor(value):
 
     return "Pressure: {}".format (pressure_factor)
 
+@app.callback(
+    Output("continuous_toggle_status", "children"),
+    Input("continuous_toggle", "value"),
+    prevent_initial_call=True, 
+)
+def set_continuous_path(continuous_toggle_val):
+    """
+    Switches between drawing polylines continuously and stopping at every target
+    """
+    global dp
+
+    dp.continuous = 1 in continuous_toggle_val
+    if dp.continuous:
+        return "Continuous path"
+    return "Stopping at every target"
+
 @app.callback(
     Output('touch_paper_status', 'children'),
     Output('touch_paper', 'children'),
@@ -575,6 +786,9 @@ def adjust_marker(value):
     if value == 0:
         return "Marker not adjusted", dash.no_update
 
+    elif runner.busy():
+        return "The robot is busy with a drawing", dash.no_update
+
     elif arm:
         if value%2 == 1:
             # on odd clicks the robot touch the paper
@@ -598,54 +812,135 @@ def adjust_marker(value):
 ###### Drawing
 ##########################################################################################
 @app.callback(
-    Output('draw_now_status', 'children'),
+    [Output('draw_now_status', 'children'),
+    Output('job_progress', 'value'),
+    Output('job_progress', 'children'),
+    Output('job_pause', 'children'),
+    Output('job_poll', 'disabled')],
     [Input('draw_now_canvas', 'n_clicks'),
-    Input('draw_now_JSON', 'n_clicks')],
+    Input('draw_now_JSON', 'n_clicks'),
+    Input('job_pause', 'n_clicks'),
+    Input('job_cancel', 'n_clicks'),
+    Input('job_poll', 'n_intervals')],
     prevent_initial_call=True)
-def draw_now(value_graph, value_JSON):
+def draw_now(value_graph, value_JSON, value_pause, value_cancel, n_intervals):
     """
-    Reads the saved JSON file in the default path and draws it
+    Starts drawing the saved JSON file in the default path as a background job,
+    pauses, resumes or cancels it, and reports its progress while job_poll is enabled
     """
-    global arm, dp
+    global arm, dp, compiler, runner, current_job
     global default_JSON_file_Path
 
-    polyLines = dp.extract_ploylines(default_JSON_file_Path)
-    dp.draw(arm, polyLines)
-
-    return ("Drawing copmleted")
+    triggered = [t["prop_id"].split(".")[0] for t in dash.callback_context.triggered]
+
+    if "draw_now_canvas" in triggered or "draw_now_JSON" in triggered:
+        if arm is None:
+            return ("No robot is available", 0, "", "Pause", True)
+        if runner.busy():
+            return ("Already drawing", dash.no_update, dash.no_update, dash.no_update, False)
+        canvas.flush()
+        current_job = runner.submit(arm,
+                                    lambda: compiler.compile_file(dp, default_JSON_file_Path),
+                                    window=dp.stream_window,
+                                    name=default_JSON_file_Path,
+                                    on_cancel=lift_pen_and_home)
+        return ("Drawing started", 0, "", "Pause", False)
+
+    if current_job is None:
+        return ("No drawing", 0, "", "Pause", True)
+
+    if "job_pause" in triggered:
+        if runner.status(current_job)["state"] == "paused":
+            runner.resume(current_job)
+        else:
+            runner.pause(current_job)
+    elif "job_cancel" in triggered:
+        runner.cancel(current_job)
+
+    status = runner.status(current_job)
+    if status["state"] in ("done", "cancelled") and arm is not None and not runner.busy():
+        # the drawing ended at home
+        save_session(arm)
+    if status["state"] in FINISHED and tracer.events:
+        # from the upload to the end of the drawing, the next trace starts empty
+        tracer.write(trace_file_Path)
+        tracer.clear()
+    percent = round(100*status["progress"])
+    pause_label = "Resume" if status["state"] == "paused" else "Pause"
+    return (job_message(status), percent, "{}%".format(percent), pause_label, status["state"] in FINISHED)
+
+def job_message(status):
+    """
+    A line of text about a drawing job, see Job_runner.status
+    """
+    if status["state"] == "done":
+        if compiler.last_source != "compiled":
+            return ("Drawing copmleted, program reused from the {} cache".format(compiler.last_source))
+        if "order" in dp.reports:
+            return ("Drawing copmleted, {:.0f} mm of pen-up travel saved".format(dp.reports["order"]["travel_saved"]))
+        return ("Drawing copmleted")
+    if status["state"] == "failed":
+        return "Drawing failed: {}".format(status["error"])
+    if status["state"] in ("queued", "compiling", "cancelled", "stopped"):
+        return "Drawing {}".format(status["state"])
+
+    message = "Drawing {}: polyline {} of {}, command {} of {}".format(status["state"],
+                                                                    status["strokes_done"], status["strokes_total"],
+                                                                    status["commands_done"], status["commands_total"])
+    if status["eta"] is not None:
+        message += ", about {:.0f} s left".format(status["eta"])
+    return message
+
+def lift_pen_and_home(arm):
+    """
+    Runs after a drawing is cancelled
+    """
+    arm.move_to(z = dp.safe_z_val)
+    arm.go_home()
 
-def quick_draw_graph(json_path= None):
+def quick_draw_graph(json_path= None, x_range= None, y_range= None, revision= None):
     """
     Reads a JSON file from a given path and plots it in a graph object
+    The drawing is plotted as a few WebGL line traces, decimated to the detail visible in
+    x_range and y_range. Without a json_path, the last drawing is plotted again.
     """
-    global dp
+    global dp, preview_drawing
     global default_JSON_file_Path
 
-    if json_path is None:
-        json_path = default_JSON_file_Path
-
-    polyLines = dp.extract_ploylines(json_path=json_path)
-    
-    xs=[]
-    ys=[]
-    colors = []
+    if json_path is not None or preview_drawing is None:
+        if json_path is None:
+            json_path = default_JSON_file_Path
+        preview_drawing = dp.extract_ploylines(json_path=json_path)
 
-    for c, pl in enumerate(polyLines):
-        for target in pl:
-            xs.append(target[0])
-            ys.append(target[1])
-            colors.append(c)
+    if x_range is None and y_range is None:
+        x_range, y_range = preview_x_range, preview_y_range
 
-    fig = px.line(x=xs, y=ys, color=colors)
+    fig = go.Figure()
+    for xs, ys in preview_traces(preview_drawing, x_range, y_range):
+        fig.add_trace(go.Scattergl(x=xs, y=ys, mode="lines", showlegend=False, hoverinfo="skip"))
 
-    fig.update_xaxes(range=[0, 1000])
-    fig.update_yaxes(range=[0, 500], 
+    # a new drawing resets the zoom, the same drawing keeps it
+    fig.update_layout(uirevision=str(revision))
+    fig.update_xaxes(range=list(preview_x_range))
+    fig.update_yaxes(range=list(preview_y_range), 
                     scaleanchor = "x",
                     scaleratio = 1)
 
     return fig
 
-
+def view_ranges(relayout_data):
+    """
+    The visible x and y ranges of a zoomed graph, None for an axis that was not zoomed
+    """
+    ranges = []
+    for axis in ("xaxis", "yaxis"):
+        if axis + ".range[0]" in relayout_data:
+            ranges.append((relayout_data[axis + ".range[0]"], relayout_data[axis + ".range[1]"]))
+        elif axis + ".range" in relayout_data:
+            ranges.append(tuple(relayout_data[axis + ".range"]))
+        else:
+            ranges.append(None)
+    return ranges
 
 
 @app.callback(
@@ -654,52 +949,14 @@ def quick_draw_graph(json_path= None):
     prevent_initial_call=True,
 )
 def draw(relayout_data):
-    global arm
-    global z_val, z_val_adjusted, x_offset, y_offset
-    global default_JSON_file_Path
-    
-    wait_key = True
-    
-    drawing_dic = {"drawing": {"strokes":[]}}
-
-    drawing_dic["drawing"]["strokes"]
-
-    if "shapes" in relayout_data:
-        path_data = relayout_data["shapes"]
-        
-        if type(path_data) is 'list':
-            print (relayout_data["shapes"][0]['path'])
-        
-        else:
-            print ("Number of strokes:", len(path_data))
-            data =  relayout_data["shapes"]
-            # refer to https://plotly.com/python/reference/layout/shapes/#layout-shapes-items-shape-path
-            # and: https://developer.mozilla.org/en-US/docs/Web/SVG/Tutorial/Paths
-            # M: Move to
-            # L: line to gets X and Y and draws a line from here to there!   
- 
-            for i, d in enumerate(data):
-                tmp_path = []
-                # iterating over pathes
-                d_tmp = d['path']
-                d_tmp = re.split(r'[, M L Z]\s*', d_tmp)[1:]
-                d_tmp = [float(d) for d in d_tmp]
-
-                targets = np.array(d_tmp)
-                x = targets[::2]/scale + x_offset
-                y = targets[1::2]/scale + y_offset
-                
-                for i in range (x.shape[0]):
-                    x_loc = x[i]
-                    y_loc = y[i]
-                    tmp_target = {"x": x_loc, "y": y_loc, "a": 0, "p": 0.0}
-                    tmp_path.append(tmp_target)
-                drawing_dic["drawing"]["strokes"].append(tmp_path)
-            
-            json_data = json.dumps(drawing_dic, indent = 4)
-            dp.write_dic_to_json_file(json_data, default_JSON_file_Path)
-
+    """
+    Records the strokes added to or erased from the canvas, see Canvas_log
+    """
+    global canvas
 
+    added, erased = canvas.update(relayout_data)
+    if added or erased or "shapes" in relayout_data:
+        print ("Number of strokes: {} (+{}, -{})".format(len(canvas.strokes), added, erased))
         return "Data saved to JSON file"
     else:
         return "No shape to draw"
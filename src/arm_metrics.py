@@ -0,0 +1,254 @@
+'''
+    File name: arm_metrics.py
+    Where the time goes on the serial link of a Dexarm: send-to-"ok" latency per G/M code,
+    bytes per second, commands in flight, stalls and position queries.
+
+        metrics = Command_metrics()
+        arm = Dexarm(port, metrics=metrics)
+        ...
+        metrics.snapshot()      # dict, see snapshot
+        metrics.prometheus()    # text exposition format, for a /metrics endpoint
+
+    A Dexarm without metrics (the default) only checks that they are None.
+'''
+import re
+import threading
+import time
+
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., 30.)
+# a command not acknowledged within this many seconds counts as a stall
+STALL_THRESHOLD = 1.
+# seconds the byte rates are averaged over
+RATE_WINDOW = 10
+
+CODE_PATTERN = re.compile(r"\s*([GMTgmt]\d+)")
+
+
+def command_code(command):
+    """
+    Returns:
+        the G/M code of a command line, i.e., "G1" for "G1F2000X10", "other" if it has none
+    """
+    match = CODE_PATTERN.match(command)
+    return match.group(1).upper() if match is not None else "other"
+
+
+class Command_metrics:
+    """ Counters filled by Dexarm as commands are sent and acknowledged, safe to read from any thread
+    """
+
+    def __init__(self, stall_threshold=STALL_THRESHOLD, buckets=LATENCY_BUCKETS, rate_window=RATE_WINDOW):
+        """
+        Args:
+            stall_threshold (float): seconds from sending a command to its "ok" that count as a stall
+            buckets (tuple): upper bounds of the latency histogram buckets, increasing, in seconds
+            rate_window (int): seconds the byte rates are averaged over
+        """
+        self.stall_threshold = stall_threshold
+        self.buckets = tuple(buckets)
+        self.rate_window = int(rate_window)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Zero all counters
+        """
+        with self._lock:
+            self.started = time.time()
+            # code -> {"buckets": counts per bucket and one for larger, "sum", "count", "max"}
+            self.latency = {}
+            self.bytes_out = 0
+            self.bytes_in = 0
+            self.in_flight = 0
+            self.in_flight_max = 0
+            # in-flight commands summed over every send, for the mean depth
+            self._depth_sum = 0
+            self.commands = 0
+            # stalls that got their "ok" in the end, see snapshot for the ones still waiting
+            self.stalls = 0
+            # id of every command waiting for its "ok" -> when it was sent
+            self._unacknowledged = {}
+            # the second every slot of the rate window is counting, and its bytes out and in
+            self._rate_seconds = [None]*self.rate_window
+            self._rate_bytes = [[0, 0] for _ in range(self.rate_window)]
+
+    ########################################
+    ###### Called by Dexarm
+    ########################################
+    def sent(self, ticket, n_bytes, in_flight):
+        """
+        A command was written
+
+        Args:
+            ticket (Future): its ticket, with the command
+            n_bytes (int): bytes written
+            in_flight (int): commands waiting for their "ok", this one included
+        """
+        ticket.sent_at = time.perf_counter()
+        with self._lock:
+            self._unacknowledged[id(ticket)] = ticket.sent_at
+            self.bytes_out += n_bytes
+            self._count_rate(0, n_bytes)
+            self.commands += 1
+            self.in_flight = in_flight
+            self.in_flight_max = max(self.in_flight_max, in_flight)
+            self._depth_sum += in_flight
+
+    def received(self, n_bytes):
+        """
+        A line was read
+        """
+        with self._lock:
+            self.bytes_in += n_bytes
+            self._count_rate(1, n_bytes)
+
+    def acknowledged(self, ticket, in_flight):
+        """
+        The "ok" of a command arrived
+
+        Args:
+            ticket (Future): its ticket, see sent
+            in_flight (int): commands still waiting for their "ok"
+        """
+        sent_at = getattr(ticket, "sent_at", None)
+        if sent_at is None:
+            # sent before the metrics were set
+            return
+        latency = time.perf_counter() - sent_at
+        code = command_code(ticket.command)
+        with self._lock:
+            self._unacknowledged.pop(id(ticket), None)
+            self.in_flight = in_flight
+            histogram = self.latency.get(code)
+            if histogram is None:
+                histogram = {"buckets": [0]*(len(self.buckets) + 1), "sum": 0., "count": 0, "max": 0.}
+                self.latency[code] = histogram
+            i = 0
+            while i < len(self.buckets) and latency > self.buckets[i]:
+                i += 1
+            histogram["buckets"][i] += 1
+            histogram["sum"] += latency
+            histogram["count"] += 1
+            histogram["max"] = max(histogram["max"], latency)
+            if latency > self.stall_threshold:
+                self.stalls += 1
+
+    def abandoned(self, ticket):
+        """
+        A command will never get its "ok", i.e., the port was closed
+        """
+        with self._lock:
+            self._unacknowledged.pop(id(ticket), None)
+
+    def _count_rate(self, column, n_bytes):
+        second = int(time.monotonic())
+        slot = second % self.rate_window
+        if self._rate_seconds[slot] != second:
+            self._rate_seconds[slot] = second
+            self._rate_bytes[slot] = [0, 0]
+        self._rate_bytes[slot][column] += n_bytes
+
+    ########################################
+    ###### Reading
+    ########################################
+    def rates(self):
+        """
+        Returns:
+            bytes out and in per second, over the last rate_window seconds
+        """
+        now = int(time.monotonic())
+        out, received = 0, 0
+        with self._lock:
+            for second, (n_out, n_in) in zip(self._rate_seconds, self._rate_bytes):
+                if second is not None and now - second < self.rate_window:
+                    out += n_out
+                    received += n_in
+        return out/self.rate_window, received/self.rate_window
+
+    def snapshot(self):
+        """
+        Returns:
+            dict, ready for json.dumps, with:
+                latency: per code, count, mean, max and the histogram {upper bound: count}, in seconds
+                bytes_out, bytes_in: totals, and bytes_out_per_s, bytes_in_per_s over rate_window
+                in_flight, in_flight_max, in_flight_mean: commands waiting for their "ok"
+                commands, stalls, position_queries (M114): counts, stalls includes the
+                    stalled_in_flight commands still waiting for their "ok" after stall_threshold,
+                    and stalls_acknowledged the ones that got it, which only grows
+                oldest_in_flight: seconds the oldest command in flight has waited, 0 if none
+        """
+        bytes_out_per_s, bytes_in_per_s = self.rates()
+        now = time.perf_counter()
+        with self._lock:
+            waits = [now - sent_at for sent_at in self._unacknowledged.values()]
+            stalled_in_flight = sum(wait > self.stall_threshold for wait in waits)
+            latency = {}
+            for code, histogram in sorted(self.latency.items()):
+                bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+                latency[code] = {"count": histogram["count"],
+                                 "mean": histogram["sum"]/histogram["count"],
+                                 "max": histogram["max"],
+                                 "histogram": dict(zip(bounds, histogram["buckets"]))}
+            position_queries = self.latency["M114"]["count"] if "M114" in self.latency else 0
+            return {"started": self.started,
+                    "uptime": time.time() - self.started,
+                    "latency": latency,
+                    "bytes_out": self.bytes_out,
+                    "bytes_in": self.bytes_in,
+                    "bytes_out_per_s": bytes_out_per_s,
+                    "bytes_in_per_s": bytes_in_per_s,
+                    "in_flight": self.in_flight,
+                    "in_flight_max": self.in_flight_max,
+                    "in_flight_mean": self._depth_sum/self.commands if self.commands else 0.,
+                    "commands": self.commands,
+                    "stalls": self.stalls + stalled_in_flight,
+                    "stalls_acknowledged": self.stalls,
+                    "stalled_in_flight": stalled_in_flight,
+                    "oldest_in_flight": max(waits, default=0.),
+                    "stall_threshold": self.stall_threshold,
+                    "position_queries": position_queries}
+
+    def prometheus(self, labels=None):
+        """
+        The metrics in the Prometheus text exposition format
+
+        Args:
+            labels (dict): added to every sample, i.e., {"port": "/dev/ttyACM0"}
+        Returns:
+            text (string)
+        """
+        snapshot = self.snapshot()
+        base = ",".join('{}="{}"'.format(key, value) for key, value in sorted((labels or {}).items()))
+
+        def sample(name, value, **extra):
+            pairs = [base] if base else []
+            pairs += ['{}="{}"'.format(key, value) for key, value in extra.items()]
+            return "{}{{{}}} {}".format(name, ",".join(pairs), value) if pairs else "{} {}".format(name, value)
+
+        lines = ["# HELP dexarm_command_latency_seconds Time from sending a command to its \"ok\".",
+                 "# TYPE dexarm_command_latency_seconds histogram"]
+        for code, histogram in snapshot["latency"].items():
+            cumulative = 0
+            for bound, count in histogram["histogram"].items():
+                cumulative += count
+                lines.append(sample("dexarm_command_latency_seconds_bucket", cumulative, code=code, le=bound))
+            lines.append(sample("dexarm_command_latency_seconds_sum", histogram["mean"]*histogram["count"], code=code))
+            lines.append(sample("dexarm_command_latency_seconds_count", histogram["count"], code=code))
+
+        for name, kind, help_text, value in (
+                ("dexarm_bytes_sent_total", "counter", "Bytes written to the arm.", snapshot["bytes_out"]),
+                ("dexarm_bytes_received_total", "counter", "Bytes read from the arm.", snapshot["bytes_in"]),
+                ("dexarm_bytes_sent_per_second", "gauge", "Bytes written per second, over the rate window.", snapshot["bytes_out_per_s"]),
+                ("dexarm_bytes_received_per_second", "gauge", "Bytes read per second, over the rate window.", snapshot["bytes_in_per_s"]),
+                ("dexarm_commands_in_flight", "gauge", "Commands waiting for their \"ok\".", snapshot["in_flight"]),
+                ("dexarm_commands_in_flight_max", "gauge", "Most commands waiting for their \"ok\" at once.", snapshot["in_flight_max"]),
+                ("dexarm_commands_total", "counter", "Commands sent.", snapshot["commands"]),
+                ("dexarm_stalls_total", "counter", "Commands acknowledged after more than the stall threshold.", snapshot["stalls_acknowledged"]),
+                ("dexarm_commands_stalled", "gauge", "Commands in flight for more than the stall threshold.", snapshot["stalled_in_flight"]),
+                ("dexarm_oldest_command_in_flight_seconds", "gauge", "Time the oldest command in flight has waited for its \"ok\".", snapshot["oldest_in_flight"]),
+                ("dexarm_position_queries_total", "counter", "M114 queries.", snapshot["position_queries"])):
+            lines += ["# HELP {} {}".format(name, help_text), "# TYPE {} {}".format(name, kind), sample(name, value)]
+        return "\n".join(lines) + "\n"
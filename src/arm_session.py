@@ -0,0 +1,105 @@
+'''
+    File name: arm_session.py
+    Keeps what is known about a connected arm in a file, so connecting to it again, i.e., after
+    the app restarted or the cable came loose, does not have to home it.
+
+        arm = Dexarm(port)
+        reported, reason = resume_session(arm)
+        if reason is not None:
+            arm.go_home()       # the saved session does not match the arm
+        ...
+        save_session(arm)       # whenever the arm is at rest, and before closing it
+
+    An arm that was moved by hand reports another position than the saved one, and is homed again.
+    The firmware gives no power-cycle signal, so a power cycle is only detected by the position
+    it boots at differing from the saved one. The boot position is not documented (Dexarm_simulator
+    assumes 0, 0, 0): an arm that boots reporting the saved position is resumed without homing.
+'''
+import json
+import os
+import time
+
+
+SESSION_PATH = "./data/arm_session.json"
+# millimetres the reported position may differ from the saved one
+POSITION_TOLERANCE = 0.5
+
+
+def save_session(arm, path=SESSION_PATH):
+    """
+    Saves the shadow state of an arm. The position is read from the arm (M114) if it is not known.
+
+    Args:
+        arm (Dexarm): a connected arm
+        path (string): the session file
+    """
+    state = {"port": arm.ser.name,
+             "position": list(arm.get_commanded_position()),
+             "work_origin": list(arm.work_origin),
+             "module_type": arm.module_type,
+             "homed_at": arm.homed_at,
+             "saved_at": time.time()}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as outfile:
+        json.dump(state, outfile)
+    os.replace(tmp_path, path)
+
+
+def load_session(path=SESSION_PATH, port=None):
+    """
+    Returns:
+        state (dict): the saved session, see save_session, None if there is none,
+                      it cannot be read, or it was saved for another port
+    """
+    try:
+        with open(path) as infile:
+            state = json.load(infile)
+    except (OSError, ValueError):
+        return None
+    if port is not None and state.get("port") != port:
+        return None
+    return state
+
+
+def forget_session(path=SESSION_PATH):
+    """
+    Removes the saved session, i.e., after an emergency stop, so the next connection homes the arm
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def resume_session(arm, path=SESSION_PATH, tolerance=POSITION_TOLERANCE):
+    """
+    Checks the saved session against the arm with one M114 and one M888, and restores the shadow
+    state of the arm from it if the position and the module agree
+
+    Args:
+        arm (Dexarm): the arm, just connected
+        path (string): the session file
+        tolerance (float): millimetres the reported position may differ from the saved one
+
+    Returns:
+        reported (tuple): the M114 reply, x, y, z, e, a, b, c
+        reason (string): why the arm has to be homed, None if the session was resumed
+    """
+    reported = arm.get_current_position()
+    state = load_session(path, arm.ser.name)
+    if state is None:
+        return reported, "no saved session for {}".format(arm.ser.name)
+    if state["homed_at"] is None:
+        return reported, "the arm was not homed in the saved session"
+    if None in state["position"] or None in reported[:4]:
+        return reported, "the position is unknown"
+    error = max(abs(r - s) for r, s in zip(reported[:4], state["position"]))
+    if error > tolerance:
+        return reported, "the arm reports {} instead of {}, it was moved or power cycled".format(
+            tuple(reported[:4]), tuple(state["position"]))
+    module_type = arm.get_module_type()
+    if module_type != state["module_type"]:
+        return reported, "the arm reports a {} module instead of {}".format(module_type, state["module_type"])
+
+    arm.position = list(reported[:4])
+    arm.work_origin = list(state["work_origin"])
+    arm.homed_at = state["homed_at"]
+    return reported, None
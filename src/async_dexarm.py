@@ -0,0 +1,406 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+import serial
+
+from src.pydexarm import Dexarm, _move_cmd, _parse_reply
+
+
+class AsyncDexarm:
+    """ asyncio version of Dexarm
+
+    Every method of Dexarm is available as a coroutine. The port is read and written without blocking,
+    through the event loop (add_reader/add_writer), so one loop can drive several arms, poll their
+    positions and serve a UI at the same time. On platforms where the serial port cannot be watched by
+    the event loop (i.e., COM ports on Windows) a single executor task reads the port instead.
+
+        async with AsyncDexarm("/dev/ttyACM0") as arm:
+            await arm.go_home()
+            await arm.move_to(0, 300, -20)
+            x, y, z, e, a, b, c = await arm.get_current_position()
+    """
+
+    planner_buffer_size = Dexarm.planner_buffer_size
+
+    def __init__(self, port, verbose=True):
+        """
+        Args:
+            port (string): the serial port of Dexarm, e.g, "COM3"
+            verbose (bool): print every reply of the arm
+        """
+        self.port = port
+        self.verbose = verbose
+        self.ser = None
+        self.is_open = False
+
+        # streaming state, see streaming()
+        self.stream_window = 1
+
+        # futures of the commands waiting for their "ok", oldest first
+        self._tickets = deque()
+        self._lines = []
+        self._rx = bytearray()
+        self._tx = bytearray()
+        self._loop = None
+        self._slot_freed = None
+        self._poll_task = None
+        self._watching = False
+
+    async def open(self):
+        """
+        Open the serial port and start listening to the arm.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._slot_freed = asyncio.Event()
+        self.ser = serial.Serial(port=self.port,
+                        baudrate = 115200,
+                        parity=serial.PARITY_NONE,
+                        stopbits=serial.STOPBITS_ONE,
+                        bytesize=serial.EIGHTBITS,
+                        timeout=0)
+        self.is_open = self.ser.isOpen()
+
+        try:
+            self._loop.add_reader(self.ser.fileno(), self._on_readable)
+            self.ser.write_timeout = 0
+            self._watching = True
+        except (AttributeError, NotImplementedError, ValueError):
+            # no selectable handle, fall back to one reading task
+            self.ser.timeout = 0.1
+            self._poll_task = self._loop.create_task(self._poll_port())
+
+        print('pydexarm: %s open' % self.ser.name)
+        return self
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _on_readable(self):
+        """
+        Called by the event loop when the port has data.
+        """
+        try:
+            data = self.ser.read(max(1, self.ser.in_waiting))
+        except (serial.SerialException, OSError) as error:
+            self._fail_tickets(error)
+            return
+        self._feed(data)
+
+    async def _poll_port(self):
+        """
+        Read the port from an executor, for ports the event loop cannot watch.
+        """
+        while self.ser is not None and self.ser.is_open:
+            try:
+                data = await self._loop.run_in_executor(None, self._read_available)
+            except (serial.SerialException, OSError) as error:
+                self._fail_tickets(error)
+                return
+            self._feed(data)
+
+    def _read_available(self):
+        return self.ser.read(max(1, self.ser.in_waiting))
+
+    def _feed(self, data):
+        """
+        Split the received bytes into lines and resolve the oldest future on every "ok".
+        """
+        self._rx += data
+        while True:
+            end = self._rx.find(b"\n")
+            if end == -1:
+                return
+            serial_str = self._rx[:end].decode("utf-8", errors="replace").strip()
+            del self._rx[:end + 1]
+            if len(serial_str) == 0:
+                continue
+            if serial_str.startswith("ok"):
+                if self.verbose:
+                    print("read ok")
+                if self._tickets:
+                    ticket = self._tickets.popleft()
+                    if not ticket.done():
+                        ticket.set_result(_parse_reply(ticket.command, self._lines))
+                self._lines = []
+                self._slot_freed.set()
+            else:
+                if self.verbose:
+                    print("read：", serial_str)
+                self._lines.append(serial_str)
+
+    def _fail_tickets(self, error):
+        """
+        Fail every pending future, nothing will answer them anymore.
+        """
+        while self._tickets:
+            ticket = self._tickets.popleft()
+            if not ticket.done():
+                ticket.set_exception(serial.SerialException("pydexarm: serial port closed before \"ok\": %s" % error))
+        self._slot_freed.set()
+
+    def _write(self, data):
+        """
+        Queue bytes for the arm and write as much as the port accepts right now.
+        """
+        self._tx += data
+        self._write_pending()
+
+    def _write_pending(self):
+        written = self.ser.write(bytes(self._tx))
+        if written is None:
+            written = len(self._tx)
+        del self._tx[:written]
+        if not self._watching:
+            return
+        if self._tx:
+            self._loop.add_writer(self.ser.fileno(), self._write_pending)
+        else:
+            self._loop.remove_writer(self.ser.fileno())
+
+    async def submit(self, data):
+        """
+        Send a command and return its future without waiting for the reply.
+        Waits only while stream_window commands are already waiting for their "ok".
+
+        Args:
+            data (string): the command, terminated with a line ending
+
+        Returns:
+            ticket (asyncio.Future): resolved with the reply payload when "ok" is received
+        """
+        while len(self._tickets) >= self.stream_window:
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+        if self.ser is None or not self.ser.is_open:
+            raise serial.SerialException("pydexarm: serial port is not open")
+        ticket = self._loop.create_future()
+        ticket.command = data
+        self._tickets.append(ticket)
+        self._write(data.encode())
+        return ticket
+
+    async def _send_cmd(self, data, wait=True):
+        """
+        Send command to the arm.
+
+        Args:
+            data (string): the command
+            wait (bool): wait for response from the arm (ok) or not.
+                While streaming (see streaming()), commands never wait for their own "ok", regardless of this flag.
+
+        Returns:
+            ticket (asyncio.Future) of the command
+        """
+        ticket = await self.submit(data)
+        if wait and self.stream_window <= 1:
+            await ticket
+        return ticket
+
+    async def flush(self):
+        """
+        Wait until every command sent so far is acknowledged by the arm.
+        """
+        if self._tickets:
+            await self._tickets[-1]
+
+    @asynccontextmanager
+    async def streaming(self, window=None):
+        """
+        Keep up to window commands in flight instead of waiting for an "ok" after each one,
+        see Dexarm.streaming.
+
+        Args:
+            window (int): number of commands in flight, planner_buffer_size by default
+        """
+        if window is None:
+            window = self.planner_buffer_size
+        previous_window = self.stream_window
+        self.stream_window = max(1, int(window))
+        try:
+            yield self
+        finally:
+            await self.flush()
+            self.stream_window = previous_window
+
+    async def go_home(self):
+        """
+        Go to home position and enable the motors. Should be called each time when power on.
+        """
+        await self._send_cmd("M1112\r")
+
+    async def set_workorigin(self):
+        """
+        Set the current position as the new work origin.
+        """
+        await self._send_cmd("G92 X0 Y0 Z0 E0\r")
+
+    async def set_acceleration(self, acceleration, travel_acceleration, retract_acceleration=60):
+        """
+        Set the preferred starting acceleration for moves of different types, see Dexarm.set_acceleration.
+        """
+        cmd = "M204"+"P" + str(acceleration) + "T"+str(travel_acceleration) + "R" + str(retract_acceleration) + "\r\n"
+        await self._send_cmd(cmd)
+
+    async def set_module_type(self, module_type):
+        """
+        Set the type of end effector, see Dexarm.set_module_type.
+        """
+        await self._send_cmd("M888 P" + str(module_type) + "\r")
+
+    async def get_module_type(self):
+        """
+        Get the type of end effector.
+
+        Returns:
+            string that indicates the type of the module
+        """
+        return await (await self.submit("M888\r"))
+
+    async def move_to(self, x=None, y=None, z=None, e=None, feedrate=2000, mode="G1", wait=True):
+        """
+        Move to a cartesian position, see Dexarm.move_to.
+        """
+        await self._send_cmd(_move_cmd(x, y, z, e, feedrate, mode), wait=wait)
+
+    async def fast_move_to(self, x=None, y=None, z=None, feedrate=2000, wait=True):
+        """
+        Fast move to a cartesian position, i.e., in mode G0
+        """
+        await self.move_to(x=x, y=y, z=z, feedrate=feedrate, mode="G0", wait=wait)
+
+    async def rotate_to(self, r= None, wait=True):
+        """
+        Rotates the rotary module to a given absolute degree
+        """
+        await self._send_cmd("M2101 P" + str(r) + "\r\n", wait=wait)
+
+    async def get_current_rotation(self, wait=True):
+        await self._send_cmd("M2101\r\n", wait=wait)
+
+    async def get_current_position(self):
+        """
+        Get the current position
+
+        Returns:
+            position x,y,z, extrusion e, and dexarm theta a,b,c
+        """
+        return await (await self.submit("M114\r"))
+
+    async def dealy_ms(self, value):
+        """
+        Pauses the command queue and waits for a period of time in ms
+        """
+        await self._send_cmd("G4 P" + str(value) + '\r')
+
+    async def dealy_s(self, value):
+        """
+        Pauses the command queue and waits for a period of time in s
+        """
+        await self._send_cmd("G4 S" + str(value) + '\r')
+
+    async def soft_gripper_pick(self):
+        """
+        Close the soft gripper
+        """
+        await self._send_cmd("M1001\r")
+
+    async def soft_gripper_place(self):
+        """
+        Wide-open the soft gripper
+        """
+        await self._send_cmd("M1000\r")
+
+    async def soft_gripper_nature(self):
+        """
+        Release the soft gripper to nature state
+        """
+        await self._send_cmd("M1002\r")
+
+    async def soft_gripper_stop(self):
+        """
+        Stop the soft gripper
+        """
+        await self._send_cmd("M1003\r")
+
+    async def air_picker_pick(self):
+        """
+        Pickup an object
+        """
+        await self._send_cmd("M1000\r")
+
+    async def air_picker_place(self):
+        """
+        Release an object
+        """
+        await self._send_cmd("M1001\r")
+
+    async def air_picker_nature(self):
+        """
+        Release to nature state
+        """
+        await self._send_cmd("M1002\r")
+
+    async def air_picker_stop(self):
+        """
+        Stop the picker
+        """
+        await self._send_cmd("M1003\r")
+
+    async def laser_on(self, value=0):
+        """
+        Turn on the laser
+
+        Args:
+            value (int): set the power, range form 1 to 255
+        """
+        await self._send_cmd("M3 S" + str(value) + '\r')
+
+    async def laser_off(self):
+        """
+        Turn off the laser
+        """
+        await self._send_cmd("M5\r")
+
+    async def conveyor_belt_forward(self, speed=0):
+        """
+        Move the belt forward
+        """
+        await self._send_cmd("M2012 F" + str(speed) + 'D0\r')
+
+    async def conveyor_belt_backward(self, speed=0):
+        """
+        Move the belt backward
+        """
+        await self._send_cmd("M2012 F" + str(speed) + 'D1\r')
+
+    async def conveyor_belt_stop(self, speed=0):
+        """
+        Stop the belt
+        """
+        await self._send_cmd("M2013\r")
+
+    async def sliding_rail_init(self):
+        """
+        Sliding rail init.
+        """
+        await self._send_cmd("M2005\r")
+
+    async def close(self):
+        """
+        Release the serial port.
+        """
+        if self.ser is None:
+            return
+        if self.ser.is_open:
+            await self.flush()
+        if self._watching:
+            self._loop.remove_reader(self.ser.fileno())
+            self._loop.remove_writer(self.ser.fileno())
+        self.ser.close()
+        if self._poll_task is not None:
+            await self._poll_task
+        self.is_open = False
@@ -0,0 +1,240 @@
+'''
+    File name: canvas_log.py
+    Keeps the drawing file of the canvas up to date one stroke at a time.
+
+    The canvas reports all of its shapes on every change. Canvas_log compares them with the
+    shapes it already knows, parses only the new ones, and appends the added and erased strokes
+    to a log next to the drawing file. Every so often, and before the drawing is read, the log
+    is compacted: the drawing file is rewritten from the strokes in memory and the log restarts.
+
+    Log lines, JSON:
+        {"op": "base", "ids": [...]}       ids of the strokes in the drawing file, in order
+        {"op": "add", "id": i, "xy": [[x, y], ...]}   a new stroke, or new targets of an edited one
+        {"op": "erase", "id": i}
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import json
+import os
+import re
+
+import numpy as np
+
+
+##########################################################################################
+###### Constants
+##########################################################################################
+# every number in an SVG path, the commands (M, L, Z) and separators are skipped
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+# a shape edited on the canvas comes as {"shapes[3].path": "M..."}
+EDIT_PATTERN = re.compile(r"shapes\[(\d+)\]\.path")
+
+
+##########################################################################################
+###### Parsing
+##########################################################################################
+def parse_path(path):
+   """
+   Parses the SVG path of a shape drawn on the canvas in one pass
+
+   Args:
+      path (string): i.e.: "M10,20L30,40L50,60"
+   returns:
+      xy (numpy.ndarray): (n, 2) canvas coordinates of the points
+   """
+   # refer to https://plotly.com/python/reference/layout/shapes/#layout-shapes-items-shape-path
+   # and: https://developer.mozilla.org/en-US/docs/Web/SVG/Tutorial/Paths
+   # M: Move to, L: line to, both followed by x,y
+   values = np.array(NUMBER_PATTERN.findall(path), dtype=float)
+   return values[:values.size - values.size % 2].reshape(-1, 2)
+
+
+##########################################################################################
+###### Classes
+##########################################################################################
+class Canvas_log(object):
+   """
+   The strokes drawn on the canvas, written to a drawing file incrementally
+
+      canvas = Canvas_log("./data/path_data.json", scale=25, offset=(0, 250))
+      canvas.update(relayout_data)   # on every canvas change
+      canvas.flush()                 # before reading ./data/path_data.json
+   """
+   def __init__(self, json_path, scale = 25, offset = (0, 0), compact_every = 64):
+      """
+      Args:
+         json_path (string): the drawing file, i.e.: "./data/path_data.json"
+         scale (float): canvas pixels per millimetre
+         offset (tuple): x, y in millimetres of the canvas origin
+         compact_every (int): log lines written before the drawing file is rewritten
+      """
+      self.json_path = json_path
+      self.log_path = os.path.splitext(json_path)[0] + ".log"
+      self.scale = scale
+      self.offset = np.asarray(offset, dtype=float)
+      self.compact_every = compact_every
+
+      # shapes on the canvas, in canvas order: [path, stroke id]
+      self.shapes = []
+      # stroke id -> (n, 2) targets in millimetres
+      self.strokes = {}
+      self.next_id = 0
+      # log lines since the last compaction
+      self.pending = 0
+      # the drawing file does not hold the canvas, i.e., it was cleared or replaced by an upload
+      self.stale = True
+
+      self.recover()
+
+   def update(self, relayout_data):
+      """
+      Applies a canvas change
+
+      Args:
+         relayout_data (dict): the relayoutData of the canvas graph
+      returns:
+         (tuple) number of strokes added and erased
+      """
+      if "shapes" in relayout_data:
+         added, erased = self._replace_shapes([shape.get("path") for shape in relayout_data["shapes"]])
+      else:
+         added, erased = 0, 0
+         for key, path in relayout_data.items():
+            match = EDIT_PATTERN.fullmatch(key)
+            if match is None or int(match.group(1)) >= len(self.shapes):
+               continue
+            i = int(match.group(1))
+            # the edited stroke keeps its id, and its place in the drawing
+            self.shapes[i] = [path, self._add(path, self.shapes[i][1])]
+            added += 1
+            erased += 1
+
+      if self.stale and (added or erased):
+         # the whole canvas replaces whatever is in the drawing file
+         self.compact()
+      elif self.pending >= self.compact_every:
+         self.compact()
+      return added, erased
+
+   def _replace_shapes(self, paths):
+      """
+      Diffs the shapes now on the canvas against the known ones, by path
+      """
+      known = {}
+      for path, stroke_id in self.shapes:
+         known.setdefault(path, []).append(stroke_id)
+
+      shapes = []
+      added = 0
+      for path in paths:
+         if path is None:
+            continue
+         if known.get(path):
+            stroke_id = known[path].pop(0)
+         else:
+            stroke_id = self._add(path)
+            added += 1
+         shapes.append([path, stroke_id])
+
+      erased = 0
+      for stroke_ids in known.values():
+         for stroke_id in stroke_ids:
+            self._erase(stroke_id)
+            erased += 1
+      self.shapes = shapes
+      return added, erased
+
+   def _add(self, path, stroke_id=None):
+      if stroke_id is None:
+         stroke_id = self.next_id
+         self.next_id += 1
+      xy = parse_path(path)/self.scale + self.offset
+      self.strokes[stroke_id] = xy
+      self._append({"op": "add", "id": stroke_id, "xy": xy.tolist()})
+      return stroke_id
+
+   def _erase(self, stroke_id):
+      del self.strokes[stroke_id]
+      self._append({"op": "erase", "id": stroke_id})
+
+   def _append(self, record):
+      if self.stale:
+         # the next compaction writes everything, nothing to log before it
+         return
+      with open(self.log_path, "a") as outfile:
+         outfile.write(json.dumps(record) + "\n")
+      self.pending += 1
+
+   def flush(self):
+      """
+      Brings the drawing file up to date with the canvas, if the canvas changed since the last compaction
+      """
+      if self.pending:
+         self.compact()
+
+   def compact(self):
+      """
+      Rewrites the drawing file from the strokes in memory and restarts the log
+      """
+      ids = [stroke_id for _, stroke_id in self.shapes]
+      write_strokes(self.json_path, [self.strokes[i] for i in ids])
+      with open(self.log_path, "w") as outfile:
+         outfile.write(json.dumps({"op": "base", "ids": ids}) + "\n")
+      self.pending = 0
+      self.stale = False
+
+   def detach(self):
+      """
+      Call after the drawing file was replaced, i.e., by an upload or a reset. The canvas is
+      written whole on its next change.
+      """
+      self.pending = 0
+      self.stale = True
+      if os.path.exists(self.log_path):
+         os.remove(self.log_path)
+
+   def clear(self):
+      """
+      Forgets all strokes, for a cleared canvas
+      """
+      self.shapes = []
+      self.strokes = {}
+      self.detach()
+
+   def recover(self):
+      """
+      Applies a log left by a previous session that ended before compacting it to the drawing file
+      """
+      if not os.path.exists(self.log_path):
+         return
+      with open(self.log_path) as infile:
+         records = [json.loads(line) for line in infile if line.strip()]
+      if len(records) > 1 and records[0]["op"] == "base":
+         with open(self.json_path) as infile:
+            strokes = json.load(infile)["drawing"]["strokes"]
+         if len(strokes) == len(records[0]["ids"]):
+            strokes = {i: [[point["x"], point["y"]] for point in stroke] for i, stroke in zip(records[0]["ids"], strokes)}
+            for record in records[1:]:
+               if record["op"] == "add":
+                  strokes[record["id"]] = record["xy"]
+               elif record["op"] == "erase":
+                  strokes.pop(record["id"], None)
+            write_strokes(self.json_path, [np.asarray(xy, dtype=float).reshape(-1, 2) for xy in strokes.values()])
+      os.remove(self.log_path)
+
+
+def write_strokes(json_path, strokes):
+   """
+   Writes canvas strokes as a JSON drawing, through a temporary file so a reader never sees half of it
+
+   Args:
+      json_path (string): the drawing file
+      strokes (list of numpy.ndarray): (n, 2) x, y of each stroke in millimetres
+   """
+   drawing_dic = {"drawing": {"strokes": [[{"x": x, "y": y, "a": 0, "p": 0.0} for x, y in xy.tolist()]
+                                          for xy in strokes]}}
+   tmp_path = json_path + ".tmp"
+   with open(tmp_path, "w") as outfile:
+      json.dump(drawing_dic, outfile)
+   os.replace(tmp_path, json_path)
@@ -0,0 +1,416 @@
+'''
+    File name: dexarm_sim.py
+    A stand-in for a DexArm: a fake firmware served on a pseudo-terminal (POSIX only)
+    that Dexarm(port=...) can open unchanged.
+
+    Run it on its own and connect the app to the printed port:
+        python -m src.dexarm_sim --queue-depth 4 --latency 0.002
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import argparse
+import math
+import os
+import re
+import select
+import threading
+import time
+import tty
+from collections import deque
+
+
+##########################################################################################
+###### Constants
+##########################################################################################
+# position after M1112
+HOME_POSITION = (0., 300., 0., 0.)
+# position reported after power_cycle(), until the arm is homed; assumed, the real boot position is not documented
+BOOT_POSITION = (0., 0., 0., 0.)
+
+# reply of M888 for each module type
+MODULE_NAMES = {0: "PEN", 1: "LASER", 2: "PUMP", 3: "3D", 6: "ROTARY"}
+
+WORD_PATTERN = re.compile(r"([A-Z])\s*([-+]?\d*\.?\d*)")
+
+
+##########################################################################################
+###### Classes
+##########################################################################################
+class Dexarm_simulator(object):
+   """
+   Fake DexArm firmware on a pseudo-terminal.
+
+   Like the real (Marlin based) firmware, a motion command is answered with "ok" once it is
+   accepted in the planner queue, and the answer is held back while that queue is full.
+   Motion is timed with a trapezoidal velocity profile; time_scale=0 skips the waiting but
+   still accounts the estimated motion time in stats.
+
+   With emergency_parser (Marlin's EMERGENCY_PARSER), M410 is acted on as soon as it is received,
+   even while earlier lines wait for room in the planner: the planner is emptied, the current
+   block ends at once, and moves planned during the next stop_hold seconds are dropped, as
+   Planner::quick_stop does. The line is still answered in order.
+
+      sim = Dexarm_simulator(queue_depth=4).start()
+      arm = Dexarm(port=sim.port)
+      ...
+      arm.close()
+      sim.stop()
+   """
+   def __init__(self, queue_depth=4, line_latency=0., acceleration=500., feedrate=2000., time_scale=1., module_type=0,
+                emergency_parser=True, stop_hold=1.):
+      """
+      Args:
+         queue_depth (int): number of blocks the planner holds before it stops answering "ok"
+         line_latency (float): seconds the firmware spends parsing each line
+         acceleration (float): acceleration of all moves in mm/s^2, changed by M204
+         feedrate (float): feedrate in mm/min used until a command sets one
+         time_scale (float): multiplier of the real time spent on motions and dwells,
+                             0 runs the program instantly
+         module_type (int): module reported by M888, see Dexarm.set_module_type
+         emergency_parser (bool): act on M410 when it is received instead of in order
+         stop_hold (float): seconds after a quick stop during which new moves are dropped
+      """
+      self.queue_depth = queue_depth
+      self.line_latency = line_latency
+      self.acceleration = acceleration
+      self.feedrate = feedrate
+      self.time_scale = time_scale
+      self.module_type = module_type
+      self.emergency_parser = emergency_parser
+      self.stop_hold = stop_hold
+
+      self.port = None
+      self.position = list(HOME_POSITION)
+      self.rotation = 0.
+      self.homed = False
+      self.stats = {}
+      self.reset_stats()
+      # time.perf_counter() of the last quick stop, None before any, and stats["blocks_run"] then
+      self.last_quick_stop = None
+      self.blocks_at_quick_stop = 0
+      self._stops = 0
+      self._drop_until = 0.
+
+      self._master = None
+      self._slave = None
+      self._running = False
+      self._planner = deque()
+      self._planner_changed = threading.Condition()
+      # lines received and not executed yet
+      self._lines = deque()
+      self._lines_changed = threading.Condition()
+      self._threads = []
+
+   def reset_stats(self):
+      """
+      Zero the counters in self.stats:
+         bytes_in, bytes_out: bytes received from and sent to the host
+         lines: command lines received
+         moves, dwells: motion and dwell blocks queued
+         motion_time: estimated seconds of motion and dwell, regardless of time_scale
+         travel: millimetres travelled
+         blocks_run: blocks the planner started executing
+         quick_stops: M410 quick stops
+         dropped: blocks dropped by a quick stop, planned or arriving during stop_hold
+      """
+      self.stats = {"bytes_in": 0,
+                    "bytes_out": 0,
+                    "lines": 0,
+                    "moves": 0,
+                    "dwells": 0,
+                    "motion_time": 0.,
+                    "travel": 0.,
+                    "blocks_run": 0,
+                    "quick_stops": 0,
+                    "dropped": 0}
+
+   def start(self):
+      """
+      Open the pseudo-terminal and start answering on it.
+
+      returns:
+         self, with self.port set to the device to open
+      """
+      self._master, self._slave = os.openpty()
+      tty.setraw(self._slave)
+      self.port = os.ttyname(self._slave)
+      self._running = True
+      self._threads = [threading.Thread(target=self._receive, name="dexarm_sim serial", daemon=True),
+                       threading.Thread(target=self._serve, name="dexarm_sim parser", daemon=True),
+                       threading.Thread(target=self._run_planner, name="dexarm_sim planner", daemon=True)]
+      for thread in self._threads:
+         thread.start()
+      return self
+
+   def stop(self):
+      """
+      Stop answering and close the pseudo-terminal.
+      """
+      self._running = False
+      with self._planner_changed:
+         self._planner_changed.notify_all()
+      with self._lines_changed:
+         self._lines_changed.notify_all()
+      for thread in self._threads:
+         thread.join()
+      os.close(self._master)
+      os.close(self._slave)
+
+   def __enter__(self):
+      return self.start()
+
+   def __exit__(self, exc_type, exc, tb):
+      self.stop()
+
+   def power_cycle(self):
+      """
+      Turn the arm off and on while the port stays open: the planner is emptied and the
+      position is lost until the next M1112. The module type is kept.
+      """
+      with self._planner_changed:
+         self._planner.clear()
+         self._planner_changed.notify_all()
+      self.position = list(BOOT_POSITION)
+      self.homed = False
+
+   def motion_time(self, distance, feedrate):
+      """
+      Duration of a move that starts and ends at rest, with a trapezoidal velocity profile
+
+      Args:
+         distance (float): length of the move in mm
+         feedrate (float): cruise speed in mm/min
+      returns:
+         duration in seconds
+      """
+      if distance <= 0:
+         return 0.
+      speed = feedrate/60.
+      if distance >= speed*speed/self.acceleration:
+         return distance/speed + speed/self.acceleration
+      # triangular profile, never reaches the cruise speed
+      return 2*math.sqrt(distance/self.acceleration)
+
+   ########################################
+   ###### Serial side
+   ########################################
+   def _write(self, text):
+      data = text.encode()
+      self.stats["bytes_out"] += len(data)
+      os.write(self._master, data)
+
+   def _receive(self):
+      """
+      Read lines from the host, like the serial interrupt of the firmware
+      """
+      buffer = b""
+      while self._running:
+         readable, _, _ = select.select([self._master], [], [], 0.05)
+         if not readable:
+            continue
+         try:
+            data = os.read(self._master, 4096)
+         except OSError:
+            return
+         self.stats["bytes_in"] += len(data)
+         buffer += data
+         lines = re.split(rb"[\r\n]", buffer)
+         buffer = lines.pop()
+         for line in lines:
+            line = line.decode("utf-8", errors="replace").strip()
+            if len(line) == 0:
+               continue
+            if self.emergency_parser and line.upper().startswith("M410"):
+               self._quick_stop()
+            with self._lines_changed:
+               self._lines.append(line)
+               self._lines_changed.notify_all()
+
+   def _serve(self):
+      """
+      Execute the received lines and answer them in order.
+      """
+      while self._running:
+         with self._lines_changed:
+            while self._running and len(self._lines) == 0:
+               self._lines_changed.wait(0.05)
+            if not self._running:
+               return
+            line = self._lines.popleft()
+         self.stats["lines"] += 1
+         if self.line_latency > 0:
+            time.sleep(self.line_latency)
+         self._execute(line)
+
+   def _execute(self, line):
+      """
+      Run one command line and send its reply followed by "ok"
+      """
+      words = [(letter, value) for letter, value in WORD_PATTERN.findall(line.upper())]
+      if len(words) == 0:
+         self._write("echo:Unknown command: \"{}\"\nok\n".format(line))
+         return
+      code = words[0][0] + str(int(float(words[0][1] or 0)))
+      params = {letter: float(value) for letter, value in words[1:] if value not in ("", "+", "-", ".")}
+      flags = {letter for letter, _ in words[1:]}
+
+      if code in ("G0", "G1"):
+         if "F" in params:
+            self.feedrate = params["F"]
+         target = list(self.position)
+         for i, axis in enumerate("XYZE"):
+            if axis in params:
+               target[i] = params[axis]
+         self._queue_move(target, self.feedrate)
+
+      elif code == "G4":
+         seconds = params.get("S", 0.) + params.get("P", 0.)/1000.
+         self._queue_block(("dwell", seconds))
+
+      elif code == "G92":
+         for i, axis in enumerate("XYZE"):
+            if axis in flags:
+               self.position[i] = params.get(axis, 0.)
+
+      elif code == "M1112":
+         self._queue_move(list(HOME_POSITION), self.feedrate)
+         self.homed = True
+
+      elif code == "M114":
+         x, y, z, e = self.position
+         self._write("X:{:.2f} Y:{:.2f} Z:{:.2f} E:{:.2f} Count A:0 B:0 C:0\n".format(x, y, z, e))
+         self._write("DEXARM Theta A:{:.2f}  Theta B:{:.2f}  Theta C:{:.2f}\n".format(*self._thetas()))
+
+      elif code == "M888":
+         if "P" in params:
+            self.module_type = int(params["P"])
+         else:
+            self._write("{}\n".format(MODULE_NAMES.get(self.module_type, "UNKNOWN")))
+
+      elif code == "M2101":
+         if "P" in params:
+            self.rotation = params["P"]
+            self._queue_block(("dwell", 0.))
+         else:
+            self._write("{:.2f}\n".format(self.rotation))
+
+      elif code == "M204":
+         if "P" in params:
+            self.acceleration = max(params["P"], 1.)
+
+      elif code == "M410":
+         # quick stop, drop everything that is planned, unless the emergency parser already did
+         if not self.emergency_parser:
+            self._quick_stop()
+
+      elif code in ("M3", "M5", "M1000", "M1001", "M1002", "M1003", "M2005", "M2012", "M2013"):
+         pass
+
+      else:
+         self._write("echo:Unknown command: \"{}\"\n".format(line))
+
+      self._write("ok\n")
+
+   def _thetas(self):
+      """
+      Rough joint angles for the M114 reply, the arm is not modelled
+      """
+      x, y, z, _ = self.position
+      return math.degrees(math.atan2(x, y)), math.hypot(x, y)/10., z
+
+   ########################################
+   ###### Planner
+   ########################################
+   def _queue_move(self, target, feedrate):
+      distance = math.sqrt(sum((t - p)**2 for t, p in zip(target[:3], self.position[:3])))
+      if distance == 0:
+         # e only moves, i.e., the sliding rail
+         distance = abs(target[3] - self.position[3])
+      self.position = target
+      self.stats["moves"] += 1
+      self.stats["travel"] += distance
+      self._queue_block(("move", self.motion_time(distance, feedrate)))
+
+   def _queue_block(self, block):
+      """
+      Wait for a free slot in the planner and queue a block
+      """
+      if block[0] == "dwell":
+         self.stats["dwells"] += 1
+      self.stats["motion_time"] += block[1]
+      with self._planner_changed:
+         while self._running and len(self._planner) >= self.queue_depth:
+            self._planner_changed.wait(0.05)
+         if time.perf_counter() < self._drop_until:
+            self.stats["dropped"] += 1
+            return
+         self._planner.append(block)
+         self._planner_changed.notify_all()
+
+   def _quick_stop(self):
+      """
+      Empty the planner, end the current block and drop new moves for stop_hold seconds
+      """
+      with self._planner_changed:
+         self.stats["dropped"] += len(self._planner)
+         self.stats["quick_stops"] += 1
+         self._stops += 1
+         self._planner.clear()
+         self.last_quick_stop = time.perf_counter()
+         self.blocks_at_quick_stop = self.stats["blocks_run"]
+         self._drop_until = self.last_quick_stop + self.stop_hold
+         self._planner_changed.notify_all()
+
+   def _run_planner(self):
+      """
+      Execute planned blocks, one at a time
+      """
+      while self._running:
+         with self._planner_changed:
+            while self._running and len(self._planner) == 0:
+               self._planner_changed.wait(0.05)
+            if not self._running:
+               return
+            _, duration = self._planner[0]
+            self.stats["blocks_run"] += 1
+            stops = self._stops
+            deadline = time.perf_counter() + duration*self.time_scale
+            # a quick stop empties the planner and ends the current block right away
+            while self._running and self._stops == stops and time.perf_counter() < deadline:
+               self._planner_changed.wait(deadline - time.perf_counter())
+            if self._stops == stops and self._planner:
+               self._planner.popleft()
+            self._planner_changed.notify_all()
+
+
+##########################################################################################
+###### Standalone
+##########################################################################################
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(prog='dexarm_sim',
+                                    description="A fake DexArm on a pseudo-terminal")
+   parser.add_argument('--queue-depth', default=4, type=int,
+                        help="planner blocks held before \"ok\" is delayed (int)")
+   parser.add_argument('--latency', default=0., type=float,
+                        help="seconds spent on each line (float)")
+   parser.add_argument('--acceleration', default=500., type=float,
+                        help="acceleration in mm/s^2 (float)")
+   parser.add_argument('--time-scale', default=1., type=float,
+                        help="multiplier of real motion time, 0 for instant (float)")
+   parser.add_argument('--no-emergency-parser', action='store_true',
+                        help="run M410 in order with the other lines, like a firmware without EMERGENCY_PARSER")
+   args = parser.parse_args()
+
+   sim = Dexarm_simulator(queue_depth=args.queue_depth,
+                          line_latency=args.latency,
+                          acceleration=args.acceleration,
+                          time_scale=args.time_scale,
+                          emergency_parser=not args.no_emergency_parser).start()
+   print("DexArm simulator listening on {}".format(sim.port))
+   try:
+      while True:
+         time.sleep(1)
+   except KeyboardInterrupt:
+      print(sim.stats)
+      sim.stop()
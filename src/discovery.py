@@ -0,0 +1,137 @@
+'''
+    File name: discovery.py
+    Finds the serial ports a DexArm answers on: every candidate port is probed at the same time
+    with M114 and M888, and only the ports that reply like a DexArm within a short timeout are kept.
+
+        arms = discover()   # [{"port": "/dev/ttyACM0", "module_type": "PEN", "position": (...), ...}]
+        arm = Dexarm(arms[0]["port"])
+
+    Run it on its own to list the arms, one JSON object per line:
+        python -m src.discovery --timeout 0.3
+'''
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+from serial.tools import list_ports
+
+from src.pydexarm import _parse_module_type, _parse_position
+
+
+# seconds a port has to answer both queries
+PROBE_TIMEOUT = 0.3
+
+
+def candidate_ports(extra_ports=()):
+    """
+    The serial devices of this machine, USB devices first, i.e., "/dev/ttyACM0" or "COM3"
+
+    Args:
+        extra_ports (list): ports to probe too, i.e., the pseudo-terminal of Dexarm_simulator, which is not listed
+
+    Returns:
+        ports (list of string)
+    """
+    listed = sorted(list_ports.comports(), key=lambda info: (info.vid is None, info.device))
+    ports = list(extra_ports)
+    for info in listed:
+        if info.device not in ports:
+            ports.append(info.device)
+    return ports
+
+
+def probe(port, timeout=PROBE_TIMEOUT):
+    """
+    Asks a port for its position (M114) and module (M888). Both are queries, nothing moves.
+
+    Args:
+        port (string): the serial port
+        timeout (float): seconds to wait for both "ok"
+
+    Returns:
+        dict with port, module_type, position (x, y, z, e, a, b, c) and latency (seconds to the
+        first "ok"), or None if the port could not be opened or did not answer like a DexArm
+    """
+    deadline = time.perf_counter() + timeout
+    try:
+        ser = serial.Serial(port=port,
+                            baudrate=115200,
+                            parity=serial.PARITY_NONE,
+                            stopbits=serial.STOPBITS_ONE,
+                            bytesize=serial.EIGHTBITS,
+                            timeout=min(0.05, timeout),
+                            write_timeout=timeout)
+    except (serial.SerialException, OSError, ValueError):
+        return None
+
+    replies = []
+    latency = None
+    try:
+        ser.reset_input_buffer()
+        start = time.perf_counter()
+        ser.write(b"M114\r\nM888\r\n")
+        lines = []
+        buffer = b""
+        while len(replies) < 2 and time.perf_counter() < deadline:
+            buffer += ser.read(ser.in_waiting or 1)
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.decode("utf-8", errors="replace").strip()
+                if line.startswith("ok"):
+                    if latency is None:
+                        latency = time.perf_counter() - start
+                    replies.append(lines)
+                    lines = []
+                elif line:
+                    lines.append(line)
+    except (serial.SerialException, OSError):
+        return None
+    finally:
+        ser.close()
+
+    if len(replies) < 2:
+        return None
+    position = _parse_position(replies[0])
+    # a DexArm reports its joint angles with the position, other Marlin boards do not
+    if position[0] is None or position[4] is None:
+        return None
+    return {"port": port,
+            "module_type": _parse_module_type(replies[1]),
+            "position": position,
+            "latency": latency}
+
+
+def discover(ports=None, timeout=PROBE_TIMEOUT, extra_ports=()):
+    """
+    Probes ports at the same time, so finding the arms takes about one timeout however many ports there are
+
+    Args:
+        ports (list): the ports to probe, candidate_ports(extra_ports) by default
+        timeout (float): seconds every port has to answer, see probe
+        extra_ports (list): see candidate_ports
+
+    Returns:
+        arms (list of dict): the ports that answered like a DexArm, in the order of ports, see probe
+    """
+    if ports is None:
+        ports = candidate_ports(extra_ports)
+    if len(ports) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="dexarm probe") as pool:
+        results = list(pool.map(lambda port: probe(port, timeout), ports))
+    return [result for result in results if result is not None]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='discovery',
+                                     description="Lists the serial ports a DexArm answers on")
+    parser.add_argument('--timeout', default=PROBE_TIMEOUT, type=float,
+                        help="seconds every port has to answer (float)")
+    parser.add_argument('ports', nargs='*',
+                        help="ports to probe besides the listed ones, i.e., a simulator (str)")
+    args = parser.parse_args()
+
+    for arm in discover(timeout=args.timeout, extra_ports=args.ports):
+        print(json.dumps(arm))
@@ -0,0 +1,233 @@
+##########################################################################################
+###### Imports
+##########################################################################################
+import contextlib
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from src.gcode_optimizer import Gcode_optimizer, format_number
+from src.tracing import tracer
+
+
+# bump when the generated G-code changes, so programs cached by older versions are not reused
+COMPILER_VERSION = 3
+# marks the start of every polyline in a program, never sent to the arm
+POLYLINE_MARKER = ";polyline"
+
+
+##########################################################################################
+###### Classes
+##########################################################################################
+class Program_recorder(object):
+   """
+   Stands in for the arm in Drawing_processor.draw and records the commands instead of sending them
+   """
+   def __init__(self, precision=1):
+      """
+      Args:
+         precision (int): decimals of the coordinates, see Gcode_optimizer
+      """
+      self.precision = precision
+      self.lines = []
+      # commanded position, None while unknown, i.e., before the first move and after homing
+      self.position = [None, None, None, None]
+
+   def move_to(self, x=None, y=None, z=None, e=None, feedrate=2000, mode="G1", wait=True):
+      # not rounded to whole millimetres like Dexarm.move_to without an optimizer, see _move_cmd
+      cmd = mode + "F" + str(feedrate)
+      for axis, value in zip("XYZE", (x, y, z, e)):
+         if value is not None:
+            cmd = cmd + axis + format_number(value, self.precision)
+      self.lines.append(cmd + "\r\n")
+      for i, value in enumerate((x, y, z, e)):
+         if value is not None:
+            self.position[i] = value
+
+   def mark_polyline(self, i):
+      self.lines.append("{} {}\n".format(POLYLINE_MARKER, i))
+
+   def dealy_s(self, value):
+      self.lines.append("G4 S" + str(value) + '\r')
+
+   def dealy_ms(self, value):
+      self.lines.append("G4 P" + str(value) + '\r')
+
+   def go_home(self):
+      self.lines.append("M1112\r")
+      self.position = [None, None, None, None]
+
+   def get_commanded_position(self):
+      # an unknown axis is left out of the move, i.e., the pen is lifted where it is
+      return tuple(self.position)
+
+
+class Drawing_compiler(object):
+   """
+   Compiles a drawing and the Drawing_processor settings into a flat G-code program, ready to stream.
+   Programs are cached in memory and on disk, by a hash of the drawing file and the settings,
+   so drawing the same job again skips parsing, preprocessing and encoding.
+
+      compiler = Drawing_compiler()
+      program = compiler.compile_file(dp, "./data/path_data.json")
+      arm.stream_program(program)
+   """
+   def __init__(self, cache_dir = "./data/program_cache", memory_entries = 8, disk_entries = 64, precision = 1):
+      """
+      Args:
+         cache_dir (string): where compiled programs are kept, None to only cache in memory
+         memory_entries (int): programs kept in memory, the least recently used is evicted first
+         disk_entries (int): programs kept in cache_dir, the least recently used is evicted first
+         precision (int): decimals of the coordinates, see Gcode_optimizer
+      """
+      self.cache_dir = cache_dir
+      self.memory_entries = memory_entries
+      self.disk_entries = disk_entries
+      self.precision = precision
+      self._memory = OrderedDict()
+      # what the last compile_file did: "memory", "disk" or "compiled"
+      self.last_source = None
+
+   def settings(self, dp):
+      """
+      Everything in a Drawing_processor that changes the program
+
+      Args:
+         dp (Drawing_processor): the processor the drawing is compiled for
+      returns:
+         settings (dict)
+      """
+      return {"version": COMPILER_VERSION,
+              "precision": self.precision,
+              "base_z": dp.base_z,
+              "pressure_factor": dp.pressure_factor,
+              "safe_z_val": dp.safe_z_val,
+              "slider": dp.slider,
+              "continuous": dp.continuous,
+              "dwells": [dp.target_dwell, dp.polyline_dwell, dp.pen_down_dwell, dp.pen_up_dwell],
+              "merge": [dp.merge_tolerance, dp.merge_pressure_tolerance],
+              "simplify": dp.simplify_tolerance,
+              "order": [dp.optimize_order, list(dp.home_position)],
+              }
+
+   def key(self, drawing_data, dp):
+      """
+      Content address of a program
+
+      Args:
+         drawing_data (bytes): the drawing file
+         dp (Drawing_processor): the processor the drawing is compiled for
+      returns:
+         key (string): hex digest
+      """
+      digest = hashlib.sha256(drawing_data)
+      digest.update(json.dumps(self.settings(dp), sort_keys=True, default=str).encode())
+      return digest.hexdigest()
+
+   def compile(self, dp, polyLines):
+      """
+      Compiles polylines, exactly as dp.draw would send them
+
+      Args:
+         dp (Drawing_processor): the processor with the drawing settings
+         polyLines (numpy.ndarray): polylines, already prepared
+      returns:
+         program (bytes): the G-code lines, each polyline starts with a ";polyline i" comment line
+      """
+      recorder = Program_recorder(self.precision)
+      # draw() reports every target on stdout
+      with tracer.span("record", strokes=len(polyLines)):
+         with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            dp._draw_polylines(recorder, polyLines)
+      with tracer.span("optimize G-code", lines=len(recorder.lines)):
+         lines = Gcode_optimizer(self.precision).optimize(recorder.lines)
+         return "".join(lines).encode()
+
+   def compile_file(self, dp, json_path):
+      """
+      Compiles a JSON drawing file, or returns the cached program
+
+      Args:
+         dp (Drawing_processor): the processor with the drawing settings
+         json_path (string): the drawing, i.e.: "./data/path_data.json"
+      returns:
+         program (bytes): the G-code lines
+      """
+      with tracer.span("cache lookup", path=json_path):
+         with open(json_path, "rb") as infile:
+            drawing_data = infile.read()
+         key = self.key(drawing_data, dp)
+         program = self._load(key)
+      if program is not None:
+         return program
+
+      polyLines = dp.extract_ploylines(json_path=json_path)
+      polyLines = dp.prepare(polyLines)
+      program = self.compile(dp, polyLines)
+      self.last_source = "compiled"
+      self._store(key, program)
+      return program
+
+   ########################################
+   ###### Cache
+   ########################################
+   def _path(self, key):
+      return os.path.join(self.cache_dir, key + ".gcode")
+
+   def _load(self, key):
+      if key in self._memory:
+         self._memory.move_to_end(key)
+         if self.cache_dir is not None and os.path.exists(self._path(key)):
+            # used, so it is not the first evicted from the disk cache either
+            os.utime(self._path(key))
+         self.last_source = "memory"
+         return self._memory[key]
+      if self.cache_dir is None or not os.path.exists(self._path(key)):
+         return None
+      with open(self._path(key), "rb") as infile:
+         program = infile.read()
+      # the modification time orders the disk cache
+      os.utime(self._path(key))
+      self._remember(key, program)
+      self.last_source = "disk"
+      return program
+
+   def _store(self, key, program):
+      self._remember(key, program)
+      if self.cache_dir is None:
+         return
+      os.makedirs(self.cache_dir, exist_ok=True)
+      tmp_path = self._path(key) + ".tmp"
+      with open(tmp_path, "wb") as outfile:
+         outfile.write(program)
+      os.replace(tmp_path, self._path(key))
+
+      cached = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".gcode")]
+      cached.sort(key=os.path.getmtime)
+      for path in cached[:max(0, len(cached) - self.disk_entries)]:
+         os.remove(path)
+
+   def _remember(self, key, program):
+      self._memory[key] = program
+      self._memory.move_to_end(key)
+      while len(self._memory) > self.memory_entries:
+         self._memory.popitem(last=False)
+
+   def clear(self):
+      """
+      Empties the memory and disk caches
+      """
+      self._memory.clear()
+      if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+         for name in os.listdir(self.cache_dir):
+            if name.endswith(".gcode"):
+               os.remove(os.path.join(self.cache_dir, name))
+
+
+def count_polylines(program):
+   """
+   returns:
+      (int) number of polylines in a compiled program
+   """
+   return program.count(POLYLINE_MARKER.encode())
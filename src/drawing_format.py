@@ -0,0 +1,241 @@
+'''
+    File name: drawing_format.py
+    Columnar binary drawings (.dxd): the x, y, a, p values of all targets as contiguous
+    columns, plus the offsets of the strokes, so a drawing can be memory mapped.
+
+    Layout, all little-endian:
+        magic     8 bytes, b"DXDRAW01"
+        length    uint32, size of the header
+        header    JSON, padded with spaces to a multiple of 64 bytes from the file start:
+                  {"dtype", "n_points", "n_strokes", "columns", "integer_columns",
+                   "offsets_at", "columns_at"}
+        offsets   int64 x (n_strokes + 1), stroke i is targets offsets[i]:offsets[i+1]
+        columns   dtype x n_points each, in the order of "columns"
+
+    iter_json_strokes reads the strokes of a JSON drawing one at a time, without loading the file.
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import json
+import re
+import struct
+import numpy as np
+
+
+##########################################################################################
+###### Constants
+##########################################################################################
+MAGIC = b"DXDRAW01"
+COLUMNS = ("x", "y", "a", "p")
+ALIGNMENT = 64
+EXTENSION = ".dxd"
+# where the list of strokes starts in a JSON drawing
+STROKES_PATTERN = re.compile(r'"strokes"\s*:\s*\[')
+CHUNK_SIZE = 1 << 20
+
+
+##########################################################################################
+###### Conversion
+##########################################################################################
+def dict_to_columns(drawing_dic, dtype="float64"):
+   """
+   Converts a drawing in the JSON schema to columns, by key so the order of the keys does not matter
+
+   Args:
+      drawing_dic (dict): {"drawing": {"strokes": [[{"x", "y", "a", "p"}, ...], ...]}}
+      dtype (string): "float64", or "float32" for half the size
+   returns:
+      columns (dict): name -> numpy.ndarray of all the targets
+      offsets (numpy.ndarray): int64, n_strokes + 1 start offsets
+      integer_columns (list): names of the columns that only hold integers in the JSON data
+   """
+   strokes = drawing_dic["drawing"]["strokes"]
+   offsets = np.zeros(len(strokes) + 1, dtype=np.int64)
+   offsets[1:] = np.cumsum([len(stroke) for stroke in strokes])
+   columns = {}
+   integer_columns = []
+   for name in COLUMNS:
+      values = [point[name] for stroke in strokes for point in stroke]
+      columns[name] = np.asarray(values, dtype=dtype).reshape(-1)
+      if all(type(value) is int for value in values):
+         integer_columns.append(name)
+   return columns, offsets, integer_columns
+
+
+def columns_to_dict(columns, offsets, integer_columns=()):
+   """
+   Converts columns back to a drawing in the JSON schema, see dict_to_columns
+   """
+   as_python = {}
+   for name in COLUMNS:
+      values = np.asarray(columns[name])
+      as_python[name] = values.astype(np.int64).tolist() if name in integer_columns else values.astype(float).tolist()
+   strokes = []
+   for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+      strokes.append([{name: as_python[name][i] for name in COLUMNS} for i in range(start, end)])
+   return {"drawing": {"strokes": strokes}}
+
+
+##########################################################################################
+###### Files
+##########################################################################################
+def write_drawing(path, columns, offsets, integer_columns=(), dtype=None):
+   """
+   Writes columns and offsets as a .dxd file
+
+   Args:
+      path (string): where to write
+      columns (dict): name -> numpy.ndarray, see dict_to_columns
+      offsets (numpy.ndarray): stroke offsets
+      integer_columns (list): columns to write back as integers in JSON
+      dtype (string): the dtype of the columns, the dtype of columns["x"] by default
+   """
+   dtype = np.dtype(dtype or np.asarray(columns["x"]).dtype).newbyteorder("<")
+   n_points = int(offsets[-1])
+   n_strokes = len(offsets) - 1
+
+   def header_for(offsets_at):
+      columns_at = [offsets_at + 8*(n_strokes + 1) + i*dtype.itemsize*n_points for i in range(len(COLUMNS))]
+      return {"dtype": dtype.str,
+              "n_points": n_points,
+              "n_strokes": n_strokes,
+              "columns": list(COLUMNS),
+              "integer_columns": list(integer_columns),
+              "offsets_at": offsets_at,
+              "columns_at": columns_at}
+
+   # the header holds the offsets of the data that follows it, grow it until it fits
+   offsets_at = ALIGNMENT
+   while True:
+      header = json.dumps(header_for(offsets_at)).encode()
+      if len(MAGIC) + 4 + len(header) <= offsets_at:
+         break
+      offsets_at += ALIGNMENT
+   header = header.ljust(offsets_at - len(MAGIC) - 4)
+
+   with open(path, "wb") as outfile:
+      outfile.write(MAGIC)
+      outfile.write(struct.pack("<I", len(header)))
+      outfile.write(header)
+      outfile.write(np.asarray(offsets, dtype="<i8").tobytes())
+      for name in COLUMNS:
+         outfile.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+
+def read_header(path):
+   """
+   returns:
+      header (dict) of a .dxd file
+   """
+   with open(path, "rb") as infile:
+      if infile.read(len(MAGIC)) != MAGIC:
+         raise ValueError("{} is not a .dxd drawing".format(path))
+      (length,) = struct.unpack("<I", infile.read(4))
+      return json.loads(infile.read(length).decode())
+
+
+def read_drawing(path, mmap=True):
+   """
+   Reads a .dxd file
+
+   Args:
+      path (string): the file
+      mmap (bool): map the file instead of reading it, the arrays are then read-only
+   returns:
+      columns (dict): name -> numpy.ndarray
+      offsets (numpy.ndarray): stroke offsets
+      integer_columns (list): columns that were integers in JSON
+   """
+   header = read_header(path)
+   dtype = np.dtype(header["dtype"])
+   n_points, n_strokes = header["n_points"], header["n_strokes"]
+
+   if mmap:
+      data = np.memmap(path, dtype=np.uint8, mode="r")
+   else:
+      with open(path, "rb") as infile:
+         data = infile.read()
+   load = lambda kind, at, count: np.frombuffer(data, dtype=kind, count=count, offset=at)
+
+   offsets = load(np.dtype("<i8"), header["offsets_at"], n_strokes + 1)
+   columns = {name: load(dtype, at, n_points) for name, at in zip(header["columns"], header["columns_at"])}
+   return columns, offsets, header["integer_columns"]
+
+
+def json_file_to_drawing(json_path, path, dtype="float64"):
+   """
+   Converts a JSON drawing file to a .dxd file
+   """
+   with open(json_path) as infile:
+      columns, offsets, integer_columns = dict_to_columns(json.load(infile), dtype)
+   write_drawing(path, columns, offsets, integer_columns)
+
+
+def drawing_to_json_file(path, json_path):
+   """
+   Converts a .dxd file back to a JSON drawing file
+   """
+   columns, offsets, integer_columns = read_drawing(path, mmap=False)
+   with open(json_path, "w") as outfile:
+      json.dump(columns_to_dict(columns, offsets, integer_columns), outfile, indent=4)
+
+
+##########################################################################################
+###### Streaming JSON
+##########################################################################################
+def iter_json_strokes(json_path, chunk_size=CHUNK_SIZE):
+   """
+   Reads the strokes of a JSON drawing one at a time, as the file is read, so memory holds about
+   one chunk and one stroke however large the file is
+
+   Args:
+      json_path (string): the JSON drawing, i.e.: "./data/path_data.json"
+      chunk_size (int): characters read at a time, grown for strokes larger than a chunk
+   yields:
+      stroke (numpy.ndarray): (n, 4) x, y, a, p of the targets of each stroke, in file order,
+                              empty strokes are skipped
+   """
+   decoder = json.JSONDecoder()
+   with open(json_path) as infile:
+      buffer = ""
+      at = None
+      eof = False
+      # find the list of strokes, keeping enough of each chunk for a key split across chunks
+      while at is None:
+         chunk = infile.read(chunk_size)
+         eof = len(chunk) == 0
+         buffer += chunk
+         match = STROKES_PATTERN.search(buffer)
+         if match is not None:
+            at = match.end()
+         elif eof:
+            raise ValueError("{} has no drawing.strokes list".format(json_path))
+         else:
+            buffer = buffer[-64:]
+
+      while True:
+         # skip to the next stroke
+         while at < len(buffer) and buffer[at] in " \t\r\n,":
+            at += 1
+         if at < len(buffer) and buffer[at] == "]":
+            return
+         try:
+            if at == len(buffer):
+               raise ValueError("end of buffer")
+            stroke, end = decoder.raw_decode(buffer, at)
+         except ValueError:
+            # the stroke continues in the next chunk, or the file is broken
+            if eof:
+               raise ValueError("{} ends inside drawing.strokes".format(json_path))
+            chunk = infile.read(max(chunk_size, len(buffer) - at))
+            eof = len(chunk) == 0
+            buffer = buffer[at:] + chunk
+            at = 0
+            continue
+         at = end
+         if len(stroke) == 0:
+            # nothing to draw, and Drawing drops them too
+            continue
+         yield np.asarray([[point["x"], point["y"], point["a"], point["p"]] for point in stroke],
+                          dtype=float).reshape(-1, 4)
@@ -0,0 +1,369 @@
+'''
+    File name: fleet.py
+    Several arms drawing one drawing together, i.e., side by side over a shared or tiled sheet.
+
+    The drawing is given in sheet coordinates and cut across x into one band per arm, with
+    about the same drawing time in each. The arms draw their bands at the same time, and never
+    come closer than keep_out to each other: a band only holds the polylines that stay keep_out/2
+    away from its cuts. The polylines near a cut, its seam, are drawn after the bands by the arm on
+    its left, at the same time as the seams that are keep_out away, while the other arms wait at home.
+
+        fleet = Fleet(dp, keep_out=40)
+        fleet.add(Dexarm("/dev/ttyACM0"), offset=(150, 0))
+        fleet.add(Dexarm("/dev/ttyACM1"), offset=(450, 0))
+        fleet.draw(drawing)
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import threading
+import time
+
+import numpy as np
+
+from src.drawing_compiler import Drawing_compiler
+from src.josn_interface import Drawing
+
+
+##########################################################################################
+###### Constants
+##########################################################################################
+# the feedrate of Dexarm.move_to, in mm/min
+FEEDRATE = 2000.
+# mm/s^2, as in Dexarm_simulator
+ACCELERATION = 500.
+
+
+##########################################################################################
+###### Estimating and partitioning
+##########################################################################################
+def move_time(distance, feedrate=FEEDRATE, acceleration=ACCELERATION):
+   """
+   Duration of moves that start and end at rest, with the trapezoidal velocity profile of
+   Dexarm_simulator.motion_time
+
+   Args:
+      distance (numpy.ndarray): length of every move in mm
+      feedrate (float): cruise speed in mm/min
+      acceleration (float): in mm/s^2
+   returns:
+      (numpy.ndarray) seconds
+   """
+   distance = np.asarray(distance, dtype=float)
+   speed = feedrate/60.
+   cruise = distance/speed + speed/acceleration
+   # triangular profile, never reaches the cruise speed
+   triangle = 2*np.sqrt(np.maximum(distance, 0.)/acceleration)
+   return np.where(distance <= 0, 0., np.where(distance >= speed*speed/acceleration, cruise, triangle))
+
+
+def stroke_times(drawing, dp, feedrate=FEEDRATE, acceleration=ACCELERATION):
+   """
+   Estimated seconds the arm spends on every polyline, as Drawing_processor.draw runs it:
+   lowering the pen, the moves between targets, lifting the pen and the dwells. The pen-up
+   travel to the polyline is left out, it depends on the order the polylines are drawn in.
+
+   Args:
+      drawing (Drawing): the polylines
+      dp (Drawing_processor): the drawing settings
+   returns:
+      (numpy.ndarray) seconds per polyline
+   """
+   times = np.zeros(len(drawing))
+   if drawing.n_points == 0:
+      return times
+   lengths = drawing.lengths()
+   z = dp.base_z + drawing.points[:, 3]*dp.pressure_factor
+   xyz = np.column_stack([drawing.points[:, :2], z])
+   segments = np.linalg.norm(np.diff(xyz, axis=0), axis=1)
+   stroke = drawing.stroke_index()
+   same = stroke[1:] == stroke[:-1]
+   times += np.bincount(stroke[1:][same], weights=move_time(segments[same], feedrate, acceleration),
+                        minlength=len(drawing))
+
+   drawn = lengths > 0
+   first = drawing.offsets[:-1][drawn]
+   last = drawing.offsets[1:][drawn] - 1
+   times[drawn] += move_time(np.abs(dp.safe_z_val - z[first]), feedrate, acceleration)
+   times[drawn] += move_time(np.abs(z[last] - dp.safe_z_val), feedrate, acceleration)
+   if dp.continuous:
+      times[drawn] += dp.pen_down_dwell + dp.pen_up_dwell
+   else:
+      times += lengths*dp.target_dwell
+      times[drawn] += dp.polyline_dwell
+   return times
+
+
+def partition(drawing, times, n_parts, keep_out, axis=0, slack=0.1, candidates=64):
+   """
+   Cuts a drawing into n_parts bands across axis with about the same time in each. Every cut
+   is searched within slack of the span around the balanced position, for the one with the least
+   time in polylines that come closer than keep_out/2 to it.
+
+   Args:
+      drawing (Drawing): the polylines
+      times (numpy.ndarray): seconds per polyline, see stroke_times
+      n_parts (int): number of bands
+      keep_out (float): distance kept between the bands, in mm
+      axis (int): 0 to cut across x, 1 across y
+      slack (float): fraction of the span a cut may move away from the balanced position
+      candidates (int): positions tried for every cut
+   returns:
+      part (numpy.ndarray): int, the band of every polyline, by its center, and for the polylines
+                            of a seam the band left of their cut
+      seam (numpy.ndarray): bool, True for the polylines closer than keep_out/2 to a cut
+      cuts (list): the n_parts - 1 cut positions, increasing
+   """
+   part = np.zeros(len(drawing), dtype=np.int64)
+   seam = np.zeros(len(drawing), dtype=bool)
+   drawn = drawing.lengths() > 0
+   if n_parts <= 1 or not drawn.any():
+      return part, seam, []
+
+   values = drawing.points[:, axis]
+   starts = drawing.offsets[:-1][drawn]
+   low = np.minimum.reduceat(values, starts)
+   high = np.maximum.reduceat(values, starts)
+   t = np.asarray(times, dtype=float)[drawn]
+   center = (low + high)/2
+   total = t.sum()
+   margin = keep_out/2.
+   window = slack*(high.max() - low.min())
+
+   # time of the polylines entirely before, and entirely after, a position
+   by_center = np.argsort(center, kind="stable")
+   center_time = np.cumsum(t[by_center])
+   by_high = np.argsort(high, kind="stable")
+   high_time = np.concatenate([[0.], np.cumsum(t[by_high])])
+   by_low = np.argsort(low, kind="stable")
+   low_time = np.concatenate([[0.], np.cumsum(t[by_low])])
+
+   cuts = []
+   for k in range(1, n_parts):
+      target = total*k/n_parts
+      balanced = center[by_center][min(np.searchsorted(center_time, target), len(t) - 1)]
+      positions = np.linspace(balanced - window, balanced + window, candidates)
+      if cuts:
+         # a band is never narrower than the keep-out
+         positions = np.maximum(positions, cuts[-1] + keep_out)
+      before = high_time[np.searchsorted(high[by_high], positions - margin, side="right")]
+      after = total - low_time[np.searchsorted(low[by_low], positions + margin, side="left")]
+      crossing = total - before - after
+      # the polylines near the cut are drawn by one arm alone, their time counts in full
+      cost = crossing + np.abs(before + crossing/2 - target)
+      cuts.append(float(positions[np.argmin(cost)]))
+
+   edges = np.asarray(cuts)
+   band = np.searchsorted(edges, center)
+   lower = np.concatenate([[-np.inf], edges + margin])[band]
+   upper = np.concatenate([edges - margin, [np.inf]])[band]
+   near_cut = (low < lower) | (high > upper)
+   # the seam of a cut is drawn by the arm on its left
+   nearest = np.argmin(np.abs(center[:, None] - edges[None, :]), axis=1)
+   part[drawn] = np.where(near_cut, nearest, band)
+   seam[drawn] = near_cut
+   return part, seam, cuts
+
+
+def seam_rounds(extents, keep_out):
+   """
+   Groups seams that can be drawn at the same time, their extents keep_out apart
+
+   Args:
+      extents (list): (low, high) of every seam, None for an empty one
+      keep_out (float): the least distance between two pens, in mm
+   returns:
+      rounds (list): lists of the indices of the seams drawn together
+   """
+   rounds = []
+   for i, extent in enumerate(extents):
+      if extent is None:
+         continue
+      for seams in rounds:
+         if all(extent[0] - extents[j][1] >= keep_out or extents[j][0] - extent[1] >= keep_out for j in seams):
+            seams.append(i)
+            break
+      else:
+         rounds.append([i])
+   return rounds
+
+
+##########################################################################################
+###### Classes
+##########################################################################################
+class Fleet_arm(object):
+   """
+   An arm of a fleet, and where it stands on the sheet
+   """
+   def __init__(self, arm, offset=(0, 0), rotation=0., name=""):
+      """
+      Args:
+         arm (Dexarm): the connection to the arm
+         offset (tuple): x, y on the sheet of the origin of the arm, in mm
+         rotation (float): degrees the axes of the arm are turned counterclockwise from the sheet
+         name (string): shown in reports and thread names
+      """
+      self.arm = arm
+      self.offset = np.asarray(offset, dtype=float)
+      self.rotation = rotation
+      self.name = name
+
+   def _matrix(self, degrees):
+      t = np.radians(degrees)
+      return np.array([[np.cos(t), -np.sin(t)], [np.sin(t), np.cos(t)]])
+
+   def to_arm(self, drawing):
+      """
+      returns:
+         drawing (Drawing): a drawing in sheet coordinates, in the coordinates of the arm
+      """
+      matrix = self._matrix(-self.rotation)
+      return drawing.transform(matrix, -matrix @ self.offset)
+
+   def to_sheet(self, drawing):
+      """
+      returns:
+         drawing (Drawing): a drawing in the coordinates of the arm, in sheet coordinates
+      """
+      return drawing.transform(self._matrix(self.rotation), self.offset)
+
+
+class Fleet(object):
+   """
+   Draws one drawing on several arms at once, see the module docstring.
+
+   The arms are added in the order of the bands, i.e., from left to right across the sheet, and
+   each should stand in front of its band so that it is clear of the other bands when it is home.
+   The pen of an arm is what is kept away from the other pens, not its links.
+   """
+   def __init__(self, dp, keep_out=40., axis=0, compiler=None, window=None,
+                feedrate=FEEDRATE, acceleration=ACCELERATION):
+      """
+      Args:
+         dp (Drawing_processor): the drawing settings, used for every arm
+         keep_out (float): the least distance between two pens, in mm
+         axis (int): 0 to put the arms side by side along x, 1 along y
+         compiler (Drawing_compiler): compiles the program of every arm, one without a disk cache by default
+         window (int): number of commands in flight on every arm, see Dexarm.stream_program
+         feedrate, acceleration (float): of the arms, to estimate the drawing time
+      """
+      self.dp = dp
+      self.keep_out = keep_out
+      self.axis = axis
+      self.compiler = compiler if compiler is not None else Drawing_compiler(cache_dir=None)
+      self.window = window
+      self.feedrate = feedrate
+      self.acceleration = acceleration
+      self.members = []
+      # what the last plan and draw did
+      self.report = {}
+
+   def add(self, arm, offset=(0, 0), rotation=0., name=None):
+      """
+      Adds the next arm across the sheet, see Fleet_arm for the arguments
+
+      returns:
+         member (Fleet_arm)
+      """
+      member = Fleet_arm(arm, offset, rotation, name if name is not None else "arm {}".format(len(self.members)))
+      self.members.append(member)
+      return member
+
+   def plan(self, drawing):
+      """
+      Partitions a drawing between the arms and compiles the program of every arm
+
+      Args:
+         drawing (Drawing or list of numpy.ndarray): polylines in sheet coordinates
+      returns:
+         phases (list): the phases of the drawing, one after the other, each a list of the
+                        (member, program) pairs to run at the same time: the bands, then the seams
+      """
+      if not self.members:
+         raise ValueError("fleet: no arms were added")
+      drawing = Drawing.from_polylines(drawing)
+      times = stroke_times(drawing, self.dp, self.feedrate, self.acceleration)
+      part, seam, cuts = partition(drawing, times, len(self.members), self.keep_out, self.axis)
+
+      bands = []
+      seams = []
+      report = {"cuts": cuts, "arms": [], "single_arm_time": float(times.sum())}
+      for i, member in enumerate(self.members):
+         in_band = np.nonzero((part == i) & ~seam)[0]
+         in_seam = np.nonzero((part == i) & seam)[0]
+         bands.append((member, self._compile(member, drawing.take(in_band))))
+         seams.append((member, self._compile(member, drawing.take(in_seam))))
+         report["arms"].append({"name": member.name,
+                                "strokes": len(in_band),
+                                "seam_strokes": len(in_seam),
+                                "band_time": float(times[in_band].sum()),
+                                "seam_time": float(times[in_seam].sum()),
+                                "extent": self._extent(drawing.take(in_band)),
+                                "seam_extent": self._extent(drawing.take(in_seam))})
+
+      rounds = seam_rounds([arm["seam_extent"] for arm in report["arms"]], self.keep_out)
+      report["seam_rounds"] = rounds
+      report["estimated_time"] = (max(arm["band_time"] for arm in report["arms"]) +
+                                  sum(max(report["arms"][i]["seam_time"] for i in seams_together)
+                                      for seams_together in rounds))
+      self.report = report
+      return [bands] + [[seams[i] for i in seams_together] for seams_together in rounds]
+
+   def _extent(self, drawing):
+      box = drawing.bounding_box()
+      return None if box is None else (box[self.axis], box[self.axis + 2])
+
+   def _compile(self, member, drawing):
+      if len(drawing) == 0:
+         return None
+      return self.compiler.compile(self.dp, self.dp.prepare(member.to_arm(drawing)))
+
+   def draw(self, drawing):
+      """
+      Draws a drawing in sheet coordinates, the phases of plan one after the other.
+      Every program ends with the arm at home.
+
+      Args:
+         drawing (Drawing or list of numpy.ndarray): polylines in sheet coordinates
+      returns:
+         report (dict): see plan, with band_wall_time and seam_wall_time in seconds
+      """
+      phases = self.plan(drawing)
+      start = time.perf_counter()
+      self._stream(phases[0])
+      bands_done = time.perf_counter()
+      for phase in phases[1:]:
+         self._stream(phase)
+      self.report["band_wall_time"] = bands_done - start
+      self.report["seam_wall_time"] = time.perf_counter() - bands_done
+      return self.report
+
+   def _stream(self, jobs):
+      """
+      Streams (member, program) jobs in parallel, and raises the first error once all of them ended
+      """
+      errors = []
+
+      def stream(member, program):
+         try:
+            member.arm.stream_program(program, self.window)
+         except Exception as error:
+            errors.append(error)
+
+      threads = [threading.Thread(target=stream, args=(member, program), name="fleet " + member.name)
+                 for member, program in jobs if program is not None]
+      for thread in threads:
+         thread.start()
+      for thread in threads:
+         thread.join()
+      if errors:
+         raise errors[0]
+
+   def emergency_stop(self):
+      """
+      Stops all arms, see Dexarm.emergency_stop
+
+      returns:
+         tickets (list): of the M410 of every arm
+      """
+      return [member.arm.emergency_stop() for member in self.members]
@@ -0,0 +1,183 @@
+import re
+
+
+WORD_PATTERN = re.compile(r"([A-Z])\s*([-+]?\d*\.?\d*)")
+
+AXES = "XYZE"
+
+
+def format_number(value, precision):
+    """
+    Format a coordinate with at most precision decimals and no trailing zeros.
+
+    Args:
+        value (float): the coordinate
+        precision (int): number of decimals, 0 rounds to whole millimetres
+
+    Returns:
+        string, i.e., "12", "12.5", "-0.25"
+    """
+    text = "%.*f" % (precision, value)
+    if precision > 0:
+        text = text.rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        text = "0"
+    return text
+
+
+class Gcode_optimizer:
+    """ Peephole optimizer that tracks the modal state of the arm
+
+    It remembers the current motion mode (G0/G1), feedrate and the last commanded value of
+    every axis, and uses them to:
+        * drop words that did not change (F, and axes that are already at the target)
+        * drop moves that do not move anything
+        * merge consecutive dwells (G4) into one
+
+    Commands are fed one at a time with feed(), which returns the lines to actually send.
+    A dwell is held back until the next command, so call flush() to get it at the end.
+
+        optimizer = Gcode_optimizer(precision=1)
+        optimizer.feed("G1F2000X10Y300Z-20\\r\\n")   # ['G1F2000X10Y300Z-20\\r\\n']
+        optimizer.feed("G1F2000X10Y300Z-40\\r\\n")   # ['G1Z-40\\r\\n']
+    """
+
+    def __init__(self, precision=0):
+        """
+        Args:
+            precision (int): number of decimals sent for coordinates, 0 for whole millimetres
+        """
+        self.precision = precision
+        self.mode = None
+        self.feedrate = None
+        self.position = dict.fromkeys(AXES)
+        self.pending_dwell = None
+        self.dropped = 0
+
+    def reset(self):
+        """
+        Forget the modal state, i.e., after the arm was reset or moved by hand.
+        """
+        self.mode = None
+        self.feedrate = None
+        self.position = dict.fromkeys(AXES)
+
+    def encode_move(self, x=None, y=None, z=None, e=None, feedrate=2000, mode="G1"):
+        """
+        Encode a linear move, see Dexarm.move_to.
+
+        Returns:
+            list of command strings to send, empty if the move is a no-op
+        """
+        words = ""
+        for axis, value in zip(AXES, (x, y, z, e)):
+            if value is None:
+                continue
+            text = format_number(value, self.precision)
+            if self.position[axis] != text:
+                words = words + axis + text
+                self.position[axis] = text
+        if len(words) == 0:
+            self.dropped += 1
+            return []
+
+        if mode != self.mode:
+            # feedrate may be kept per mode by the firmware, send it again
+            self.mode = mode
+            self.feedrate = None
+        cmd = mode
+        if feedrate is not None and feedrate != self.feedrate:
+            cmd = cmd + "F" + str(feedrate)
+            self.feedrate = feedrate
+        return self._take_dwell() + [cmd + words + "\r\n"]
+
+    def dwell(self, seconds):
+        """
+        Queue a dwell, merged with the dwells right before or after it.
+
+        Returns:
+            an empty list, the dwell is sent with the next command or flush()
+        """
+        if self.pending_dwell is None:
+            self.pending_dwell = seconds
+        else:
+            self.pending_dwell += seconds
+            self.dropped += 1
+        return []
+
+    def feed(self, data):
+        """
+        Optimize one command line.
+
+        Args:
+            data (string): the command, terminated with a line ending
+
+        Returns:
+            list of command strings to send instead
+        """
+        if data.lstrip().startswith(";"):
+            # a comment, i.e., the progress markers of Drawing_compiler, changes nothing
+            return self._take_dwell() + [data]
+        words = WORD_PATTERN.findall(data.upper())
+        if len(words) == 0:
+            return self._take_dwell() + [data]
+        code = words[0][0] + words[0][1]
+        params = {}
+        for letter, value in words[1:]:
+            try:
+                params[letter] = float(value)
+            except ValueError:
+                params[letter] = None
+
+        if code in ("G0", "G1", "G00", "G01"):
+            mode = "G" + str(int(float(words[0][1])))
+            feedrate = params.get("F")
+            if feedrate is not None and feedrate == int(feedrate):
+                feedrate = int(feedrate)
+            return self.encode_move(params.get("X"), params.get("Y"), params.get("Z"), params.get("E"),
+                                    feedrate=feedrate, mode=mode)
+
+        if code == "G4":
+            seconds = (params.get("S") or 0.) + (params.get("P") or 0.)/1000.
+            return self.dwell(seconds)
+
+        if code == "G92":
+            for axis in AXES:
+                if axis in params:
+                    self.position[axis] = format_number(params[axis] or 0., self.precision)
+        elif code in ("M1112", "M2005", "M410") or (code == "M888" and "P" in params):
+            # homing, the rail or a new module moves the reference, quick stop drops the planned moves
+            self.reset()
+        return self._take_dwell() + [data]
+
+    def flush(self):
+        """
+        Returns:
+            list with the held back dwell, if any
+        """
+        return self._take_dwell()
+
+    def optimize(self, lines):
+        """
+        Optimize a whole program.
+
+        Args:
+            lines (iterable of string): command lines, terminated with line endings
+
+        Returns:
+            list of command strings
+        """
+        program = []
+        for line in lines:
+            program.extend(self.feed(line))
+        program.extend(self.flush())
+        return program
+
+    def _take_dwell(self):
+        if self.pending_dwell is None:
+            return []
+        seconds = self.pending_dwell
+        self.pending_dwell = None
+        if seconds == int(seconds):
+            return ["G4 S" + str(int(seconds)) + "\r"]
+        return ["G4 P" + str(int(round(seconds*1000))) + "\r"]
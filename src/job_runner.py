@@ -0,0 +1,280 @@
+'''
+    File name: job_runner.py
+    Runs drawing jobs on a worker thread, one at a time, so the app stays responsive while the
+    arm draws. Jobs can be paused, resumed and cancelled, and report their progress.
+
+        runner = Job_runner()
+        job_id = runner.submit(arm, program)
+        runner.status(job_id)   # {"state": "running", "commands_done": 120, ...}
+        runner.pause(job_id)
+'''
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from src.drawing_compiler import POLYLINE_MARKER
+from src.pydexarm import Arm_stopped
+from src.tracing import tracer
+
+
+QUEUED = "queued"
+COMPILING = "compiling"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+CANCELLED = "cancelled"
+# ended by Dexarm.emergency_stop()
+STOPPED = "stopped"
+FAILED = "failed"
+FINISHED = (DONE, CANCELLED, STOPPED, FAILED)
+
+
+class Drawing_job:
+    """ One program to stream to an arm, and how far it got
+    """
+
+    def __init__(self, job_id, arm, program, window=None, name="", on_cancel=None):
+        """
+        Args:
+            job_id (int): the id given by Job_runner
+            arm (Dexarm): the arm to draw on
+            program (bytes): compiled G-code (see Drawing_compiler), or a function returning it,
+                             called on the worker so compiling does not block the caller
+            window (int): number of commands in flight, see Dexarm.streaming
+            name (string): shown with the status
+            on_cancel (function): called with the arm after a cancelled job stopped, i.e., to lift the pen
+        """
+        self.id = job_id
+        self.arm = arm
+        self.program = program
+        self.window = window
+        self.name = name
+        self.on_cancel = on_cancel
+        # an emergency stop of the arm after the job was submitted ends it
+        self.stop_generation = arm.stop_generation
+
+        self.state = QUEUED
+        self.error = None
+        self.commands_total = None
+        self.commands_done = 0
+        self.strokes_total = None
+        self.strokes_done = 0
+        self.created = time.time()
+        self.finished = None
+        # seconds spent streaming, pauses excluded, for the ETA
+        self.active_time = 0.
+        self._active_since = None
+
+        self._cancel = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+
+    def status(self):
+        """
+        Returns:
+            dict with state, progress (0 to 1), commands_done/total, strokes_done/total,
+            elapsed and eta (seconds, None while unknown) and error
+        """
+        active_time = self.active_time
+        if self._active_since is not None:
+            active_time += time.perf_counter() - self._active_since
+        eta = None
+        if self.state in (RUNNING, PAUSED) and self.commands_done and self.commands_total:
+            rate = self.commands_done/max(active_time, 1e-6)
+            eta = (self.commands_total - self.commands_done)/rate
+        progress = 0.
+        if self.commands_total:
+            progress = self.commands_done/self.commands_total
+        elif self.state == DONE:
+            progress = 1.
+        return {"id": self.id,
+                "name": self.name,
+                "state": self.state,
+                "progress": progress,
+                "commands_done": self.commands_done,
+                "commands_total": self.commands_total,
+                "strokes_done": self.strokes_done,
+                "strokes_total": self.strokes_total,
+                "elapsed": active_time,
+                "eta": eta,
+                "error": self.error}
+
+    def _start_clock(self):
+        self._active_since = time.perf_counter()
+
+    def _stop_clock(self):
+        if self._active_since is not None:
+            self.active_time += time.perf_counter() - self._active_since
+            self._active_since = None
+
+
+class Job_runner:
+    """ A queue of drawing jobs and the worker thread that runs them
+
+    While a job runs the worker owns the arm: anything else that wants to send commands should
+    check busy() first.
+    """
+
+    def __init__(self, history=32):
+        """
+        Args:
+            history (int): finished jobs kept for status()
+        """
+        self.history = history
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._work, name="drawing jobs", daemon=True)
+        self._worker.start()
+
+    def submit(self, arm, program, window=None, name="", on_cancel=None):
+        """
+        Queue a program, see Drawing_job for the arguments.
+
+        Returns:
+            job_id (int)
+        """
+        job = Drawing_job(next(self._ids), arm, program, window, name, on_cancel)
+        self.jobs[job.id] = job
+        self._forget_old_jobs()
+        self._queue.put(job)
+        return job.id
+
+    def status(self, job_id):
+        """
+        Returns:
+            dict, see Drawing_job.status, None for an unknown job
+        """
+        job = self.jobs.get(job_id)
+        return job.status() if job is not None else None
+
+    def busy(self):
+        """
+        Returns:
+            True while a job is queued, running or paused
+        """
+        return any(job.state not in FINISHED for job in list(self.jobs.values()))
+
+    def pause(self, job_id):
+        """
+        Stop sending commands, the moves already in the planner of the arm still run.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None and job.state not in FINISHED:
+            job._resume.clear()
+
+    def resume(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job._resume.set()
+
+    def cancel(self, job_id):
+        """
+        Stop the job after the command being sent, then run its on_cancel. A job that is queued
+        or compiling ends before sending anything, once its compile is over, without on_cancel.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job._cancel.set()
+            # a paused job has to wake up to stop
+            job._resume.set()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Arm_stopped:
+                job.state = STOPPED
+            except Exception as error:
+                job.state = FAILED
+                job.error = "{}: {}".format(type(error).__name__, error)
+            finally:
+                job._stop_clock()
+                job.finished = time.time()
+
+    def _check_stop(self, job):
+        if job.arm.stop_generation != job.stop_generation:
+            raise Arm_stopped("pydexarm: emergency stop, drawing job {} not finished".format(job.id))
+
+    def _run(self, job):
+        self._check_stop(job)
+        if job._cancel.is_set():
+            job.state = CANCELLED
+            return
+
+        program = job.program
+        if callable(program):
+            job.state = COMPILING
+            with tracer.span("compile", category="job", job=job.id):
+                program = program()
+            # the compile is not interrupted, but nothing was sent yet
+            self._check_stop(job)
+            if job._cancel.is_set():
+                job.state = CANCELLED
+                return
+        lines = program.splitlines(keepends=True)
+        marker = POLYLINE_MARKER.encode()
+        job.strokes_total = sum(1 for line in lines if line.startswith(marker))
+        job.commands_total = sum(1 for line in lines if not line.startswith(b";"))
+
+        arm = job.arm
+        job.state = RUNNING
+        job._start_clock()
+        # the polyline being streamed, its commands and the time the window was full, for the trace
+        polyline, started, commands, blocked = None, None, 0, 0.
+        with arm.streaming(job.window):
+            for line in lines:
+                if not job._resume.is_set():
+                    job.state = PAUSED
+                    job._stop_clock()
+                    while not job._resume.wait(0.1):
+                        self._check_stop(job)
+                    job.state = RUNNING
+                    job._start_clock()
+                self._check_stop(job)
+                if job._cancel.is_set():
+                    break
+                if line.startswith(b";"):
+                    if line.startswith(marker):
+                        # the previous polylines are all sent
+                        job.strokes_done = int(line[len(marker):])
+                        tracer.complete("stream polyline", started, category="job", index=polyline,
+                                        commands=commands, blocked_on_arm=blocked)
+                        polyline, started, commands, blocked = job.strokes_done, tracer.clock(), 0, 0.
+                    continue
+                if started is None:
+                    arm._submit_line(line)
+                else:
+                    sent = time.perf_counter()
+                    arm._submit_line(line)
+                    # the window was full, the time went waiting for an "ok"
+                    blocked += time.perf_counter() - sent
+                    commands += 1
+                job.commands_done += 1
+            tracer.complete("stream polyline", started, category="job", index=polyline,
+                            commands=commands, blocked_on_arm=blocked)
+            waiting = tracer.clock()
+        # leaving streaming() waits for the last "ok"
+        tracer.complete("wait for the arm", waiting, category="job")
+        if arm.optimizer is not None:
+            # the program moved the arm behind the back of the optimizer
+            arm.optimizer.reset()
+
+        self._check_stop(job)
+        if job._cancel.is_set():
+            job._stop_clock()
+            if job.on_cancel is not None:
+                job.on_cancel(arm)
+                arm.flush()
+            job.state = CANCELLED
+        else:
+            job.strokes_done = job.strokes_total
+            job.state = DONE
@@ -5,6 +5,10 @@ import json
 import numpy as np
 import os
 
+from src.path_optimizer import merge_strokes, order_strokes, simplify_polyline, simplify_strokes
+from src import drawing_format
+from src.tracing import tracer
+
 
 ##########################################################################################
 ###### Test Variables
@@ -54,11 +58,200 @@ raw_data = {
 ##########################################################################################
 ###### Classes
 ##########################################################################################
+class Drawing(object):
+   """
+   A drawing as one (N, 4) array of x, y, a, p targets and the offsets of its polylines:
+   polyline i is points[offsets[i]:offsets[i+1]]. It can be used wherever a list of polylines
+   is expected; indexing and iterating return views of the points, not copies. Empty polylines
+   are dropped, so every polyline has a first and a last target.
+
+      drawing = Drawing.from_polylines(polyLines)
+      drawing[0]                            # the first polyline, (n, 4)
+      drawing.translate(10, 0).bounding_box()
+   """
+   __slots__ = ("points", "offsets")
+
+   def __init__(self, points, offsets):
+      """
+      Args:
+         points (numpy.ndarray): (N, 4) targets of all polylines, in drawing order
+         offsets (numpy.ndarray): (n_polylines + 1) start of every polyline in points, and N
+      """
+      self.points = np.asarray(points, dtype=float).reshape(-1, 4)
+      offsets = np.asarray(offsets, dtype=np.int64)
+      if len(offsets) > 1 and not np.all(offsets[1:] > offsets[:-1]):
+         # an empty polyline has no endpoints, keep the offsets that start a non empty one
+         keep = np.ones(len(offsets), dtype=bool)
+         keep[1:] = offsets[1:] > offsets[:-1]
+         offsets = offsets[keep]
+      self.offsets = offsets
+
+   @classmethod
+   def from_polylines(cls, polyLines):
+      """
+      Packs polylines, i.e., the arrays extract_ploylines used to return, or another Drawing
+      """
+      if isinstance(polyLines, cls):
+         return polyLines
+      polyLines = [np.asarray(pl, dtype=float).reshape(-1, 4) for pl in polyLines]
+      offsets = np.zeros(len(polyLines) + 1, dtype=np.int64)
+      offsets[1:] = np.cumsum([len(pl) for pl in polyLines])
+      points = np.concatenate(polyLines) if polyLines else np.empty((0, 4))
+      return cls(points, offsets)
+
+   @classmethod
+   def concat(cls, drawings):
+      """
+      Joins drawings, or lists of polylines, one after the other
+      """
+      drawings = [cls.from_polylines(d) for d in drawings]
+      if len(drawings) == 0:
+         return cls(np.empty((0, 4)), np.zeros(1, dtype=np.int64))
+      starts = np.cumsum([0] + [len(d.points) for d in drawings[:-1]])
+      offsets = np.concatenate([[0]] + [d.offsets[1:] + start for d, start in zip(drawings, starts)])
+      return cls(np.concatenate([d.points for d in drawings]), offsets)
+
+   def __len__(self):
+      return len(self.offsets) - 1
+
+   def __getitem__(self, i):
+      if isinstance(i, slice):
+         first, last, step = i.indices(len(self))
+         if step != 1:
+            return Drawing.from_polylines([self[j] for j in range(first, last, step)])
+         last = max(first, last)
+         return Drawing(self.points[self.offsets[first]:self.offsets[last]],
+                        self.offsets[first:last + 1] - self.offsets[first])
+      if i < 0:
+         i += len(self)
+      if not 0 <= i < len(self):
+         raise IndexError("polyline index out of range")
+      return self.points[self.offsets[i]:self.offsets[i + 1]]
+
+   def take(self, indices):
+      """
+      returns:
+         drawing (Drawing): the polylines at indices, in that order, copied in one array operation
+      """
+      indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+      lengths = self.lengths()[indices]
+      offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+      offsets[1:] = np.cumsum(lengths)
+      rows = np.repeat(self.offsets[:-1][indices] - offsets[:-1], lengths) + np.arange(offsets[-1])
+      return Drawing(self.points[rows], offsets)
+
+   def __iter__(self):
+      for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+         yield self.points[start:end]
+
+   def __repr__(self):
+      return "Drawing({} polylines, {} targets)".format(len(self), self.n_points)
+
+   @property
+   def n_points(self):
+      return len(self.points)
+
+   def lengths(self):
+      """
+      returns:
+         (numpy.ndarray) number of targets of every polyline
+      """
+      return np.diff(self.offsets)
+
+   def stroke_index(self):
+      """
+      returns:
+         (numpy.ndarray) (N,) the polyline every target belongs to
+      """
+      return np.repeat(np.arange(len(self)), self.lengths())
+
+   def starts(self):
+      """
+      returns:
+         (numpy.ndarray) (n, 4) first target of every polyline
+      """
+      return self.points[self.offsets[:-1]]
+
+   def ends(self):
+      """
+      returns:
+         (numpy.ndarray) (n, 4) last target of every polyline
+      """
+      return self.points[self.offsets[1:] - 1]
+
+   def bounding_box(self):
+      """
+      returns:
+         (tuple) x_min, y_min, x_max, y_max of all targets, None for an empty drawing
+      """
+      if self.n_points == 0:
+         return None
+      x_min, y_min = self.points[:, :2].min(axis=0).tolist()
+      x_max, y_max = self.points[:, :2].max(axis=0).tolist()
+      return x_min, y_min, x_max, y_max
+
+   def transform(self, matrix=None, offset=(0, 0), pressure_scale=1.):
+      """
+      Affine transform of x and y, as one array operation over all targets
+
+      Args:
+         matrix (2x2 array like): applied to every x, y, None for the identity
+         offset (tuple): dx, dy added after the matrix
+         pressure_scale (float): multiplies p
+      returns:
+         drawing (Drawing): a new drawing with the same polylines
+      """
+      points = self.points.copy()
+      if matrix is not None:
+         points[:, :2] = points[:, :2] @ np.asarray(matrix, dtype=float).T
+      points[:, :2] += np.asarray(offset, dtype=float)
+      points[:, 3] *= pressure_scale
+      return Drawing(points, self.offsets.copy())
+
+   def translate(self, dx, dy):
+      return self.transform(offset=(dx, dy))
+
+   def scale(self, sx, sy=None, origin=(0, 0)):
+      """
+      Scales x and y about origin, sy defaults to sx
+      """
+      sy = sx if sy is None else sy
+      origin = np.asarray(origin, dtype=float)
+      return self.transform(np.diag([sx, sy]), origin - origin*[sx, sy])
+
+   def rotate(self, degrees, origin=(0, 0)):
+      """
+      Rotates x and y counterclockwise about origin
+      """
+      t = np.radians(degrees)
+      matrix = np.array([[np.cos(t), -np.sin(t)], [np.sin(t), np.cos(t)]])
+      origin = np.asarray(origin, dtype=float)
+      return self.transform(matrix, origin - matrix @ origin)
+
+   def to_polylines(self):
+      """
+      returns:
+         polyLines (numpy.ndarray): object array of views of every polyline
+      """
+      polyLines = np.empty(len(self), dtype=object)
+      for i, pl in enumerate(self):
+         polyLines[i] = pl
+      return polyLines
+
+   def to_dict(self):
+      """
+      returns:
+         drawing_dic (dict): the drawing in the JSON schema
+      """
+      columns = {name: self.points[:, i] for i, name in enumerate(drawing_format.COLUMNS)}
+      return drawing_format.columns_to_dict(columns, self.offsets)
+
+
 class Drawing_processor(object):
    """
    Python class to convert a dictionary and into a JSON format and back
    """
-   def __init__(self, pressure_factor= -2, base_z = -45, safe_z_val = 0, slider = False ):
+   def __init__(self, pressure_factor= -2, base_z = -45, safe_z_val = 0, slider = False, stream_window = 1, continuous = False):
       """
       Args:
             pressure_factor (float): a quoefficient to make thickinsses based on pressure on paper
@@ -69,6 +262,12 @@ class Drawing_processor(object):
                                  drawing tool is not supposed to write on the paper
             slider (boolean): Determines if the robot is on a slider or not, if True, e value will
                               be sent to robot instead of x values.
+            stream_window (int): number of commands kept in flight while drawing, 1 waits for
+                                 an "ok" after each command, larger values stream the drawing
+                                 (see Dexarm.streaming)
+            continuous (boolean): draws each polyline as one uninterrupted motion, with dwells only
+                                  after the pen touches the paper and before it leaves it. If False,
+                                  the robot dwells after every target.
       """
 
       # this is the address were the json drawing file will be saved
@@ -78,14 +277,75 @@ class Drawing_processor(object):
       self.safe_z_val = safe_z_val
       self.base_z = base_z
       self.slider = slider
+      self.stream_window = stream_window
+      self.continuous = continuous
       self.json_object = None
 
+      # dwells in seconds, 0 to skip
+      # when not continuous: after each target, and after lifting the pen at the end of a polyline
+      self.target_dwell = 0.1
+      self.polyline_dwell = 0.1
+      # when continuous: after the pen touches the paper, and before it leaves it
+      self.pen_down_dwell = 0.1
+      self.pen_up_dwell = 0.1
+
+      # preprocessing stages applied by prepare()
+      # joins polylines whose endpoints are closer than this, in mm, None to keep them apart
+      self.merge_tolerance = None
+      # ... as long as their pressures differ less than this where they meet
+      self.merge_pressure_tolerance = 0.1
+      # drops targets that deviate less than this from the simplified stroke, in mm, None to keep all
+      self.simplify_tolerance = None
+      # reorders and reverses polylines to shorten the pen-up travel
+      self.optimize_order = False
+      # where the pen is when a drawing starts, x and y of the home position
+      self.home_position = (0, 300)
+      # what each stage did to the last drawing, by stage name
+      self.reports = {}
+
    def draw(self, arm, drawing):
+      """
+      Send drawing commands to the robot arm, streaming them if stream_window is larger than 1.
+      Raises Arm_stopped if emergency_stop() is called on the arm meanwhile.
+      Args:
+         arm (Arm): arm to run the drawing on 
+         drawing (Drawing): polylines to draw, see _draw_polylines,
+                                  or any iterable of them, i.e., iter_ploylines
+      returns:
+         None
+      """
+      if hasattr(arm, "streaming"):
+         # a window of 1 too, the stream is what stops the drawing on an emergency stop
+         with arm.streaming(self.stream_window):
+            self._draw_polylines(arm, drawing)
+      else:
+         self._draw_polylines(arm, drawing)
+
+   def draw_file(self, arm, json_path):
+      """
+      Draws a drawing file. Without the stages that need the whole drawing (merging and ordering),
+      the strokes are read while drawing, so the arm starts on the first stroke right away.
+      Args:
+         arm (Arm): arm to run the drawing on 
+         json_path (string): the drawing, i.e.: "./data/path_data.json"
+      returns:
+         None
+      """
+      if self.merge_tolerance or self.optimize_order:
+         self.draw(arm, self.prepare(self.extract_ploylines(json_path=json_path)))
+         return
+      self.reports = {}
+      polyLines = self.iter_ploylines(json_path)
+      if self.simplify_tolerance:
+         polyLines = (simplify_polyline(pl, self.simplify_tolerance, self.pressure_factor) for pl in polyLines)
+      self.draw(arm, polyLines)
+
+   def _draw_polylines(self, arm, drawing):
       """
       Send drawing commands to the robot arm
       Args:
          arm (Arm): arm to run the drawing on 
-         drawing (numpy.ndarray): list of polylines to draw, i.e.:
+         drawing (Drawing or list of numpy.ndarray): polylines to draw, i.e.:
                                     [array([[100. , 200. ,  15. ,   0.4],
                                             [300. , 400. ,  90. ,   0.5],
                                             [400. , 200. , 125. ,   1. ]])
@@ -98,19 +358,20 @@ class Drawing_processor(object):
       # motion to finish before sending the next
       wait_key = True
 
-      # just adds a small time delay between each motion
-      wait_val = 0.1
-
       # set the tool as rotary tool
       # arm.set_module_type(6)
    
       # loop over polylines
       for i, poly_line in enumerate(drawing):
+         started = tracer.clock()
          print ("poly line #{}".format(i))
+         if hasattr(arm, "mark_polyline"):
+            # lets a recorded program report its progress by polyline
+            arm.mark_polyline(i)
 
          # at any position, first make sure the pen is away
          # from the paper
-         current_pose = arm.get_current_position()
+         current_pose = self._current_pose(arm)
 
          if self.slider:
             arm.move_to(e= current_pose[3], y= current_pose[1], z = self.safe_z_val, wait= wait_key)
@@ -150,24 +411,121 @@ class Drawing_processor(object):
                print ("Getting to the next target: {}, {}, {}".format(x, y, z))
                arm.move_to(x= x, y= y, z= z, wait= wait_key)
 
-            arm.dealy_s(wait_val)
+            if not self.continuous:
+               self._dwell(arm, self.target_dwell)
+            elif j == 0:
+               # let the pen settle on the paper, the rest of the polyline runs without stopping
+               self._dwell(arm, self.pen_down_dwell)
+
+         if self.continuous:
+            self._dwell(arm, self.pen_up_dwell)
 
          # moves up from paper after the last target
-         current_pose = arm.get_current_position()
+         current_pose = self._current_pose(arm)
 
          if self.slider:
             arm.move_to(e= current_pose[3], y= current_pose[1], z = self.safe_z_val, wait= wait_key)
          else:
             arm.move_to(x= current_pose[0], y = current_pose[1], z= self.safe_z_val, wait= wait_key)
 
-
-         arm.dealy_s(wait_val)
+         if not self.continuous:
+            self._dwell(arm, self.polyline_dwell)
 
          print ("<<< polyline {} finished >>> \n".format(i))
+         tracer.complete("polyline", started, index=i, targets=len(poly_line))
       
       print ("<<<<<<<<  Drawing finished  >>>>>>>>")
       arm.go_home()
 
+   def prepare(self, polyLines):
+      """
+      Runs the enabled preprocessing stages on polylines before drawing them
+      Args:
+         polyLines (Drawing or list of numpy.ndarray): polylines, as extract_ploylines returns them
+      returns:
+         polyLines (Drawing): the polylines to draw
+      """
+      self.reports = {}
+      if self.merge_tolerance:
+         with tracer.span("merge_polylines", strokes=len(polyLines)):
+            polyLines = self.merge_polylines(polyLines)
+      if self.simplify_tolerance:
+         with tracer.span("simplify_polylines", strokes=len(polyLines)):
+            polyLines = self.simplify_polylines(polyLines)
+      if self.optimize_order:
+         with tracer.span("order_polylines", strokes=len(polyLines)):
+            polyLines = self.order_polylines(polyLines)
+      return polyLines
+
+   def merge_polylines(self, polyLines):
+      """
+      Joins polylines with touching endpoints (within merge_tolerance millimetres and
+      merge_pressure_tolerance of pressure) into single pen-down runs
+      Args:
+         polyLines (Drawing or list of numpy.ndarray): polylines, as extract_ploylines returns them
+      returns:
+         polyLines (Drawing): the merged polylines
+      """
+      polyLines, report = merge_strokes(polyLines, self.merge_tolerance, self.merge_pressure_tolerance)
+      polyLines = Drawing.from_polylines(polyLines)
+      self.reports["merge"] = report
+      print ("Polylines: {} -> {}, {} joined".format(report["strokes_before"],
+                                                     report["strokes_after"],
+                                                     report["joins"]))
+      return polyLines
+
+   def simplify_polylines(self, polyLines):
+      """
+      Removes nearly collinear targets, within simplify_tolerance millimetres of the
+      simplified stroke. Pressure counts as pen height through pressure_factor.
+      Args:
+         polyLines (Drawing or list of numpy.ndarray): polylines, as extract_ploylines returns them
+      returns:
+         polyLines (Drawing): the simplified polylines
+      """
+      polyLines, report = simplify_strokes(polyLines, self.simplify_tolerance, self.pressure_factor)
+      polyLines = Drawing.from_polylines(polyLines)
+      self.reports["simplify"] = report
+      print ("Targets: {} -> {}, {:.0%} removed".format(report["points_before"],
+                                                       report["points_after"],
+                                                       report["reduction"]))
+      return polyLines
+
+   def order_polylines(self, polyLines):
+      """
+      Reorders polylines, reversing some of them, to shorten the pen-up travel between them
+      Args:
+         polyLines (Drawing or list of numpy.ndarray): polylines, as extract_ploylines returns them
+      returns:
+         polyLines (Drawing): the same polylines in drawing order
+      """
+      polyLines, report = order_strokes(polyLines, start=self.home_position)
+      polyLines = Drawing.from_polylines(polyLines)
+      self.reports["order"] = report
+      print ("Pen-up travel: {:.0f} mm -> {:.0f} mm, saved {:.0f} mm".format(report["travel_before"],
+                                                                           report["travel_after"],
+                                                                           report["travel_saved"]))
+      return polyLines
+
+   def _dwell(self, arm, seconds):
+      """
+      Pauses the arm for seconds, nothing is sent for 0
+      """
+      if seconds:
+         arm.dealy_s(seconds)
+
+   def _current_pose(self, arm):
+      """
+      Position of the arm, from its shadow state if it keeps one, to avoid an M114 round trip
+      Args:
+         arm (Arm): the arm
+      returns:
+         current_pose (tuple): x, y, z, e, ...
+      """
+      if hasattr(arm, "get_commanded_position"):
+         return arm.get_commanded_position()
+      return arm.get_current_position()
+
    def dic_to_json(self, dic_data):
       """
       Converts a dictionary to json format.
@@ -206,17 +564,18 @@ class Drawing_processor(object):
          dictionary_data (dict): a dictionary holding the data from the JSON file or data
       """
 
-      if json_data is None:
-         # in case of no path and no data, 
-         # it loads a file from the default path 
-         if json_path is None:
-            json_path = self.default_path
-         raw_data = open(json_path,)
-         dictionary_data = json.load(raw_data)
-      
-      # if given json_data, it always return the dic
-      else:
-         dictionary_data = json.loads(json_data)
+      with tracer.span("json_to_dict", path=json_path):
+         if json_data is None:
+            # in case of no path and no data, 
+            # it loads a file from the default path 
+            if json_path is None:
+               json_path = self.default_path
+            raw_data = open(json_path,)
+            dictionary_data = json.load(raw_data)
+         
+         # if given json_data, it always return the dic
+         else:
+            dictionary_data = json.loads(json_data)
 
       return dictionary_data
    
@@ -288,14 +647,17 @@ class Drawing_processor(object):
 
    def extract_ploylines(self, json_path= None, data= None):
       """
-      Extract all the polylines in a json drawing 
+      Extract all the polylines in a json drawing, or in a columnar .dxd drawing (see drawing_format)
       
       Args: 
-         json_path (string): a path to load the file from, i.e.: "./data/path_data.json" 
+         json_path (string): a path to load the file from, i.e.: "./data/path_data.json" or "./data/path_data.dxd"
       
       returns:
-         polyLines (nparray): an array of all polylines
+         polyLines (Drawing): all polylines
       """
+      if json_path is not None and json_path.endswith(drawing_format.EXTENSION):
+         return self.load_binary(json_path)
+
       if json_path is None:
          if data is not None:
             print ("reading json data as text")
@@ -307,12 +669,63 @@ class Drawing_processor(object):
 
       strokes = drawing_data['drawing']['strokes']
 
-      polyLines = [pl for pl in strokes]
-      polyLines = [self.get_targest_from_polyline(polyLine) for polyLine in polyLines]
-      polyLines = np.asarray(polyLines, dtype=object)
+      with tracer.span("extract_ploylines", strokes=len(strokes)):
+         polyLines = [self.get_targest_from_polyline(polyLine) for polyLine in strokes]
+         return Drawing.from_polylines(polyLines)
+
+   def iter_ploylines(self, json_path, chunk_size=drawing_format.CHUNK_SIZE):
+      """
+      Reads the polylines of a drawing one at a time, so a large file is not loaded at once
       
-      return polyLines
-         
+      Args: 
+         json_path (string): a path to load the file from, i.e.: "./data/path_data.json" or "./data/path_data.dxd"
+         chunk_size (int): characters of JSON read at a time
+      
+      yields:
+         polyLine (numpy.ndarray): the targets of each polyline, see get_targest_from_polyline
+      """
+      if json_path.endswith(drawing_format.EXTENSION):
+         # memory mapped, only the pages of a polyline are read when it is taken
+         columns, offsets, _ = drawing_format.read_drawing(json_path)
+         columns = [columns[name] for name in drawing_format.COLUMNS]
+         for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+            if end > start:
+               yield np.column_stack([column[start:end] for column in columns]).astype(float)
+      else:
+         yield from drawing_format.iter_json_strokes(json_path, chunk_size)
+
+   def load_binary(self, path):
+      """
+      Loads a .dxd drawing as polylines. The file is memory mapped and its columns are
+      copied into the (N, 4) points in one pass, without parsing; see iter_ploylines to
+      read it a polyline at a time instead.
+      
+      Args: 
+         path (string): the .dxd file, i.e.: "./data/path_data.dxd"
+      
+      returns:
+         polyLines (Drawing): all polylines
+      """
+      columns, offsets, _ = drawing_format.read_drawing(path)
+      points = np.column_stack([columns[name] for name in drawing_format.COLUMNS])
+      return Drawing(points, offsets)
+
+   def json_to_binary(self, json_path, path, dtype="float64"):
+      """
+      Converts a JSON drawing file to a .dxd drawing, see drawing_format
+
+      Args:
+         json_path (string): the JSON drawing, i.e.: "./data/path_data.json"
+         path (string): the .dxd file to write, i.e.: "./data/path_data.dxd"
+         dtype (string): "float64" keeps the values exactly, "float32" takes half the space
+      """
+      drawing_format.json_file_to_drawing(json_path, path, dtype)
+
+   def binary_to_json(self, path, json_path):
+      """
+      Converts a .dxd drawing back to a JSON drawing file
+      """
+      drawing_format.drawing_to_json_file(path, json_path)
 
    def get_targest_from_polyline(self, polyLine):
       """
@@ -327,8 +740,8 @@ class Drawing_processor(object):
                                                     [600. 300. 45. 0.3]]
 
       """
-      point_in_polyline = [np.asarray(list(point.values())) for point in polyLine]
-      point_in_polyline = np.asarray(point_in_polyline)
+      point_in_polyline = [[point["x"], point["y"], point["a"], point["p"]] for point in polyLine]
+      point_in_polyline = np.asarray(point_in_polyline, dtype=float).reshape(-1, 4)
       return point_in_polyline
 
    
@@ -0,0 +1,460 @@
+##########################################################################################
+###### Imports
+##########################################################################################
+import time
+import numpy as np
+
+
+##########################################################################################
+###### Helpers
+##########################################################################################
+def as_polyline_array(polyLines):
+   """
+   Pack polylines in a 1D object array, as extract_ploylines returns them,
+   even when they all have the same length
+   """
+   packed = np.empty(len(polyLines), dtype=object)
+   for i, pl in enumerate(polyLines):
+      packed[i] = pl
+   return packed
+
+
+def drop_empty(polyLines):
+   """
+   Leave out the polylines without targets, i.e., from an empty SVG path, they have no endpoints
+   """
+   if hasattr(polyLines, "starts"):
+      # a Drawing has none
+      return polyLines
+   return [pl for pl in polyLines if len(pl) > 0]
+
+
+##########################################################################################
+###### Simplification
+##########################################################################################
+def simplify_polyline(polyLine, tolerance, pressure_scale=0.):
+   """
+   Ramer-Douglas-Peucker simplification of one polyline. Targets are dropped while the
+   simplified path stays within tolerance of them; the a and p values of the kept targets
+   are carried along.
+
+   Args:
+      polyLine (numpy.ndarray): (n, 4) targets of x, y, a, p
+      tolerance (float): the largest allowed deviation, in millimetres
+      pressure_scale (float): millimetres of pen height per unit of p, so that pressure
+                              changes count as deviation too, 0 to only look at x and y
+   returns:
+      simplified (numpy.ndarray): the kept targets, the first and last are always kept
+   """
+   polyLine = np.asarray(polyLine, dtype=float)
+   n = len(polyLine)
+   if n < 3:
+      return polyLine
+   points = polyLine[:, :2]
+   if pressure_scale:
+      points = np.column_stack([points, polyLine[:, 3]*abs(pressure_scale)])
+
+   keep = np.zeros(n, dtype=bool)
+   keep[0] = keep[-1] = True
+   stack = [(0, n - 1)]
+   while stack:
+      first, last = stack.pop()
+      if last - first < 2:
+         continue
+      inner = points[first + 1:last]
+      chord = points[last] - points[first]
+      offset = inner - points[first]
+      length_sq = chord @ chord
+      if length_sq == 0:
+         d = np.linalg.norm(offset, axis=1)
+      else:
+         # distance to the chord segment, clamped at its ends
+         t = np.clip(offset @ chord/length_sq, 0., 1.)
+         d = np.linalg.norm(offset - t[:, None]*chord, axis=1)
+      farthest = int(np.argmax(d))
+      if d[farthest] > tolerance:
+         split = first + 1 + farthest
+         keep[split] = True
+         stack.append((first, split))
+         stack.append((split, last))
+   return polyLine[keep]
+
+
+def simplify_strokes(polyLines, tolerance, pressure_scale=0.):
+   """
+   Simplifies every polyline of a drawing, see simplify_polyline
+
+   returns:
+      simplified (numpy.ndarray): the simplified polylines, as an object array
+      report (dict): points_before, points_after and reduction (fraction of targets removed)
+   """
+   simplified = [simplify_polyline(pl, tolerance, pressure_scale) for pl in polyLines]
+   points_before = int(sum(len(pl) for pl in polyLines))
+   points_after = int(sum(len(pl) for pl in simplified))
+   return as_polyline_array(simplified), {"points_before": points_before,
+                                          "points_after": points_after,
+                                          "reduction": 1. - points_after/points_before if points_before else 0.}
+
+
+##########################################################################################
+###### Merging
+##########################################################################################
+def merge_strokes(polyLines, tolerance, pressure_tolerance=0.1, reverse=True):
+   """
+   Joins polylines whose endpoints touch into single pen-down runs.
+   Endpoints are bucketed in a spatial hash of tolerance sized cells. A chain grows from its
+   end, then from its start, with any polyline that has an endpoint within tolerance and a
+   compatible pressure there, reversing it if needed.
+
+   Args:
+      polyLines (list of numpy.ndarray): polylines of (x, y, a, p) targets
+      tolerance (float): the largest gap bridged at a junction, in millimetres
+      pressure_tolerance (float): the largest difference of p across a junction
+      reverse (bool): allow joining a polyline backwards, from its last target
+   returns:
+      merged (numpy.ndarray): the merged polylines, as an object array, without the empty ones
+      report (dict): strokes_before, strokes_after and joins
+   """
+   polyLines = drop_empty(polyLines)
+   n = len(polyLines)
+   if n == 0 or not tolerance or tolerance <= 0:
+      return as_polyline_array(polyLines), {"strokes_before": n, "strokes_after": n, "joins": 0}
+
+   polyLines = [np.asarray(pl, dtype=float) for pl in polyLines]
+   # endpoint q belongs to polyline q % n, and is its last target if q >= n
+   ends = np.array([pl[0] for pl in polyLines] + [pl[-1] for pl in polyLines])
+   cells = np.floor(ends[:, :2]/tolerance).astype(int).tolist()
+   grid = {}
+   for q, key in enumerate(map(tuple, cells)):
+      grid.setdefault(key, []).append(q)
+   used = np.zeros(n, dtype=bool)
+
+   def take(i):
+      used[i] = True
+      for q in (i, i + n):
+         grid[tuple(cells[q])].remove(q)
+
+   def find(target, want_end):
+      # want_end: the endpoint has to be the last target of its polyline to be joined as it is
+      cx, cy = np.floor(target[:2]/tolerance).astype(int).tolist()
+      best, best_d = None, tolerance
+      for dx in (-1, 0, 1):
+         for dy in (-1, 0, 1):
+            for q in grid.get((cx + dx, cy + dy), ()):
+               if not reverse and (q >= n) != want_end:
+                  continue
+               d = float(np.hypot(*(ends[q, :2] - target[:2])))
+               if d <= best_d and abs(ends[q, 3] - target[3]) <= pressure_tolerance:
+                  best, best_d = q, d
+      return best
+
+   merged = []
+   joins = 0
+   for i in range(n):
+      if used[i]:
+         continue
+      take(i)
+      chain = [polyLines[i]]
+      # grow forward: the next polyline has to start at the end of the chain
+      while True:
+         q = find(chain[-1][-1], want_end=False)
+         if q is None:
+            break
+         j = q % n
+         take(j)
+         chain.append(polyLines[j] if q < n else polyLines[j][::-1])
+         joins += 1
+      # grow backward: the previous polyline has to end at the start of the chain
+      while True:
+         q = find(chain[0][0], want_end=True)
+         if q is None:
+            break
+         j = q % n
+         take(j)
+         chain.insert(0, polyLines[j] if q >= n else polyLines[j][::-1])
+         joins += 1
+
+      run = [chain[0]]
+      for part in chain[1:]:
+         # a junction drawn twice would only dwell on the same spot
+         if np.array_equal(run[-1][-1], part[0]):
+            part = part[1:]
+         run.append(part)
+      merged.append(np.concatenate(run))
+
+   return as_polyline_array(merged), {"strokes_before": n, "strokes_after": len(merged), "joins": joins}
+
+
+##########################################################################################
+###### Pen-up travel
+##########################################################################################
+def _endpoints(polyLines):
+   """
+   First and last xy of every polyline
+   returns:
+      starts, ends (numpy.ndarray): (n, 2) arrays
+   """
+   if hasattr(polyLines, "starts"):
+      # a Drawing, one gather instead of a loop
+      return polyLines.starts()[:, :2], polyLines.ends()[:, :2]
+   starts = np.array([pl[0][:2] for pl in polyLines], dtype=float).reshape(-1, 2)
+   ends = np.array([pl[-1][:2] for pl in polyLines], dtype=float).reshape(-1, 2)
+   return starts, ends
+
+
+def _travel(starts, ends, start=None):
+   """
+   Pen-up travel of drawing oriented polylines in order, from start if given
+   """
+   gaps = np.linalg.norm(starts[1:] - ends[:-1], axis=1).sum()
+   if start is not None and len(starts):
+      gaps += np.linalg.norm(starts[0] - np.asarray(start, dtype=float))
+   return float(gaps)
+
+
+def travel_length(polyLines, start=None):
+   """
+   Distance the pen travels above the paper between polylines, drawn in order
+
+   Args:
+      polyLines (list of numpy.ndarray): polylines of (x, y, a, p) targets
+      start (tuple): x, y where the pen starts, i.e., the home position, None to start at the first polyline
+   returns:
+      travel (float): in millimetres
+   """
+   polyLines = drop_empty(polyLines)
+   if len(polyLines) == 0:
+      return 0.
+   starts, ends = _endpoints(polyLines)
+   return _travel(starts, ends, start)
+
+
+def _nearest_neighbour(starts, ends, start, reverse):
+   """
+   Greedy tour: always draw the closest polyline next, from whichever end is closer.
+   Endpoints are bucketed in a uniform grid, and the search grows ring by ring around
+   the pen until no closer endpoint can exist.
+
+   returns:
+      order (numpy.ndarray of int), flip (numpy.ndarray of bool)
+   """
+   n = len(starts)
+   # endpoint p belongs to polyline p % n, and is its end if p >= n
+   points = np.vstack([starts, ends]) if reverse else starts
+   low = points.min(axis=0)
+   side = max(1, int(np.sqrt(len(points)/2.)))
+   cell = max(float((points.max(axis=0) - low).max())/side, 1e-9)
+   cells = np.clip(((points - low)/cell).astype(int), 0, side - 1)
+
+   grid = {}
+   for p, key in enumerate(zip(cells[:, 0].tolist(), cells[:, 1].tolist())):
+      grid.setdefault(key, []).append(p)
+   xy = points.tolist()
+   used = np.zeros(len(points), dtype=bool)
+
+   order = np.empty(n, dtype=int)
+   flip = np.zeros(n, dtype=bool)
+   current = np.asarray(start, dtype=float) if start is not None else starts[0]
+
+   for k in range(n):
+      cx, cy = ((current - low)/cell).astype(int).tolist()
+      inside = 0 <= cx < side and 0 <= cy < side
+      best, best_d = None, np.inf
+      r = 0
+      # rings only bound the distance when the pen is inside the grid, and stop paying off when sparse
+      while inside and r <= 8:
+         for key in _ring(cx, cy, r):
+            for p in grid.get(key, ()):
+               d = (xy[p][0] - current[0])**2 + (xy[p][1] - current[1])**2
+               if d < best_d:
+                  best, best_d = p, d
+         if best is not None and best_d <= (r*cell)**2:
+            break
+         r += 1
+      else:
+         alive = np.flatnonzero(~used)
+         d = np.einsum("ij,ij->i", points[alive] - current, points[alive] - current)
+         best = int(alive[np.argmin(d)])
+
+      index = best % n
+      order[k] = index
+      flip[k] = best >= n
+      for p in (index, index + n) if reverse else (index,):
+         used[p] = True
+         grid[tuple(cells[p].tolist())].remove(p)
+      current = starts[index] if flip[k] else ends[index]
+
+   return order, flip
+
+
+def _ring(cx, cy, r):
+   """
+   Grid cells at Chebyshev distance r from (cx, cy)
+   """
+   if r == 0:
+      return [(cx, cy)]
+   keys = [(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in (-r, r)]
+   keys += [(cx + dx, cy + dy) for dx in (-r, r) for dy in range(-r + 1, r)]
+   return keys
+
+
+def _two_opt(order, flip, s, e, start, window, deadline):
+   """
+   Reverse sections of the tour (and every polyline in them) while it shortens the travel.
+   Only sections up to window polylines long are tried.
+
+   returns:
+      True if the tour changed
+   """
+   n = len(order)
+   changed = False
+   for i in range(n - 1):
+      if time.perf_counter() > deadline:
+         break
+      j = np.arange(i + 1, min(n, i + 1 + window))
+      before = start if i == 0 else e[i - 1]
+      if before is None:
+         # the first polyline has no incoming edge, reversing from it only changes its start
+         before_cost = 0.
+         new_in = 0.
+      else:
+         before_cost = np.linalg.norm(s[i] - before)
+         new_in = np.linalg.norm(e[j] - before, axis=1)
+      has_next = j + 1 < n
+      nxt = s[np.minimum(j + 1, n - 1)]
+      old_out = np.where(has_next, np.linalg.norm(nxt - e[j], axis=1), 0.)
+      new_out = np.where(has_next, np.linalg.norm(nxt - s[i], axis=1), 0.)
+      delta = new_in + new_out - before_cost - old_out
+      best = int(np.argmin(delta))
+      if delta[best] < -1e-9:
+         jj = j[best]
+         order[i:jj + 1] = order[i:jj + 1][::-1]
+         flip[i:jj + 1] = ~flip[i:jj + 1][::-1]
+         s_seg = s[i:jj + 1][::-1].copy()
+         s[i:jj + 1] = e[i:jj + 1][::-1]
+         e[i:jj + 1] = s_seg
+         changed = True
+   return changed
+
+
+def _or_opt(order, flip, s, e, start, window, reverse, deadline, max_length=3):
+   """
+   Move runs of 1 to max_length polylines to a better place in the tour, reversed if it helps.
+   Only places up to window positions away are tried.
+
+   returns:
+      order, flip, s, e and True if the tour changed
+   """
+   changed = False
+   i = 0
+   while i < len(order):
+      if time.perf_counter() > deadline:
+         break
+      n = len(order)
+      moved = False
+      for length in range(1, max_length + 1):
+         last = i + length - 1
+         if last >= n:
+            break
+         prev_e = start if i == 0 else e[i - 1]
+         next_s = s[last + 1] if last + 1 < n else None
+
+         # travel saved by taking the run out
+         gain = 0.
+         if prev_e is not None:
+            gain += np.linalg.norm(s[i] - prev_e)
+         if next_s is not None:
+            gain += np.linalg.norm(next_s - e[last])
+            if prev_e is not None:
+               gain -= np.linalg.norm(next_s - prev_e)
+
+         # insertion before position k, for k away from the run
+         k = np.arange(max(0, i - window), min(n, last + 1 + window) + 1)
+         k = k[(k < i) | (k > last + 1)]
+         if len(k) == 0:
+            continue
+         has_prev = k > 0
+         has_next = k < n
+         k_prev = e[np.maximum(k - 1, 0)]
+         if start is not None:
+            k_prev = np.where(has_prev[:, None], k_prev, np.asarray(start, dtype=float))
+            has_prev = np.ones(len(k), dtype=bool)
+         k_next = s[np.minimum(k, n - 1)]
+         old_edge = np.where(has_prev & has_next, np.linalg.norm(k_next - k_prev, axis=1), 0.)
+
+         def insertion_cost(first, final):
+            cost = np.where(has_prev, np.linalg.norm(first - k_prev, axis=1), 0.)
+            cost = cost + np.where(has_next, np.linalg.norm(k_next - final, axis=1), 0.)
+            return cost - old_edge
+
+         cost = insertion_cost(s[i], e[last])
+         cost_flipped = insertion_cost(e[last], s[i]) if reverse else np.full(len(k), np.inf)
+         best = int(np.argmin(np.minimum(cost, cost_flipped)))
+         flipped = cost_flipped[best] < cost[best]
+         if min(cost[best], cost_flipped[best]) - gain < -1e-9:
+            target = k[best]
+            run = np.arange(i, last + 1)
+            if flipped:
+               run = run[::-1]
+            rest = np.r_[0:i, last + 1:n]
+            # position of the insertion point among the remaining polylines
+            cut = int(np.searchsorted(rest, target))
+            new = np.r_[rest[:cut], run, rest[cut:]]
+            flip_new = flip[new].copy()
+            s_new, e_new = s[new].copy(), e[new].copy()
+            if flipped:
+               seg = slice(cut, cut + length)
+               flip_new[seg] = ~flip_new[seg]
+               s_new[seg], e_new[seg] = e[new][seg].copy(), s[new][seg].copy()
+            order, flip, s, e = order[new], flip_new, s_new, e_new
+            changed = moved = True
+            break
+      if not moved:
+         i += 1
+   return order, flip, s, e, changed
+
+
+def order_strokes(polyLines, start=None, reverse=True, window=64, time_limit=5.):
+   """
+   Reorder (and optionally reverse) polylines to shorten the pen-up travel between them.
+   A nearest-neighbour tour is refined with 2-opt and Or-opt moves until no move helps
+   or time_limit is reached.
+
+   Args:
+      polyLines (list of numpy.ndarray): polylines of (x, y, a, p) targets
+      start (tuple): x, y where the pen starts, i.e., the home position, None to start at the first polyline
+      reverse (bool): allow drawing a polyline from its last target to its first
+      window (int): how far in the tour 2-opt and Or-opt look for a better place
+      time_limit (float): seconds allowed for the refinement
+   returns:
+      ordered (numpy.ndarray): the polylines in the new order, as an object array, without the empty ones
+      report (dict): travel_before, travel_after, travel_saved (mm) and strokes
+   """
+   polyLines = drop_empty(polyLines)
+   n = len(polyLines)
+   travel_before = travel_length(polyLines, start)
+   if n < 2:
+      return as_polyline_array(polyLines), {"strokes": n,
+                                           "travel_before": travel_before,
+                                           "travel_after": travel_before,
+                                           "travel_saved": 0.}
+   deadline = time.perf_counter() + time_limit
+   starts, ends = _endpoints(polyLines)
+   order, flip = _nearest_neighbour(starts, ends, start, reverse)
+   s = np.where(flip[:, None], ends[order], starts[order])
+   e = np.where(flip[:, None], starts[order], ends[order])
+
+   improved = True
+   while improved and time.perf_counter() < deadline:
+      improved = False
+      if reverse:
+         improved = _two_opt(order, flip, s, e, start, window, deadline)
+      order, flip, s, e, moved = _or_opt(order, flip, s, e, start, window, reverse, deadline)
+      improved = improved or moved
+
+   ordered = [polyLines[i][::-1] if f else polyLines[i] for i, f in zip(order, flip)]
+   travel_after = _travel(s, e, start)
+   return as_polyline_array(ordered), {"strokes": n,
+                          "travel_before": travel_before,
+                          "travel_after": travel_after,
+                          "travel_saved": travel_before - travel_after}
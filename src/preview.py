@@ -0,0 +1,113 @@
+'''
+    File name: preview.py
+    Plot data of large drawings: a few NaN-separated line traces instead of one trace per
+    polyline, with the detail that is not visible at the current zoom dropped.
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import numpy as np
+
+
+##########################################################################################
+###### Constants
+##########################################################################################
+# cells across the visible area, targets closer than a cell are drawn as one
+RESOLUTION = 2000
+# most targets sent to the browser, the cells grow until the preview fits
+MAX_POINTS = 200000
+# polyline i goes to trace i % N_TRACES, so neighbouring polylines get different colors
+N_TRACES = 8
+
+
+##########################################################################################
+###### Functions
+##########################################################################################
+def _visible(drawing, x_range, y_range):
+   """
+   returns:
+      (numpy.ndarray) bool per polyline, True if its bounding box meets the view
+   """
+   visible = np.ones(len(drawing), dtype=bool)
+   lengths = drawing.lengths()
+   if x_range is None and y_range is None:
+      return visible & (lengths > 0)
+   starts = drawing.offsets[:-1][lengths > 0]
+   for axis, view in ((0, x_range), (1, y_range)):
+      if view is None:
+         continue
+      low, high = min(view), max(view)
+      values = drawing.points[:, axis]
+      inside = np.zeros(len(drawing), dtype=bool)
+      inside[lengths > 0] = (np.maximum.reduceat(values, starts) >= low) & (np.minimum.reduceat(values, starts) <= high)
+      visible &= inside
+   return visible
+
+
+def decimate(drawing, x_range=None, y_range=None, resolution=RESOLUTION, max_points=MAX_POINTS):
+   """
+   Picks the targets worth plotting: the polylines in view, and in each of them one target per
+   grid cell it passes through, plus its first and last targets
+
+   Args:
+      drawing (Drawing): the drawing
+      x_range, y_range (tuple): the visible area, None for all of it
+      resolution (int): cells across the larger side of the visible area
+      max_points (int): the cells are doubled until at most this many targets are kept
+   returns:
+      keep (numpy.ndarray): bool per target
+   """
+   n = drawing.n_points
+   if n == 0:
+      return np.zeros(0, dtype=bool)
+   stroke = drawing.stroke_index()
+   visible = _visible(drawing, x_range, y_range)[stroke]
+
+   x_min, y_min, x_max, y_max = drawing.bounding_box()
+   if x_range is not None:
+      x_min, x_max = min(x_range), max(x_range)
+   if y_range is not None:
+      y_min, y_max = min(y_range), max(y_range)
+   cell = max(x_max - x_min, y_max - y_min, 1e-9)/resolution
+
+   # the ends of every polyline stay, so it keeps its extent
+   ends = np.zeros(n, dtype=bool)
+   lengths = drawing.lengths()
+   ends[drawing.offsets[:-1][lengths > 0]] = True
+   ends[drawing.offsets[1:][lengths > 0] - 1] = True
+
+   while True:
+      cells = np.floor(drawing.points[:, :2]/cell).astype(np.int64)
+      moved = np.ones(n, dtype=bool)
+      moved[1:] = (cells[1:] != cells[:-1]).any(axis=1)
+      keep = visible & (moved | ends)
+      if keep.sum() <= max_points or cell > 1e12:
+         return keep
+      cell *= 2
+
+
+def preview_traces(drawing, x_range=None, y_range=None, n_traces=N_TRACES, **options):
+   """
+   The decimated drawing as n_traces NaN-separated lines
+
+   Args:
+      drawing (Drawing): the drawing
+      x_range, y_range (tuple): the visible area, None for all of it
+      n_traces (int): number of lines, polyline i is in line i % n_traces
+      options: resolution and max_points, see decimate
+   returns:
+      traces (list): (xs, ys) numpy arrays of each line, a NaN between polylines
+   """
+   keep = decimate(drawing, x_range, y_range, **options)
+   index = np.nonzero(keep)[0]
+   stroke = drawing.stroke_index()[index]
+   traces = []
+   for t in range(n_traces):
+      in_trace = stroke % n_traces == t
+      selected = index[in_trace]
+      selected_stroke = stroke[in_trace]
+      breaks = np.nonzero(selected_stroke[1:] != selected_stroke[:-1])[0] + 1
+      xs = np.insert(drawing.points[selected, 0], breaks, np.nan)
+      ys = np.insert(drawing.points[selected, 1], breaks, np.nan)
+      traces.append((xs, ys))
+   return traces
@@ -1,14 +1,133 @@
 import serial
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+WORD_PATTERN = re.compile(r"([A-Z])\s*([-+]?\d*\.?\d*)")
+
+# names reported by M888 for the module types of set_module_type
+MODULE_NAMES = {0: 'PEN', 1: 'LASER', 2: 'PUMP', 3: '3D'}
+
+
+class Arm_stopped(Exception):
+    """ Raised in a command stream that was interrupted by Dexarm.emergency_stop()
+    """
+
+
+def _parse_position(lines):
+    """
+    Parse the reply of M114.
+
+    Args:
+        lines (list of string): the lines the arm sent before "ok"
+
+    Returns:
+        position x,y,z, extrusion e, and dexarm theta a,b,c
+    """
+    x, y, z, e, a, b, c = None, None, None, None, None, None, None
+    for serial_str in lines:
+        if serial_str.find("X:") > -1:
+            temp = re.findall(r"[-+]?\d*\.\d+|\d+", serial_str)
+            x = float(temp[0])
+            y = float(temp[1])
+            z = float(temp[2])
+            e = float(temp[3])
+        if serial_str.find("DEXARM Theta") > -1:
+            temp = re.findall(r"[-+]?\d*\.\d+|\d+", serial_str)
+            a = float(temp[0])
+            b = float(temp[1])
+            c = float(temp[2])
+    return x, y, z, e, a, b, c
+
+
+def _parse_module_type(lines):
+    """
+    Parse the reply of M888.
+
+    Args:
+        lines (list of string): the lines the arm sent before "ok"
+
+    Returns:
+        string that indicates the type of the module, None if not reported
+    """
+    module_type = None
+    for serial_str in lines:
+        if serial_str.find("PEN") > -1:
+            module_type = 'PEN'
+        if serial_str.find("LASER") > -1:
+            module_type = 'LASER'
+        if serial_str.find("PUMP") > -1:
+            module_type = 'PUMP'
+        if serial_str.find("3D") > -1:
+            module_type = '3D'
+    return module_type
+
+
+def _parse_reply(command, lines):
+    """
+    Turn the lines received before an "ok" into the payload of the ticket of a command.
+
+    Args:
+        command (string): the command the ticket was created for
+        lines (list of string): the lines received before "ok"
+
+    Returns:
+        the position tuple for M114, the module name for M888, otherwise the raw lines
+    """
+    if command.startswith("M114"):
+        return _parse_position(lines)
+    if command.startswith("M888") and command.find("P") == -1:
+        return _parse_module_type(lines)
+    return lines
+
+
+def _move_cmd(x, y, z, e, feedrate, mode):
+    """
+    Build a linear move command, see Dexarm.move_to.
+
+    Returns:
+        the command as a string, terminated with a line ending
+    """
+    cmd = mode + "F" + str(feedrate)
+    if x is not None:
+        cmd = cmd + "X"+str(round(x)) 
+    if y is not None:
+        cmd = cmd + "Y" + str(round(y))
+    if z is not None:
+        cmd = cmd + "Z" + str(round(z))
+    if e is not None:
+        cmd = cmd + "E" + str(round(e))
+    return cmd + "\r\n"
+
 
 class Dexarm:
     """ Python class for Dexarm
+
+    A background thread owns the input side of the serial port. Each command sent with
+    submit() gets a ticket (concurrent.futures.Future) that is resolved when its "ok" arrives,
+    with the reply payload as its result. The firmware answers in order, so tickets are resolved
+    first in, first out.
+
+    Every command sent also updates a shadow of the commanded state: position, feedrate,
+    work origin (G92), module type and when the arm was homed. get_commanded_position() answers
+    from it and only queries the arm (M114) when the position is unknown, i.e., after homing or resync().
     """
 
-    def __init__(self, port):
+    # number of commands the firmware can hold before it stops answering "ok",
+    # used as the default window when streaming
+    planner_buffer_size = 4
+
+    def __init__(self, port, verbose=True, optimizer=None, metrics=None):
         """
         Args:
             port (string): the serial port of Dexarm, e.g, "COM3"
+            verbose (bool): print every reply of the arm
+            optimizer (Gcode_optimizer): compacts the commands before they are sent, None to send them as they are
+            metrics (Command_metrics): counts latencies, bytes and commands in flight, None to skip it
         """
         """
         # This is the original implementation, commented out for test
@@ -31,12 +150,222 @@ class Dexarm:
                         timeout=3000)
 
         self.is_open = self.ser.isOpen()
+        self.verbose = verbose
+        self.optimizer = optimizer
+        self.metrics = metrics
+
+        # streaming state, see streaming()
+        self.stream_window = 1
+        # incremented by emergency_stop(), a stream that started before it stops sending
+        self.stop_generation = 0
+        # stop_generation when the current streaming() block started, None outside of one
+        self.stream_generation = None
+
+        # shadow of the commanded state, None while unknown
+        self.position = [None, None, None, None]
+        self.feedrate = None
+        self.work_origin = [0., 0., 0., 0.]
+        self.module_type = None
+        # time.time() when homing was last sent, None until then and after a quick stop
+        self.homed_at = None
+
+        # tickets of the commands waiting for their "ok", oldest first
+        self._tickets = deque()
+        self._tickets_changed = threading.Condition()
+        self._reader_error = None
+        self._reader_stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop,
+                                        name="pydexarm reader %s" % self.ser.name,
+                                        daemon=True)
 
         if self.is_open:
             print('pydexarm: %s open' % self.ser.name)
+            self._reader.start()
         else:
             print('failed to open serial port')
 
+    def _read_loop(self):
+        """
+        Body of the reader thread: reads lines from the arm and resolves the oldest ticket on every "ok".
+        """
+        lines = []
+        try:
+            while not self._reader_stop.is_set():
+                raw = self.ser.readline()
+                if len(raw) == 0:
+                    continue
+                metrics = self.metrics
+                if metrics is not None:
+                    metrics.received(len(raw))
+                serial_str = raw.decode("utf-8", errors="replace").strip()
+                if serial_str.startswith("ok"):
+                    if self.verbose:
+                        print("read ok")
+                    with self._tickets_changed:
+                        ticket = self._tickets.popleft() if self._tickets else None
+                        in_flight = len(self._tickets)
+                        self._tickets_changed.notify_all()
+                    if ticket is not None:
+                        if metrics is not None:
+                            metrics.acknowledged(ticket, in_flight)
+                        ticket.set_result(_parse_reply(ticket.command, lines))
+                    lines = []
+                else:
+                    if self.verbose:
+                        print("read：", serial_str)
+                    lines.append(serial_str)
+        except (serial.SerialException, OSError, TypeError) as error:
+            # the port was closed or unplugged
+            self._reader_error = error
+        finally:
+            with self._tickets_changed:
+                pending = list(self._tickets)
+                self._tickets.clear()
+                self._tickets_changed.notify_all()
+            for ticket in pending:
+                if self.metrics is not None:
+                    self.metrics.abandoned(ticket)
+                ticket.set_exception(serial.SerialException("pydexarm: serial port closed before \"ok\""))
+
+    def submit(self, data):
+        """
+        Send a command and return its ticket without waiting for the reply.
+        Blocks only while stream_window commands are already waiting for their "ok".
+        If an optimizer is set, the command goes through it first.
+
+        Args:
+            data (string): the command, terminated with a line ending
+
+        Returns:
+            ticket (concurrent.futures.Future): resolved with the reply payload when "ok" is received
+        """
+        if self.optimizer is None:
+            return self._submit_line(data)
+        return self._submit_lines(self.optimizer.feed(data))
+
+    def _submit_lines(self, lines):
+        """
+        Send several command lines.
+
+        Returns:
+            ticket of the last line, already resolved if there is none
+        """
+        ticket = None
+        for line in lines:
+            ticket = self._submit_line(line)
+        if ticket is None:
+            ticket = Future()
+            ticket.command = None
+            ticket.set_result([])
+        return ticket
+
+    def _submit_line(self, data):
+        """
+        Write one command line once there is room in the window, and queue its ticket.
+
+        Args:
+            data (string or bytes): the command, terminated with a line ending
+        """
+        if isinstance(data, bytes):
+            payload = data
+            data = data.decode()
+        else:
+            payload = data.encode()
+        ticket = Future()
+        ticket.command = data
+        generation = self.stream_generation if self.stream_generation is not None else self.stop_generation
+        with self._tickets_changed:
+            while True:
+                self._check_reader()
+                if self.stop_generation != generation:
+                    raise Arm_stopped("pydexarm: emergency stop, \"%s\" not sent" % data.strip())
+                if len(self._tickets) < self.stream_window:
+                    break
+                self._tickets_changed.wait(0.5)
+            self._tickets.append(ticket)
+            if self.metrics is not None:
+                self.metrics.sent(ticket, len(payload), len(self._tickets))
+            self.ser.write(payload)
+            self._track(data)
+        return ticket
+
+    def stream_program(self, program, window=None):
+        """
+        Stream a compiled program (see Drawing_compiler) to the arm and wait until it is all acknowledged.
+        The lines are sent as they are, without going through the optimizer. Comment lines (";...")
+        are not sent. Raises Arm_stopped if emergency_stop() is called meanwhile.
+
+        Args:
+            program (bytes): G-code lines, terminated with line endings
+            window (int): number of commands in flight, planner_buffer_size by default
+        """
+        generation = self.stop_generation
+        with self.streaming(window):
+            for line in program.splitlines(keepends=True):
+                if self.stop_generation != generation:
+                    raise Arm_stopped("pydexarm: emergency stop, program not finished")
+                if line.startswith(b";"):
+                    continue
+                self._submit_line(line)
+        if self.optimizer is not None:
+            # the program moved the arm behind the back of the optimizer
+            self.optimizer.reset()
+
+    def _track(self, data):
+        """
+        Update the shadow state with a command that was sent.
+        """
+        words = WORD_PATTERN.findall(data.upper())
+        if len(words) == 0:
+            return
+        code = words[0][0] + words[0][1]
+        params = {}
+        for letter, value in words[1:]:
+            try:
+                params[letter] = float(value)
+            except ValueError:
+                params[letter] = 0.
+
+        if code in ("G0", "G1", "G00", "G01"):
+            for i, axis in enumerate("XYZE"):
+                if axis in params:
+                    self.position[i] = params[axis]
+            if "F" in params:
+                self.feedrate = params["F"]
+        elif code == "G92":
+            for i, axis in enumerate("XYZE"):
+                if axis in params:
+                    if self.position[i] is not None:
+                        self.work_origin[i] += self.position[i] - params[axis]
+                    self.position[i] = params[axis]
+        elif code in ("M1112", "M410"):
+            # homing ends on the home position of the firmware, quick stop anywhere
+            self.position = [None, None, None, None]
+            self.homed_at = time.time() if code == "M1112" else None
+        elif code == "M2005":
+            self.position[3] = None
+        elif code == "M888" and "P" in params:
+            self.module_type = MODULE_NAMES.get(int(params["P"]), str(int(params["P"])))
+            self.position = [None, None, None, None]
+
+    def _check_reader(self):
+        """
+        Raise if the reader thread is gone, nothing would ever resolve a ticket.
+        """
+        if self._reader_error is not None:
+            raise serial.SerialException("pydexarm: reader stopped: %s" % self._reader_error)
+        if not self._reader.is_alive():
+            raise serial.SerialException("pydexarm: serial port is not open")
+
+    def _wait(self, ticket):
+        """
+        Block until the ticket is resolved.
+
+        Returns:
+            the reply payload of the ticket
+        """
+        return ticket.result()
+
     def _send_cmd(self, data, wait=True):
         """
         Send command to the arm.
@@ -45,20 +374,88 @@ class Dexarm:
             data (string): the command
             wait (bool): wait for response from the arm (ok) or not.
                 If True, this function will block until the arm response "ok"
-                If False, this function will not block here. But the command could be ignored if buffer of the arm is full.
+                If False, this function will not block here. The "ok" is still collected by the reader thread,
+                so the command is not lost.
+                While streaming (see streaming()), commands never block on their own "ok", regardless of this flag.
+
+        Returns:
+            ticket (concurrent.futures.Future) of the command
         """
-        self.ser.write(data.encode())
-        if not wait:
-            self.ser.reset_input_buffer()
-            return
-        while True:
-            serial_str = self.ser.readline().decode("utf-8")
-            if len(serial_str) > 0:
-                if serial_str.find("ok") > -1:
-                    print("read ok")
-                    break
-                else:
-                    print("read：", serial_str)
+        ticket = self.submit(data)
+        if wait and self.stream_window <= 1:
+            self._wait(ticket)
+        return ticket
+
+    def flush(self):
+        """
+        Block until every command sent so far is acknowledged by the arm.
+        """
+        if self.optimizer is not None:
+            self._submit_lines(self.optimizer.flush())
+        with self._tickets_changed:
+            last_ticket = self._tickets[-1] if self._tickets else None
+        if last_ticket is not None:
+            self._wait(last_ticket)
+
+    def emergency_stop(self):
+        """
+        Stop the arm as soon as possible, from any thread.
+
+        Streams (stream_program, streaming loops blocked on a full window, drawing jobs) stop before
+        their next command with Arm_stopped, and the dwell held by the optimizer is dropped. Then M410
+        (quick stop) is written right away, without waiting for room in the window: firmware with an
+        emergency parser empties its planner as soon as the line arrives. The commands already sent
+        are still acknowledged, and the position is unknown until the next M114 (see resync()).
+
+        Returns:
+            ticket (concurrent.futures.Future) of M410, resolved when the arm acknowledges it
+        """
+        self.stop_generation += 1
+        if self.optimizer is not None:
+            self.optimizer.pending_dwell = None
+            self.optimizer.reset()
+        ticket = Future()
+        ticket.command = "M410\n"
+        with self._tickets_changed:
+            self._check_reader()
+            self._tickets.append(ticket)
+            if self.metrics is not None:
+                self.metrics.sent(ticket, 5, len(self._tickets))
+            self.ser.write(b"M410\n")
+            self._track(ticket.command)
+            # wake up the streams waiting for room in the window
+            self._tickets_changed.notify_all()
+        return ticket
+
+    @contextmanager
+    def streaming(self, window=None):
+        """
+        Keep up to window commands in flight instead of waiting for an "ok" after each one.
+        Every "ok" frees one slot, so the planner of the arm never starves and no command is lost.
+        Whatever the window, once emergency_stop() is called every command of the block raises
+        Arm_stopped instead of being sent.
+
+            with arm.streaming(window=4):
+                for x, y in targets:
+                    arm.move_to(x, y, z)
+
+        Args:
+            window (int): number of commands in flight, planner_buffer_size by default
+        """
+        if window is None:
+            window = self.planner_buffer_size
+        previous_window, previous_generation = self.stream_window, self.stream_generation
+        self.stream_window = max(1, int(window))
+        if previous_generation is None:
+            self.stream_generation = self.stop_generation
+        try:
+            yield self
+        finally:
+            try:
+                self.flush()
+            finally:
+                self.stream_window = previous_window
+                self.stream_generation = previous_generation
 
     def go_home(self):
         """
@@ -99,29 +496,20 @@ class Dexarm:
         """
         self._send_cmd("M888 P" + str(module_type) + "\r")
 
-    def get_module_type(self):
+    def get_module_type(self, cached=False):
         """
         Get the type of end effector.
 
+        Args:
+            cached (bool): answer from the shadow state if the module type is known
+
         Returns:
             string that indicates the type of the module
         """
-        self.ser.reset_input_buffer()
-        self.ser.write('M888\r'.encode())
-        while True:
-            serial_str = self.ser.readline().decode("utf-8")
-            if len(serial_str) > 0:
-                if serial_str.find("PEN") > -1:
-                    module_type = 'PEN'
-                if serial_str.find("LASER") > -1:
-                    module_type = 'LASER'
-                if serial_str.find("PUMP") > -1:
-                    module_type = 'PUMP'
-                if serial_str.find("3D") > -1:
-                    module_type = '3D'
-            if len(serial_str) > 0:
-                if serial_str.find("ok") > -1:
-                    return module_type
+        if cached and self.module_type is not None:
+            return self.module_type
+        self.module_type = self._wait(self.submit('M888\r'))
+        return self.module_type
 
     def move_to(self, x=None, y=None, z=None, e=None, feedrate=2000, mode="G1", wait=True):
         """
@@ -132,17 +520,12 @@ class Dexarm:
             x, y, z (int): The position, in millimeters by default. Units may be set to inches by G20. Note that the center of y axis is 300mm.
             feedrate (int): set the feedrate for all subsequent moves
         """
-        cmd = mode + "F" + str(feedrate)
-        if x is not None:
-            cmd = cmd + "X"+str(round(x)) 
-        if y is not None:
-            cmd = cmd + "Y" + str(round(y))
-        if z is not None:
-            cmd = cmd + "Z" + str(round(z))
-        if e is not None:
-            cmd = cmd + "E" + str(round(e))
-        cmd = cmd + "\r\n"
-        self._send_cmd(cmd, wait=wait)
+        if self.optimizer is None:
+            self._send_cmd(_move_cmd(x, y, z, e, feedrate, mode), wait=wait)
+            return
+        ticket = self._submit_lines(self.optimizer.encode_move(x, y, z, e, feedrate, mode))
+        if wait and self.stream_window <= 1:
+            self._wait(ticket)
 
     def fast_move_to(self, x=None, y=None, z=None, feedrate=2000, wait=True):
         """
@@ -152,7 +535,7 @@ class Dexarm:
             x, y, z (int): the position, in millimeters by default. Units may be set to inches by G20. Note that the center of y axis is 300mm.
             feedrate (int): sets the feedrate for all subsequent moves
         """
-        self.move_to(self, x=x, y=y, z=z, feedrate=feedrate, mode="G0", wait=wait)
+        self.move_to(x=x, y=y, z=z, feedrate=feedrate, mode="G0", wait=wait)
 
     def rotate_to(self, r= None, wait=True):
         """
@@ -164,7 +547,7 @@ class Dexarm:
                 If True, this function will block until the arm response "ok"
                 If False, this function will not block here. But the command could be ignored if buffer of the arm is full.
         """
-        self._send_cmd("M2101 P" + str(r), wait=wait)
+        self._send_cmd("M2101 P" + str(r) + "\r\n", wait=wait)
 
     def get_current_rotation(self, wait=True):
         cmd = "M2101"
@@ -178,27 +561,27 @@ class Dexarm:
         Returns:
             position x,y,z, extrusion e, and dexarm theta a,b,c
         """
-        self.ser.reset_input_buffer()
-        self.ser.write('M114\r'.encode())
-        x, y, z, e, a, b, c = None, None, None, None, None, None, None
-        while True:
-            serial_str = self.ser.readline().decode("utf-8")
-            if len(serial_str) > 0:
-                if serial_str.find("X:") > -1:
-                    temp = re.findall(r"[-+]?\d*\.\d+|\d+", serial_str)
-                    x = float(temp[0])
-                    y = float(temp[1])
-                    z = float(temp[2])
-                    e = float(temp[3])
-            if len(serial_str) > 0:
-                if serial_str.find("DEXARM Theta") > -1:
-                    temp = re.findall(r"[-+]?\d*\.\d+|\d+", serial_str)
-                    a = float(temp[0])
-                    b = float(temp[1])
-                    c = float(temp[2])
-            if len(serial_str) > 0:
-                if serial_str.find("ok") > -1:
-                    return x, y, z, e, a, b, c
+        return self._wait(self.submit('M114\r'))
+
+    def get_commanded_position(self):
+        """
+        Get the position the arm was last commanded to, from the shadow state.
+        Queries the arm only if the position is unknown.
+
+        Returns:
+            position x,y,z, extrusion e
+        """
+        if None in self.position:
+            self.resync()
+        return tuple(self.position)
+
+    def resync(self):
+        """
+        Wait for all the commands sent so far and reload the shadow position from the arm (M114).
+        """
+        self.flush()
+        x, y, z, e, _, _, _ = self.get_current_position()
+        self.position = [x, y, z, e]
 
     def dealy_ms(self, value):
         """
@@ -311,4 +694,9 @@ class Dexarm:
         """
         Release the serial port.
         """
+        if self._reader.is_alive():
+            self.flush()
+            self._reader_stop.set()
+            self.ser.cancel_read()
+            self._reader.join()
         self.ser.close()
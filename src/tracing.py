@@ -0,0 +1,142 @@
+'''
+    File name: tracing.py
+    Spans of where the time of a drawing goes (reading the file, preprocessing, compiling,
+    streaming every polyline), written as a Chrome trace-event file that opens offline in
+    chrome://tracing, https://ui.perfetto.dev or https://www.speedscope.app.
+
+        tracer.enable()
+        with tracer.span("extract_ploylines", path=json_path):
+           ...
+        tracer.write("./data/trace.json")
+
+    Tracing is off unless enable() is called, or the DEXARM_TRACE environment variable is set;
+    a span then costs one attribute check.
+'''
+##########################################################################################
+###### Imports
+##########################################################################################
+import json
+import os
+import threading
+import time
+
+
+##########################################################################################
+###### Classes
+##########################################################################################
+class _Null_span(object):
+   """
+   What span() returns while tracing is off
+   """
+   def __enter__(self):
+      return self
+
+   def __exit__(self, exc_type, exc, tb):
+      return False
+
+
+class _Span(object):
+   def __init__(self, tracer, name, category, args):
+      self.tracer = tracer
+      self.name = name
+      self.category = category
+      self.args = args
+
+   def __enter__(self):
+      self.start = time.perf_counter()
+      return self
+
+   def __exit__(self, exc_type, exc, tb):
+      if exc_type is not None:
+         self.args["error"] = exc_type.__name__
+      self.tracer.complete(self.name, self.start, category=self.category, **self.args)
+      return False
+
+
+_NULL_SPAN = _Null_span()
+
+
+class Tracer(object):
+   """
+   Collects complete ("X") trace events, from any thread
+   """
+   def __init__(self, enabled=False):
+      self.enabled = enabled
+      self.events = []
+      self.epoch = time.perf_counter()
+      self._thread_names = {}
+
+   def enable(self):
+      self.enabled = True
+
+   def disable(self):
+      self.enabled = False
+
+   def clear(self):
+      """
+      Drops the events recorded so far
+      """
+      self.events = []
+      self._thread_names = {}
+
+   def span(self, name, category="drawing", **args):
+      """
+      A context manager timing its block
+
+      Args:
+         name (string): shown on the span
+         category (string): the "cat" of the event, to filter on
+         args: shown with the span, JSON serializable
+      """
+      if not self.enabled:
+         return _NULL_SPAN
+      return _Span(self, name, category, args)
+
+   def clock(self):
+      """
+      returns:
+         the start of a span closed by complete(), None while tracing is off
+      """
+      return time.perf_counter() if self.enabled else None
+
+   def complete(self, name, start, end=None, category="drawing", **args):
+      """
+      Records a span that started at start, a time.perf_counter() or clock() value,
+      and ends at end, now by default. Nothing is recorded for a start of None.
+      """
+      if start is None or not self.enabled:
+         return
+      if end is None:
+         end = time.perf_counter()
+      thread = threading.current_thread()
+      self._thread_names.setdefault(thread.ident, thread.name)
+      self.events.append({"name": name,
+                          "cat": category,
+                          "ph": "X",
+                          "ts": (start - self.epoch)*1e6,
+                          "dur": (end - start)*1e6,
+                          "pid": os.getpid(),
+                          "tid": thread.ident,
+                          "args": args})
+
+   def to_chrome(self):
+      """
+      returns:
+         (dict) the events in the Chrome trace-event format
+      """
+      names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+               for tid, name in list(self._thread_names.items())]
+      return {"traceEvents": names + list(self.events), "displayTimeUnit": "ms"}
+
+   def write(self, path):
+      """
+      Writes the events as a Chrome trace-event JSON file
+      """
+      with open(path, "w") as outfile:
+         json.dump(self.to_chrome(), outfile, default=str)
+
+
+##########################################################################################
+###### The tracer of the app
+##########################################################################################
+tracer = Tracer(enabled=bool(os.environ.get("DEXARM_TRACE")))
@@ -0,0 +1,29 @@
+'''
+    File name: conftest.py
+    Fixtures shared by the tests: a simulated DexArm on a pseudo-terminal (POSIX only) and
+    an arm connected to it.
+'''
+import os
+
+import pytest
+
+from src.dexarm_sim import Dexarm_simulator
+from src.pydexarm import Dexarm
+
+
+@pytest.fixture
+def simulator():
+   """
+   A simulator that runs the motions instantly, see Dexarm_simulator(time_scale=0)
+   """
+   if not hasattr(os, "openpty"):
+      pytest.skip("Dexarm_simulator needs a pseudo-terminal")
+   with Dexarm_simulator(time_scale=0) as sim:
+      yield sim
+
+
+@pytest.fixture
+def arm(simulator):
+   arm = Dexarm(simulator.port, verbose=False)
+   yield arm
+   arm.close()
@@ -0,0 +1,97 @@
+'''
+    File name: test_arm_metrics.py
+    Command_metrics filled by a Dexarm talking to a simulated arm, and its Prometheus output.
+'''
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from src.arm_metrics import Command_metrics, command_code
+from src.pydexarm import Dexarm
+
+
+def ticket(command):
+   ticket = Future()
+   ticket.command = command
+   return ticket
+
+
+@pytest.mark.parametrize("command, code", [("G1F2000X10", "G1"), ("m114\r", "M114"), (" G4 P100", "G4"), (";polyline 1", "other")])
+def test_command_code(command, code):
+   assert command_code(command) == code
+
+
+def test_commands_sent_to_an_arm_are_counted(simulator):
+   metrics = Command_metrics()
+   arm = Dexarm(simulator.port, verbose=False, metrics=metrics)
+   with arm.streaming(4):
+      for x in range(20):
+         arm.move_to(x=x, y=300, z=0)
+   arm.get_current_position()
+   arm.close()
+
+   snapshot = metrics.snapshot()
+   assert snapshot["commands"] == 21
+   assert snapshot["latency"]["G1"]["count"] == 20
+   assert sum(snapshot["latency"]["G1"]["histogram"].values()) == 20
+   assert snapshot["position_queries"] == 1
+   assert snapshot["bytes_out"] == simulator.stats["bytes_in"]
+   assert snapshot["bytes_in"] == simulator.stats["bytes_out"]
+   assert 1 < snapshot["in_flight_max"] <= 4
+   assert snapshot["in_flight"] == 0
+   assert snapshot["stalls"] == 0
+
+
+def test_a_command_without_its_ok_is_a_stall():
+   metrics = Command_metrics(stall_threshold=0.05)
+   late = ticket("G4 S1\r")
+   metrics.sent(late, 6, 1)
+   time.sleep(0.1)
+   snapshot = metrics.snapshot()
+   assert (snapshot["stalls"], snapshot["stalled_in_flight"], snapshot["stalls_acknowledged"]) == (1, 1, 0)
+   assert snapshot["oldest_in_flight"] >= 0.1
+
+   metrics.acknowledged(late, 0)
+   snapshot = metrics.snapshot()
+   assert (snapshot["stalls"], snapshot["stalled_in_flight"], snapshot["stalls_acknowledged"]) == (1, 0, 1)
+
+   lost = ticket("G1X1\r")
+   metrics.sent(lost, 5, 1)
+   time.sleep(0.1)
+   metrics.abandoned(lost)
+   assert metrics.snapshot()["stalls"] == 1
+
+
+def samples(text):
+   values = {}
+   for line in text.splitlines():
+      if not line.startswith("#"):
+         name, value = line.rsplit(" ", 1)
+         values[name] = float(value)
+   return values
+
+
+def test_prometheus_output():
+   metrics = Command_metrics(stall_threshold=0.05, buckets=(0.01, 0.1))
+   fast, slow = ticket("G1X1\r"), ticket("G1X2\r")
+   metrics.sent(fast, 5, 1)
+   metrics.acknowledged(fast, 0)
+   metrics.sent(slow, 5, 1)
+   time.sleep(0.06)
+   values = samples(metrics.prometheus({"port": "/dev/ttyACM0"}))
+   label = 'port="/dev/ttyACM0"'
+   assert values['dexarm_command_latency_seconds_bucket{%s,code="G1",le="0.01"}' % label] == 1
+   assert values['dexarm_command_latency_seconds_bucket{%s,code="G1",le="+Inf"}' % label] == 1
+   assert values['dexarm_command_latency_seconds_count{%s,code="G1"}' % label] == 1
+   assert values['dexarm_commands_total{%s}' % label] == 2
+   assert values['dexarm_bytes_sent_total{%s}' % label] == 10
+   # the counter only grows: the stall still in flight is on the gauge
+   assert values['dexarm_stalls_total{%s}' % label] == 0
+   assert values['dexarm_commands_stalled{%s}' % label] == 1
+
+   metrics.acknowledged(slow, 0)
+   values = samples(metrics.prometheus())
+   assert values["dexarm_stalls_total"] == 1
+   assert values["dexarm_commands_stalled"] == 0
+   assert values['dexarm_command_latency_seconds_bucket{code="G1",le="0.1"}'] == 2
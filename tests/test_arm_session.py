@@ -0,0 +1,90 @@
+'''
+    File name: test_arm_session.py
+    Resuming a saved arm session against a simulated arm, and the cases that home it instead.
+'''
+import json
+
+import pytest
+
+from src.arm_session import forget_session, load_session, resume_session, save_session
+from src.pydexarm import Dexarm
+
+
+@pytest.fixture
+def session_path(tmp_path):
+   return str(tmp_path/"arm_session.json")
+
+
+@pytest.fixture
+def saved(simulator, session_path):
+   # a first session homes the arm, moves it and saves where it was left
+   arm = Dexarm(simulator.port, verbose=False)
+   arm.go_home()
+   arm.set_module_type(0)
+   arm.move_to(10, 280, 0)
+   arm.move_to(10, 280, -20)
+   save_session(arm, session_path)
+   arm.close()
+   return session_path
+
+
+def reconnect(simulator, session_path):
+   arm = Dexarm(simulator.port, verbose=False)
+   try:
+      return arm, resume_session(arm, session_path)
+   finally:
+      arm.close()
+
+
+def test_the_session_is_saved(simulator, saved):
+   state = load_session(saved, simulator.port)
+   assert state["position"][:3] == [10, 280, -20]
+   assert state["module_type"] == "PEN"
+   assert state["homed_at"] is not None
+   assert load_session(saved, "/dev/another-port") is None
+
+
+def test_a_session_is_resumed_without_homing(simulator, saved):
+   homed_at = load_session(saved)["homed_at"]
+   arm, (reported, reason) = reconnect(simulator, saved)
+   assert reason is None
+   assert reported[:3] == (10., 280., -20.)
+   assert arm.homed_at == homed_at
+   assert arm.module_type == "PEN"
+   assert arm.position[:3] == [10., 280., -20.]
+
+
+def test_a_moved_arm_is_homed(simulator, saved):
+   simulator.position[0] += 5
+   _, (_, reason) = reconnect(simulator, saved)
+   assert "moved or power cycled" in reason
+
+
+def test_a_power_cycled_arm_is_homed(simulator, saved):
+   simulator.power_cycle()
+   _, (reported, reason) = reconnect(simulator, saved)
+   assert reported[:3] == (0., 0., 0.)
+   assert reason is not None
+
+
+def test_another_module_is_homed(simulator, saved):
+   simulator.module_type = 1
+   _, (_, reason) = reconnect(simulator, saved)
+   assert "LASER" in reason
+
+
+def test_without_a_session_the_arm_is_homed(simulator, saved):
+   forget_session(saved)
+   forget_session(saved)
+   _, (_, reason) = reconnect(simulator, saved)
+   assert reason.startswith("no saved session")
+
+
+def test_a_session_saved_before_homing_is_not_resumed(simulator, session_path):
+   arm = Dexarm(simulator.port, verbose=False)
+   save_session(arm, session_path)
+   arm.close()
+   with open(session_path) as infile:
+      assert json.load(infile)["homed_at"] is None
+   _, (_, reason) = reconnect(simulator, session_path)
+   assert reason == "the arm was not homed in the saved session"
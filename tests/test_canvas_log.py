@@ -0,0 +1,89 @@
+'''
+    File name: test_canvas_log.py
+    Canvas_log: canvas changes appended to a log, compacted into the drawing file, and
+    recovered after a session that ended before compacting.
+'''
+import json
+import os
+
+import pytest
+
+from src.canvas_log import Canvas_log, parse_path
+
+
+def strokes_in(json_path):
+   with open(json_path) as infile:
+      return [[(point["x"], point["y"]) for point in stroke] for stroke in json.load(infile)["drawing"]["strokes"]]
+
+
+def shapes(*paths):
+   return {"shapes": [{"path": path} for path in paths]}
+
+
+@pytest.fixture
+def json_path(tmp_path):
+   return str(tmp_path/"path_data.json")
+
+
+def test_parse_path():
+   assert parse_path("M10,20L30,40L50.5,-6e1").tolist() == [[10, 20], [30, 40], [50.5, -60]]
+   assert parse_path("").shape == (0, 2)
+
+
+def test_the_first_change_writes_the_whole_canvas(json_path):
+   canvas = Canvas_log(json_path, scale=10, offset=(0, 250))
+   assert canvas.update(shapes("M0,0L10,20")) == (1, 0)
+   assert strokes_in(json_path) == [[(0., 250.), (1., 252.)]]
+   assert canvas.pending == 0
+
+
+def test_changes_are_logged_until_flushed(json_path):
+   canvas = Canvas_log(json_path, scale=10)
+   canvas.update(shapes("M0,0L10,0"))
+   canvas.update(shapes("M0,0L10,0", "M0,10L10,10"))
+   assert canvas.pending == 1
+   assert len(strokes_in(json_path)) == 1
+
+   # an edited shape keeps its place, a missing one is erased
+   assert canvas.update({"shapes[0].path": "M0,0L20,0"}) == (1, 1)
+   assert canvas.update(shapes("M0,0L20,0")) == (0, 1)
+   canvas.flush()
+   assert strokes_in(json_path) == [[(0., 0.), (2., 0.)]]
+   assert canvas.pending == 0
+
+
+def test_a_log_left_behind_is_recovered(json_path):
+   canvas = Canvas_log(json_path, scale=10)
+   canvas.update(shapes("M0,0L10,0", "M0,10L10,10"))
+   canvas.update(shapes("M0,10L10,10", "M0,20L10,20"))
+   canvas.update({"shapes[0].path": "M0,10L30,10"})
+   # the session ends here, without flush()
+   assert os.path.exists(canvas.log_path)
+
+   recovered = Canvas_log(json_path, scale=10)
+   assert not os.path.exists(recovered.log_path)
+   assert strokes_in(json_path) == [[(0., 1.), (3., 1.)], [(0., 2.), (1., 2.)]]
+
+
+def test_the_log_is_compacted_every_few_changes(json_path):
+   canvas = Canvas_log(json_path, scale=10, compact_every=3)
+   paths = ["M0,{0}L10,{0}".format(y) for y in range(6)]
+   for n in range(1, len(paths) + 1):
+      canvas.update(shapes(*paths[:n]))
+      assert canvas.pending < 3
+   with open(canvas.log_path) as infile:
+      assert len(infile.readlines()) - 1 == canvas.pending
+
+
+def test_a_replaced_drawing_file_is_written_whole_on_the_next_change(json_path):
+   canvas = Canvas_log(json_path, scale=10)
+   canvas.update(shapes("M0,0L10,0"))
+   with open(json_path, "w") as outfile:
+      json.dump({"drawing": {"strokes": []}}, outfile)
+   canvas.detach()
+   canvas.update(shapes("M0,0L10,0", "M0,10L10,10"))
+   assert len(strokes_in(json_path)) == 2
+
+   canvas.clear()
+   canvas.update(shapes("M0,30L10,30"))
+   assert strokes_in(json_path) == [[(0., 3.), (1., 3.)]]
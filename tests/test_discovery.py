@@ -0,0 +1,55 @@
+'''
+    File name: test_discovery.py
+    Port discovery: simulated arms answer the probe, silent or missing ports do not, and
+    every port is probed at the same time.
+'''
+import os
+import time
+import tty
+
+import pytest
+
+from src.dexarm_sim import Dexarm_simulator
+from src.discovery import discover, probe
+
+
+@pytest.fixture
+def silent_ports():
+   # pseudo-terminals nobody answers on
+   if not hasattr(os, "openpty"):
+      pytest.skip("needs a pseudo-terminal")
+   terminals = [os.openpty() for _ in range(3)]
+   for _, slave in terminals:
+      tty.setraw(slave)
+   yield [os.ttyname(slave) for _, slave in terminals]
+   for master, slave in terminals:
+      os.close(master)
+      os.close(slave)
+
+
+def test_a_simulated_arm_answers_the_probe(simulator):
+   simulator.module_type = 1
+   arm = probe(simulator.port)
+   assert arm["port"] == simulator.port
+   assert arm["module_type"] == "LASER"
+   assert arm["position"][:3] == (0., 300., 0.)
+   assert 0 < arm["latency"] < 0.3
+
+
+def test_silent_and_missing_ports_are_not_arms(silent_ports):
+   start = time.perf_counter()
+   assert probe(silent_ports[0], timeout=0.2) is None
+   assert time.perf_counter() - start < 0.5
+   assert probe("/dev/does-not-exist") is None
+
+
+def test_discover_probes_every_port_at_once(simulator, silent_ports):
+   with Dexarm_simulator(time_scale=0) as other:
+      ports = silent_ports[:2] + [other.port, "/dev/does-not-exist", simulator.port] + silent_ports[2:]
+      start = time.perf_counter()
+      arms = discover(ports, timeout=0.3)
+      elapsed = time.perf_counter() - start
+   assert [arm["port"] for arm in arms] == [other.port, simulator.port]
+   # in parallel, about one timeout rather than one per silent port (0.9 s)
+   assert elapsed < 0.6
+   assert discover([]) == []
@@ -0,0 +1,86 @@
+'''
+    File name: test_drawing_compiler.py
+    Drawing_compiler: programs cached by content and settings, least recently used evicted first.
+'''
+import json
+import os
+
+import pytest
+
+from src import drawing_compiler
+from src.drawing_compiler import Drawing_compiler, count_polylines
+from src.josn_interface import Drawing_processor
+
+
+def write_drawing(path, shift=0.):
+   strokes = [[{"x": x + shift, "y": 300 + i, "a": 0, "p": 0.5} for x in (10.25, 20.5, 30.75)] for i in range(3)]
+   with open(path, "w") as outfile:
+      json.dump({"drawing": {"strokes": strokes}}, outfile)
+   return str(path)
+
+
+@pytest.fixture
+def drawing(tmp_path):
+   return write_drawing(tmp_path/"drawing.json")
+
+
+def test_the_program_has_a_marker_per_polyline_and_keeps_the_precision(tmp_path, drawing):
+   program = Drawing_compiler(cache_dir=None, precision=1).compile_file(Drawing_processor(), drawing)
+   assert count_polylines(program) == 3
+   assert b"X10.2" in program and b"X20.5" in program
+   assert b"X10" in Drawing_compiler(cache_dir=None, precision=0).compile_file(Drawing_processor(), drawing)
+
+
+def test_a_second_compile_comes_from_memory_then_disk(tmp_path, drawing):
+   cache_dir = str(tmp_path/"cache")
+   compiler = Drawing_compiler(cache_dir=cache_dir)
+   program = compiler.compile_file(Drawing_processor(), drawing)
+   assert compiler.last_source == "compiled"
+   assert compiler.compile_file(Drawing_processor(), drawing) == program
+   assert compiler.last_source == "memory"
+
+   compiler = Drawing_compiler(cache_dir=cache_dir)
+   assert compiler.compile_file(Drawing_processor(), drawing) == program
+   assert compiler.last_source == "disk"
+
+
+@pytest.mark.parametrize("change", ["setting", "precision", "file", "version"])
+def test_changes_invalidate_the_cache(tmp_path, drawing, monkeypatch, change):
+   compiler = Drawing_compiler(cache_dir=str(tmp_path/"cache"))
+   dp = Drawing_processor()
+   program = compiler.compile_file(dp, drawing)
+   if change == "setting":
+      dp.base_z -= 5
+   elif change == "precision":
+      compiler.precision = 0
+   elif change == "file":
+      write_drawing(drawing, shift=1.)
+   else:
+      monkeypatch.setattr(drawing_compiler, "COMPILER_VERSION", drawing_compiler.COMPILER_VERSION + 1)
+   recompiled = compiler.compile_file(dp, drawing)
+   assert compiler.last_source == "compiled"
+   if change != "version":
+      assert recompiled != program
+
+
+def test_the_least_recently_used_program_is_evicted(tmp_path):
+   paths = [write_drawing(tmp_path/"{}.json".format(i), shift=i) for i in range(3)]
+   cache_dir = str(tmp_path/"cache")
+   compiler = Drawing_compiler(cache_dir=cache_dir, memory_entries=2, disk_entries=2)
+   dp = Drawing_processor()
+
+   compiler.compile_file(dp, paths[0])
+   compiler.compile_file(dp, paths[1])
+   compiler.compile_file(dp, paths[0])
+   compiler.compile_file(dp, paths[2])
+   assert len(os.listdir(cache_dir)) == 2
+
+   compiler.compile_file(dp, paths[0])
+   assert compiler.last_source == "memory"
+   compiler.compile_file(dp, paths[1])
+   assert compiler.last_source == "compiled"
+
+   compiler.clear()
+   assert os.listdir(cache_dir) == []
+   compiler.compile_file(dp, paths[0])
+   assert compiler.last_source == "compiled"
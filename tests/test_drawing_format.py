@@ -0,0 +1,83 @@
+'''
+    File name: test_drawing_format.py
+    The .dxd format: lossless round trips with JSON, and memory mapped reads.
+'''
+import json
+
+import numpy as np
+import pytest
+
+from src import drawing_format
+from src.josn_interface import Drawing_processor
+
+
+DRAWING = {"drawing": {"strokes": [[{"x": 100, "y": 200, "a": 15, "p": 0.4},
+                                    {"x": 300, "y": 400, "a": 90, "p": 0.5}],
+                                   [{"x": 600, "y": 400, "a": 45, "p": 0.2}],
+                                   [{"x": 610, "y": 300, "a": 45, "p": 0.3},
+                                    {"x": 620, "y": 310, "a": 45, "p": 1}]]}}
+
+
+@pytest.fixture
+def json_path(tmp_path):
+   path = tmp_path/"drawing.json"
+   with open(path, "w") as outfile:
+      json.dump(DRAWING, outfile)
+   return str(path)
+
+
+def test_columns_round_trip():
+   columns, offsets, integer_columns = drawing_format.dict_to_columns(DRAWING)
+   assert offsets.tolist() == [0, 2, 3, 5]
+   assert integer_columns == ["x", "y", "a"]
+   assert drawing_format.columns_to_dict(columns, offsets, integer_columns) == DRAWING
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_file_round_trip(tmp_path, json_path, mmap):
+   dxd_path = str(tmp_path/"drawing.dxd")
+   drawing_format.json_file_to_drawing(json_path, dxd_path)
+   with open(dxd_path, "rb") as infile:
+      assert infile.read(len(drawing_format.MAGIC)) == drawing_format.MAGIC
+   header = drawing_format.read_header(dxd_path)
+   assert header["offsets_at"] % drawing_format.ALIGNMENT == 0
+   assert (header["n_points"], header["n_strokes"]) == (5, 3)
+
+   columns, offsets, integer_columns = drawing_format.read_drawing(dxd_path, mmap=mmap)
+   assert drawing_format.columns_to_dict(columns, offsets, integer_columns) == DRAWING
+
+   copy_path = str(tmp_path/"copy.json")
+   drawing_format.drawing_to_json_file(dxd_path, copy_path)
+   with open(copy_path) as infile:
+      assert json.load(infile) == DRAWING
+
+
+def test_float32_halves_the_columns(tmp_path, json_path):
+   sizes = {}
+   for dtype in ("float64", "float32"):
+      path = str(tmp_path/"{}.dxd".format(dtype))
+      drawing_format.json_file_to_drawing(json_path, path, dtype)
+      columns, _, _ = drawing_format.read_drawing(path)
+      assert columns["x"].dtype == np.dtype(dtype)
+      sizes[dtype] = columns["x"].nbytes
+   assert sizes["float32"]*2 == sizes["float64"]
+
+
+def test_not_a_dxd_file(json_path):
+   with pytest.raises(ValueError):
+      drawing_format.read_header(json_path)
+
+
+def test_binary_and_json_drawings_read_the_same(tmp_path, json_path):
+   dp = Drawing_processor()
+   dxd_path = str(tmp_path/"drawing.dxd")
+   dp.json_to_binary(json_path, dxd_path)
+
+   from_json = dp.extract_ploylines(json_path=json_path)
+   from_binary = dp.extract_ploylines(json_path=dxd_path)
+   np.testing.assert_array_equal(from_binary.points, from_json.points)
+   np.testing.assert_array_equal(from_binary.offsets, from_json.offsets)
+   streamed = list(dp.iter_ploylines(dxd_path))
+   assert len(streamed) == 3
+   for polyLine, expected in zip(streamed, from_json):
+      np.testing.assert_array_equal(polyLine, expected)
@@ -0,0 +1,93 @@
+'''
+    File name: test_emergency_stop.py
+    Dexarm.emergency_stop() against a simulated arm running in real time: the arm halts within
+    milliseconds and starts no block after the stop, whatever the streaming window.
+'''
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.dexarm_sim import Dexarm_simulator
+from src.drawing_compiler import Drawing_compiler
+from src.job_runner import Job_runner, FINISHED
+from src.josn_interface import Drawing, Drawing_processor
+from src.pydexarm import Arm_stopped, Dexarm
+
+
+# milliseconds from emergency_stop() to the planner of the simulator being emptied
+HALT_LATENCY_BOUND = 50.
+STOP_HOLD = 0.2
+
+
+def zigzag(n_strokes=40, n_points=20):
+   polyLines = []
+   for i in range(n_strokes):
+      x = np.linspace(-60, 60, n_points)
+      y = 250 + (i % 10)*5 + 2*np.sin(np.arange(n_points))
+      polyLines.append(np.column_stack([x, y, np.zeros(n_points), np.full(n_points, 0.5)]))
+   return Drawing.from_polylines(polyLines)
+
+
+@pytest.fixture
+def realtime_simulator():
+   if not hasattr(os, "openpty"):
+      pytest.skip("Dexarm_simulator needs a pseudo-terminal")
+   with Dexarm_simulator(queue_depth=4, line_latency=0.0005, stop_hold=STOP_HOLD, time_scale=1.) as sim:
+      yield sim
+
+
+def assert_stopped(sim, stopped_at):
+   # anything the arm would still run shows up once the hold is over
+   time.sleep(STOP_HOLD + 0.3)
+   assert sim.stats["quick_stops"] == 1
+   assert (sim.last_quick_stop - stopped_at)*1000. < HALT_LATENCY_BOUND
+   assert sim.stats["blocks_run"] == sim.blocks_at_quick_stop
+
+
+@pytest.mark.parametrize("window", [1, 4])
+def test_emergency_stop_ends_a_drawing(realtime_simulator, window):
+   sim = realtime_simulator
+   arm = Dexarm(sim.port, verbose=False)
+   dp = Drawing_processor(base_z=-50, safe_z_val=-25, stream_window=window)
+   errors = []
+
+   def draw():
+      try:
+         dp.draw(arm, zigzag())
+      except Arm_stopped as error:
+         errors.append(error)
+
+   drawing = threading.Thread(target=draw)
+   drawing.start()
+   time.sleep(0.5)
+   assert drawing.is_alive()
+   stopped_at = time.perf_counter()
+   arm.emergency_stop().result(timeout=5)
+   drawing.join(timeout=5)
+
+   assert not drawing.is_alive()
+   assert len(errors) == 1
+   assert_stopped(sim, stopped_at)
+   arm.close()
+
+
+@pytest.mark.parametrize("window", [1, 4])
+def test_emergency_stop_ends_a_job(realtime_simulator, window):
+   sim = realtime_simulator
+   arm = Dexarm(sim.port, verbose=False)
+   program = Drawing_compiler(cache_dir=None).compile(Drawing_processor(base_z=-50, safe_z_val=-25), zigzag())
+   runner = Job_runner()
+   job_id = runner.submit(arm, program, window=window)
+   time.sleep(0.5)
+   stopped_at = time.perf_counter()
+   arm.emergency_stop().result(timeout=5)
+   deadline = time.perf_counter() + 5
+   while runner.status(job_id)["state"] not in FINISHED and time.perf_counter() < deadline:
+      time.sleep(0.001)
+
+   assert runner.status(job_id)["state"] == "stopped"
+   assert_stopped(sim, stopped_at)
+   arm.close()
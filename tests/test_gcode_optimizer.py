@@ -0,0 +1,86 @@
+'''
+    File name: test_gcode_optimizer.py
+    Gcode_optimizer: what it keeps of the modal state, how it rounds, and how it merges dwells.
+'''
+import pytest
+
+from src.gcode_optimizer import Gcode_optimizer, format_number
+from src.pydexarm import Dexarm
+
+
+@pytest.mark.parametrize("value, precision, text", [(12., 0, "12"), (12.5, 1, "12.5"), (12.50, 2, "12.5"),
+                                                    (-0.25, 2, "-0.25"), (-0.04, 1, "0"), (299.96, 1, "300")])
+def test_format_number(value, precision, text):
+   assert format_number(value, precision) == text
+
+
+def test_unchanged_words_are_dropped():
+   optimizer = Gcode_optimizer(precision=1)
+   assert optimizer.feed("G1F2000X10Y300Z-20\r\n") == ["G1F2000X10Y300Z-20\r\n"]
+   assert optimizer.feed("G1F2000X10Y300Z-40\r\n") == ["G1Z-40\r\n"]
+   # nothing moves
+   assert optimizer.feed("G1F2000X10Y300Z-40\r\n") == []
+   assert optimizer.dropped == 1
+
+
+def test_a_new_mode_sends_the_feedrate_again():
+   optimizer = Gcode_optimizer()
+   optimizer.feed("G1F2000X10Y300Z0\r\n")
+   assert optimizer.feed("G0F2000X20\r\n") == ["G0F2000X20\r\n"]
+   assert optimizer.feed("G0F3000X30\r\n") == ["G0F3000X30\r\n"]
+
+
+def test_precision_rounds_before_comparing():
+   coarse, fine = Gcode_optimizer(precision=0), Gcode_optimizer(precision=1)
+   for optimizer in (coarse, fine):
+      optimizer.feed("G1F2000X10Y300Z-50\r\n")
+   assert coarse.feed("G1F2000X10.3Y300Z-50.4\r\n") == []
+   assert fine.feed("G1F2000X10.3Y300Z-50.4\r\n") == ["G1X10.3Z-50.4\r\n"]
+
+
+def test_dwells_are_merged_and_held_back():
+   optimizer = Gcode_optimizer()
+   assert optimizer.feed("G4 P200\r") == []
+   assert optimizer.feed("G4 P300\r") == []
+   assert optimizer.feed("G1F2000X10Y300Z0\r\n") == ["G4 P500\r", "G1F2000X10Y300Z0\r\n"]
+   optimizer.feed("G4 S1\r")
+   assert optimizer.flush() == ["G4 S1\r"]
+   assert optimizer.flush() == []
+
+
+@pytest.mark.parametrize("command", ["M1112\r", "M410\n", "M888 P1\r", "M2005\r"])
+def test_commands_that_move_the_reference_reset_the_state(command):
+   optimizer = Gcode_optimizer()
+   optimizer.feed("G1F2000X10Y300Z0\r\n")
+   assert optimizer.feed(command) == [command]
+   assert optimizer.feed("G1F2000X10Y300Z0\r\n") == ["G1F2000X10Y300Z0\r\n"]
+
+
+def test_g92_sets_the_position():
+   optimizer = Gcode_optimizer()
+   optimizer.feed("G1F2000X10Y300Z0\r\n")
+   optimizer.feed("G92 X0 Y0 Z0 E0\r")
+   assert optimizer.feed("G1F2000X0Y0Z0\r\n") == []
+
+
+def test_comments_are_kept_in_place():
+   optimizer = Gcode_optimizer()
+   program = optimizer.optimize(["G4 P100\r", ";polyline 0\n", "G1F2000X1Y300Z0\r\n", "G1F2000X1Y300Z0\r\n"])
+   assert program == ["G4 P100\r", ";polyline 0\n", "G1F2000X1Y300Z0\r\n"]
+
+
+def test_an_arm_with_an_optimizer_ends_at_the_same_place_with_fewer_bytes(simulator):
+   sent = {}
+   for optimizer in (None, Gcode_optimizer(precision=1)):
+      simulator.reset_stats()
+      arm = Dexarm(simulator.port, verbose=False, optimizer=optimizer)
+      for x in (10.25, 10.25, 20.5, 20.5):
+         arm.move_to(x=x, y=300, z=-40)
+      arm.dealy_ms(100)
+      arm.dealy_ms(100)
+      arm.flush()
+      sent[optimizer is None] = simulator.stats["bytes_in"]
+      position = arm.get_current_position()[:3]
+      arm.close()
+      assert position == ((20. if optimizer is None else 20.5), 300., -40.)
+   assert sent[False] < sent[True]
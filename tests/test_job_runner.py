@@ -0,0 +1,118 @@
+'''
+    File name: test_job_runner.py
+    Job_runner against a simulated arm: progress, pause, resume and cancel.
+'''
+import os
+import time
+
+import numpy as np
+import pytest
+
+from src.dexarm_sim import Dexarm_simulator
+from src.drawing_compiler import Drawing_compiler
+from src.job_runner import Job_runner, FINISHED
+from src.josn_interface import Drawing, Drawing_processor
+from src.pydexarm import Dexarm
+
+
+def program(n_strokes=10, n_points=10):
+   polyLines = [np.column_stack([np.linspace(-50, 50, n_points), np.full(n_points, 250. + i),
+                                 np.zeros(n_points), np.full(n_points, 0.5)]) for i in range(n_strokes)]
+   return Drawing_compiler(cache_dir=None).compile(Drawing_processor(), Drawing.from_polylines(polyLines))
+
+
+def wait_for(runner, job_id, states, timeout=10):
+   deadline = time.perf_counter() + timeout
+   while runner.status(job_id)["state"] not in states:
+      assert time.perf_counter() < deadline, runner.status(job_id)
+      time.sleep(0.005)
+   return runner.status(job_id)
+
+
+@pytest.fixture
+def realtime_arm():
+   # the dwells of the program take real time, so a job runs long enough to pause it
+   if not hasattr(os, "openpty"):
+      pytest.skip("Dexarm_simulator needs a pseudo-terminal")
+   with Dexarm_simulator(queue_depth=4, time_scale=0.01) as sim:
+      arm = Dexarm(sim.port, verbose=False)
+      yield sim, arm
+      arm.close()
+
+
+def test_a_job_reports_its_progress_until_done(arm):
+   runner = Job_runner()
+   job_id = runner.submit(arm, program(), name="lines")
+   assert runner.busy()
+   status = wait_for(runner, job_id, FINISHED)
+   assert status["state"] == "done"
+   assert status["progress"] == 1.
+   assert status["strokes_done"] == status["strokes_total"] == 10
+   assert status["commands_done"] == status["commands_total"]
+   assert status["name"] == "lines"
+   assert not runner.busy()
+
+
+def test_jobs_run_one_after_the_other(simulator, arm):
+   runner = Job_runner()
+   first, second = runner.submit(arm, program()), runner.submit(arm, program(3))
+   assert runner.status(second)["state"] == "queued"
+   wait_for(runner, second, FINISHED)
+   assert runner.status(first)["state"] == runner.status(second)["state"] == "done"
+
+
+def test_pause_stops_sending_and_resume_finishes(realtime_arm):
+   sim, arm = realtime_arm
+   runner = Job_runner()
+   job_id = runner.submit(arm, program())
+   wait_for(runner, job_id, ("running",))
+   time.sleep(0.1)
+   runner.pause(job_id)
+   wait_for(runner, job_id, ("paused",))
+   done = runner.status(job_id)["commands_done"]
+   time.sleep(0.3)
+   assert runner.status(job_id)["commands_done"] == done
+   assert runner.status(job_id)["eta"] is not None
+
+   runner.resume(job_id)
+   assert wait_for(runner, job_id, FINISHED)["state"] == "done"
+
+
+def test_cancel_stops_the_job_and_runs_on_cancel(realtime_arm):
+   sim, arm = realtime_arm
+   runner = Job_runner()
+   cancelled = []
+   job_id = runner.submit(arm, program(), on_cancel=lambda arm: (cancelled.append(True), arm.go_home()))
+   wait_for(runner, job_id, ("running",))
+   time.sleep(0.1)
+   runner.cancel(job_id)
+   status = wait_for(runner, job_id, FINISHED)
+   assert status["state"] == "cancelled"
+   assert status["commands_done"] < status["commands_total"]
+   assert cancelled == [True]
+   assert sim.homed
+
+
+def test_cancel_while_compiling_sends_nothing(simulator, arm):
+   runner = Job_runner()
+   cancelled = []
+
+   def compile_slowly():
+      time.sleep(0.3)
+      return program()
+
+   job_id = runner.submit(arm, compile_slowly, on_cancel=cancelled.append)
+   wait_for(runner, job_id, ("compiling",))
+   lines = simulator.stats["lines"]
+   runner.cancel(job_id)
+   assert wait_for(runner, job_id, FINISHED)["state"] == "cancelled"
+   assert simulator.stats["lines"] == lines
+   assert cancelled == []
+
+
+def test_a_failing_compile_fails_the_job(arm):
+   runner = Job_runner()
+   job_id = runner.submit(arm, lambda: 1/0)
+   status = wait_for(runner, job_id, FINISHED)
+   assert status["state"] == "failed"
+   assert status["error"].startswith("ZeroDivisionError")
@@ -0,0 +1,61 @@
+'''
+    File name: test_json_strokes.py
+    iter_json_strokes: the strokes of a JSON drawing read lazily, chunk by chunk, as json.load reads them.
+'''
+import json
+
+import numpy as np
+import pytest
+
+from src.drawing_compiler import Program_recorder
+from src.drawing_format import iter_json_strokes
+from src.josn_interface import Drawing_processor
+
+
+def write(path, drawing, **dump_options):
+   with open(path, "w") as outfile:
+      json.dump(drawing, outfile, **dump_options)
+   return str(path)
+
+
+def strokes(n_strokes=30):
+   rng = np.random.default_rng(0)
+   return [[{"x": float(x), "y": float(y), "a": 0, "p": 0.5} for x, y in rng.uniform(0, 300, (int(n), 2))]
+           for n in rng.integers(1, 40, n_strokes)]
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_strokes_match_json_load(tmp_path, chunk_size, indent):
+   drawing = {"meta": {"strokes_note": "a key before the drawing"}, "drawing": {"strokes": strokes()}}
+   path = write(tmp_path/"drawing.json", drawing, indent=indent)
+   read = list(iter_json_strokes(path, chunk_size))
+   assert len(read) == 30
+   for stroke, expected in zip(read, drawing["drawing"]["strokes"]):
+      np.testing.assert_array_equal(stroke, [[p["x"], p["y"], p["a"], p["p"]] for p in expected])
+
+
+def test_empty_strokes_are_skipped(tmp_path):
+   drawing = {"drawing": {"strokes": [[], strokes(1)[0], [], []]}}
+   path = write(tmp_path/"drawing.json", drawing)
+   assert [len(stroke) for stroke in iter_json_strokes(path, 5)] == [len(drawing["drawing"]["strokes"][1])]
+
+
+@pytest.mark.parametrize("text", ['{"drawing": {}}', '{"drawing": {"strokes": [[{"x": 1, "y": 2, "a": 0, "p": 0}'])
+def test_broken_files_raise(tmp_path, text):
+   path = tmp_path/"broken.json"
+   path.write_text(text)
+   with pytest.raises(ValueError):
+      list(iter_json_strokes(str(path), 8))
+
+
+def test_streamed_and_loaded_drawings_compile_the_same(tmp_path):
+   drawing = {"drawing": {"strokes": [[]] + strokes(5) + [[]]}}
+   path = write(tmp_path/"drawing.json", drawing)
+   dp = Drawing_processor()
+   programs = []
+   for polyLines in (dp.extract_ploylines(json_path=path), dp.iter_ploylines(path)):
+      recorder = Program_recorder()
+      dp._draw_polylines(recorder, polyLines)
+      programs.append(recorder.lines)
+   assert programs[0] == programs[1]
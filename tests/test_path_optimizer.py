@@ -0,0 +1,43 @@
+'''
+    File name: test_path_optimizer.py
+    Run from the repository root:
+        python -m pytest -q tests
+'''
+import numpy as np
+
+from src.canvas_log import parse_path
+from src.josn_interface import Drawing
+from src.path_optimizer import merge_strokes, order_strokes, travel_length
+
+
+def stroke(*xy):
+   return np.array([[x, y, 0., 0.5] for x, y in xy])
+
+
+def strokes_with_empty():
+   # an empty SVG path on the canvas gives a stroke without targets
+   empty = np.column_stack([parse_path(""), np.zeros((0, 2))])
+   return [empty, stroke((0, 0), (10, 0)), empty, stroke((10, 0), (10, 10)), stroke((50, 50), (60, 50)), empty]
+
+
+def test_merge_strokes_skips_empty_strokes():
+   merged, report = merge_strokes(strokes_with_empty(), tolerance=1.)
+   assert report["strokes_before"] == 3
+   assert report["strokes_after"] == 2
+   assert all(len(pl) > 0 for pl in merged)
+
+
+def test_order_strokes_skips_empty_strokes():
+   ordered, report = order_strokes(strokes_with_empty(), start=(0, 0))
+   assert report["strokes"] == 3
+   assert all(len(pl) > 0 for pl in ordered)
+   assert report["travel_after"] <= report["travel_before"]
+
+
+def test_travel_length_matches_drawing_without_empty_strokes():
+   strokes = strokes_with_empty()
+   drawing = Drawing.from_polylines(strokes)
+   assert len(drawing) == 3
+   np.testing.assert_allclose(drawing.starts()[:, :2], [[0, 0], [10, 0], [50, 50]])
+   np.testing.assert_allclose(drawing.ends()[:, :2], [[10, 0], [10, 10], [60, 50]])
+   assert travel_length(strokes, start=(0, 0)) == travel_length(drawing, start=(0, 0))
@@ -0,0 +1,49 @@
+'''
+    File name: test_reader_thread.py
+    The reader thread of Dexarm: every command gets a ticket, resolved first in, first out,
+    with the parsed reply of its own command.
+'''
+import serial
+import pytest
+
+from src.pydexarm import Dexarm
+
+
+def test_tickets_resolve_in_order_with_their_replies(arm):
+   with arm.streaming(8):
+      tickets = []
+      for x in (10, 20, 30):
+         tickets.append(arm.submit("G1F2000X{}Y300Z0\r".format(x)))
+         tickets.append(arm.submit("M114\r"))
+      tickets.append(arm.submit("M888\r"))
+
+   assert [ticket.result(timeout=5)[0] for ticket in tickets[1:6:2]] == [10., 20., 30.]
+   assert tickets[6].result(timeout=5) == "PEN"
+   # a move answers with the lines sent before its "ok", none here
+   assert tickets[0].result(timeout=5) == []
+
+
+def test_submit_does_not_wait_for_the_reply(arm):
+   with arm.streaming(4):
+      ticket = arm.submit("G4 P200\r")
+      assert not ticket.done()
+   assert ticket.done()
+
+
+def test_closing_the_port_fails_the_waiting_tickets(simulator):
+   arm = Dexarm(simulator.port, verbose=False)
+   # the dwell is answered when it leaves the planner, long after the port is closed
+   simulator.time_scale = 1.
+   with arm.streaming(8):
+      arm.submit("G4 S5\r")
+      arm.submit("G4 S5\r")
+      ticket = arm.submit("M114\r")
+      arm.ser.cancel_read()
+      arm._reader_stop.set()
+      arm._reader.join(timeout=5)
+      arm.stream_window = 1
+      with pytest.raises(serial.SerialException):
+         ticket.result(timeout=5)
+      with pytest.raises(serial.SerialException):
+         arm.submit("M114\r")
+   arm.ser.close()
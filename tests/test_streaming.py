@@ -0,0 +1,52 @@
+'''
+    File name: test_streaming.py
+    Dexarm.streaming(): up to window commands in flight, never more, and nothing lost.
+'''
+import os
+
+import pytest
+
+from src.dexarm_sim import Dexarm_simulator
+from src.pydexarm import Dexarm
+
+
+@pytest.fixture
+def slow_arm():
+   # parsing a line takes a while, so the window actually fills up
+   if not hasattr(os, "openpty"):
+      pytest.skip("Dexarm_simulator needs a pseudo-terminal")
+   with Dexarm_simulator(queue_depth=4, line_latency=0.002, time_scale=0) as sim:
+      arm = Dexarm(sim.port, verbose=False)
+      yield sim, arm
+      arm.close()
+
+
+def test_without_streaming_every_move_waits_for_its_ok(arm):
+   for i in range(10):
+      arm.move_to(x=i, y=300, z=0)
+      assert len(arm._tickets) == 0
+
+
+@pytest.mark.parametrize("window", [2, 4, 8])
+def test_streaming_keeps_at_most_window_commands_in_flight(slow_arm, window):
+   sim, arm = slow_arm
+   in_flight = []
+   with arm.streaming(window):
+      assert arm.stream_window == window
+      for i in range(60):
+         arm.move_to(x=i, y=300, z=0)
+         in_flight.append(len(arm._tickets))
+   assert max(in_flight) == window
+   # leaving the block waits for the last "ok"
+   assert len(arm._tickets) == 0
+   assert arm.stream_window == 1
+   assert sim.stats["moves"] == 60
+   assert sim.position[0] == 59
+
+
+def test_streaming_sends_the_commands_in_order(simulator, arm):
+   with arm.streaming(4):
+      for x in (10, 20, 30):
+         arm.move_to(x=x, y=300, z=0)
+   assert arm.get_current_position()[:3] == (30., 300., 0.)
+   assert simulator.stats["moves"] == 3